@@ -0,0 +1,50 @@
+""" - micro-benchmark: SoftwareAligner, time and temporaries allocated per frame
+
+    python benchmarks/align_bench.py --frames 100 --distortion
+"""
+import sys
+import os.path as osp
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from utils.align import SoftwareAligner
+
+
+parser = argparse.ArgumentParser(description='Software alignment micro-benchmark.')
+parser.add_argument('--frames', type=int, default=100)
+parser.add_argument('--depth', type=str, default='848x480', help='depth resolution')
+parser.add_argument('--color', type=str, default='1280x720', help='color resolution')
+parser.add_argument('--distortion', action='store_true', help='modified Brown-Conrady color intrinsics')
+args = parser.parse_args()
+
+
+def intrinsics(size, hfov, coeffs=None):
+    width, height = map(int, size.split('x'))
+    f = width / 2 / np.tan(np.radians(hfov) / 2)
+    return {'width': width, 'height': height, 'fx': f, 'fy': f, 'ppx': width / 2 - 0.3, 'ppy': height / 2 + 0.4,
+            'model': 'modified_brown_conrady' if coeffs else 'brown_conrady', 'coeffs': coeffs or [0.0] * 5}
+
+
+# D435-like: wider depth field of view, color 15 mm to the side
+aligner = SoftwareAligner(intrinsics(args.depth, 87), intrinsics(args.color, 69, [0.1, -0.2, 0.001, 0.001, 0.05] if args.distortion else None),
+                          {'rotation': [1, 0, 0, 0, 1, 0, 0, 0, 1], 'translation': [0.015, 0.0, 0.0]}, 0.001)
+rng = np.random.default_rng(0)
+width, height = map(int, args.depth.split('x'))
+depth = [rng.integers(300, 4000, (height, width), dtype=np.uint16) for _ in range(4)]
+
+aligner(depth[0]) # warm-up
+tracemalloc.start()
+start = time.perf_counter()
+for i in range(args.frames):
+    aligner(depth[i % len(depth)])
+elapsed = time.perf_counter() - start
+_, peak = tracemalloc.get_traced_memory() # temporaries allocated per frame
+tracemalloc.stop()
+
+print(f"SoftwareAligner {args.depth} -> {args.color}{' (distortion)' if args.distortion else ''}: "
+      f"{elapsed / args.frames * 1e3:7.3f} ms/frame   {args.frames / elapsed:6.1f} frames/s   "
+      f"peak alloc {peak / 2**10:7.1f} KiB   planes {aligner._planes.nbytes / 2**20:.1f} MiB")
@@ -0,0 +1,241 @@
+""" - end-to-end capture benchmark with a per-stage latency breakdown
+
+Drives the capture stages (wait_for_frames, align, conversion, clipping, colormap, blend,
+IR->BGR, composition, imshow, VideoWriter.write) from synthetic or recorded sources for
+several camera counts and writes a JSON report that can be diffed across versions.
+
+    python benchmarks/capture_bench.py --cams 1 2 4 8 --frames 300 --out bench.json
+    python benchmarks/capture_bench.py --source bag:cam1.bag --cams 1 --write
+    python benchmarks/capture_bench.py --impl legacy        # the former np.where / applyColorMap / np.hstack code
+
+FPS is for one thread processing all cameras one after another (the stage cost), not
+for the threaded capture. Allocations are measured in a second, shorter pass with
+tracemalloc (peak bytes of the temporaries of each stage per frame).
+"""
+import sys
+import os
+import os.path as osp
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from utils import openSource, depth_options, DepthClipper, DepthColorizer, Mosaic
+
+
+parser = argparse.ArgumentParser(description='Capture pipeline benchmark.')
+parser.add_argument('--cams', type=int, nargs='+', default=[1, 2, 4, 8],
+                    help='camera counts to benchmark')
+parser.add_argument('--frames', type=int, default=300, help='frames per camera count')
+parser.add_argument('--alloc_frames', type=int, default=20, help='frames of the allocation pass (0: skip)')
+parser.add_argument('--source', type=str, default='synthetic',
+                    help='source spec for every camera (see utils/sources.py)')
+parser.add_argument('--impl', type=str, default='current', choices=['current', 'legacy'])
+parser.add_argument('--clip', type=float, default=1.5, help='clipping distance (m)')
+parser.add_argument('--alpha', type=float, default=0.03)
+parser.add_argument('--show', action='store_true', help='include cv2.imshow + waitKey(1)')
+parser.add_argument('--write', action='store_true', help='include synchronous VideoWriter.write (MP4V)')
+parser.add_argument('--out', type=str, default=None, help='JSON report (default: stdout)')
+args = parser.parse_args()
+
+
+class Stages:
+    """Per-stage timer; `with stages('name'):`"""
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.alloc = defaultdict(list)
+        self.trace_alloc = False
+        self._name = None
+
+    def __call__(self, name):
+        self._name = name
+        return self
+
+    def __enter__(self):
+        if self.trace_alloc:
+            tracemalloc.reset_peak()
+            self._mem0 = tracemalloc.get_traced_memory()[0]
+        self._t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._t0
+        if self.trace_alloc:
+            self.alloc[self._name].append(tracemalloc.get_traced_memory()[1] - self._mem0)
+        else:
+            self.samples[self._name].append(elapsed)
+
+
+def open_cameras(n):
+    cams = []
+    for i in range(n):
+        source = openSource(args.source, serial=f"{args.source}#{i}")
+        profile = source.start()
+        clipping_distance, align = depth_options(profile, clipping_dist=args.clip)
+        cams.append({'source': source,
+                     'align': None if source.aligned else align,
+                     'clipping_distance': clipping_distance,
+                     'clipper': DepthClipper(clipping_distance),
+                     'colorizer': DepthColorizer(args.alpha, cv2.COLORMAP_BONE)})
+    return cams
+
+
+def process_current(cams, stages, state):
+    for row, cam in enumerate(cams):
+        with stages('wait_for_frames'):
+            frames = cam['source'].wait_for_frames()
+        if cam['align'] is not None:
+            with stages('align'):
+                frames = cam['align'].process(frames)
+        with stages('convert'):
+            color = np.asanyarray(frames.get_color_frame().get_data())
+            depth = np.asanyarray(frames.get_depth_frame().get_data())
+            ir = np.asanyarray(frames.get_infrared_frame(1).get_data())
+        with stages('clip'):
+            depth = cam['clipper'](depth, out=depth if depth.flags.writeable else None)
+
+        if state.get('mosaic') is None:
+            state['mosaic'] = Mosaic(len(cams), 4, color.shape)
+        color_tile, colormap_tile, blended_tile, ir_tile = state['mosaic'].row(row)
+
+        with stages('colormap'):
+            colormap = cam['colorizer'](depth, out=colormap_tile)
+        with stages('blend'):
+            cv2.addWeighted(color, 0.5, colormap, 1, 0, dst=blended_tile)
+        with stages('ir_bgr'):
+            ir_bgr = cv2.cvtColor(ir, cv2.COLOR_GRAY2BGR, dst=ir_tile)
+        with stages('compose'):
+            np.copyto(color_tile, color)
+        cam['last'] = (color, colormap, ir_bgr)
+    return state['mosaic'].image
+
+
+def process_legacy(cams, stages, state):
+    rows = []
+    for cam in cams:
+        with stages('wait_for_frames'):
+            frames = cam['source'].wait_for_frames()
+        if cam['align'] is not None:
+            with stages('align'):
+                frames = cam['align'].process(frames)
+        with stages('convert'):
+            color = np.asanyarray(frames.get_color_frame().get_data())
+            depth = np.asanyarray(frames.get_depth_frame().get_data())
+            ir = np.asanyarray(frames.get_infrared_frame(1).get_data())
+        with stages('clip'):
+            depth = np.where((depth > cam['clipping_distance']) | (depth <= 0), 153, depth)
+        with stages('colormap'):
+            colormap = cv2.applyColorMap(cv2.convertScaleAbs(depth, alpha=args.alpha), cv2.COLORMAP_BONE)
+        with stages('blend'):
+            blended = cv2.addWeighted(color, 0.5, colormap, 1, 0)
+        with stages('ir_bgr'):
+            ir_bgr = cv2.cvtColor(ir, cv2.COLOR_GRAY2BGR)
+        with stages('compose'):
+            rows.append(np.hstack((color, colormap, blended, ir_bgr)))
+        cam['last'] = (color, colormap, ir_bgr)
+    with stages('compose'):
+        return np.vstack(rows)
+
+
+def run_frame(cams, stages, state, writers):
+    process = process_current if args.impl == 'current' else process_legacy
+    images = process(cams, stages, state)
+
+    if args.show:
+        with stages('imshow'):
+            cv2.imshow('benchmark', images)
+            cv2.waitKey(1)
+    if writers:
+        with stages('video_write'):
+            for cam, cam_writers in zip(cams, writers):
+                for writer, img in zip(cam_writers, cam['last']):
+                    writer.write(img)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1e3)
+
+
+def bench(n, tmpdir):
+    cams = open_cameras(n)
+    stages, state = Stages(), {}
+
+    writers = []
+    run_frame(cams, Stages(), state, []) # warm-up; buffers are allocated here
+    if args.write:
+        fourcc = cv2.VideoWriter_fourcc(*'MP4V')
+        for i, cam in enumerate(cams):
+            writers.append([cv2.VideoWriter(osp.join(tmpdir, f"n{n}_c{i}_{k}.mp4"), fourcc, 30.0,
+                                            (img.shape[1], img.shape[0]), 1) for k, img in enumerate(cam['last'])])
+
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        frame_t0 = time.perf_counter()
+        run_frame(cams, stages, state, writers)
+        stages.samples['frame'].append(time.perf_counter() - frame_t0)
+    elapsed = time.perf_counter() - start
+
+    alloc = {}
+    if args.alloc_frames > 0:
+        stages.trace_alloc = True
+        tracemalloc.start()
+        for _ in range(args.alloc_frames):
+            run_frame(cams, stages, state, writers)
+        tracemalloc.stop()
+        # the stages of all cameras of a frame add up
+        alloc = {name: int(np.sum(values) / args.alloc_frames) for name, values in stages.alloc.items()}
+
+    for cam_writers in writers:
+        for writer in cam_writers:
+            writer.release()
+    for cam in cams:
+        cam['source'].stop()
+
+    per_stage = {}
+    for name, samples in stages.samples.items():
+        per_stage[name] = {'p50_ms': percentile_ms(samples, 50), 'p99_ms': percentile_ms(samples, 99),
+                           'mean_ms': float(np.mean(samples) * 1e3), 'calls': len(samples)}
+
+    return {'fps': args.frames / elapsed,
+            'camera_fps': args.frames * n / elapsed,
+            'frames': args.frames,
+            'stages': per_stage,
+            'alloc_bytes_per_frame': alloc}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=osp.dirname(osp.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    report = {'meta': {'revision': git_revision(), 'impl': args.impl, 'source': args.source,
+                       'frames': args.frames, 'show': args.show, 'write': args.write,
+                       'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+                       'machine': platform.machine(), 'cpus': os.cpu_count()},
+              'results': {}}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in args.cams:
+            result = bench(n, tmpdir)
+            report['results'][str(n)] = result
+
+            stages = '  '.join(f"{name} {s['p50_ms']:.2f}/{s['p99_ms']:.2f}" for name, s in result['stages'].items() if name != 'frame')
+            print(f"[{args.impl}] {n} cam(s): {result['fps']:7.1f} FPS   p50/p99 ms: {stages}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
@@ -0,0 +1,55 @@
+""" - micro-benchmark: depth clipping in getFrames, np.where vs. DepthClipper (preallocated, in place)
+
+    python benchmarks/clip_bench.py --cams 8 --frames 300
+"""
+import sys
+import os.path as osp
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from utils.processing import DepthClipper
+
+
+parser = argparse.ArgumentParser(description='Depth clipping micro-benchmark.')
+parser.add_argument('--cams', type=int, default=8)
+parser.add_argument('--frames', type=int, default=300, help='frames per camera')
+parser.add_argument('--width', type=int, default=640)
+parser.add_argument('--height', type=int, default=480)
+parser.add_argument('--clip', type=float, default=1500, help='clipping distance (z16 value)')
+args = parser.parse_args()
+
+
+def clip_where(depth_img, clipping_distance, grey_color=153):
+    # the former getFrames() implementation
+    return np.where((depth_img> clipping_distance) | (depth_img <= 0), grey_color, depth_img)
+
+
+rng = np.random.default_rng(0)
+depth = [rng.integers(0, 4000, (args.height, args.width), dtype=np.uint16) for _ in range(args.cams)]
+clippers = [DepthClipper(args.clip) for _ in range(args.cams)] # same result as clip_where: tests/test_processing.py
+
+
+def run(name, fn):
+    for i in range(args.cams): # warm-up; buffers are allocated here
+        fn(i)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        for i in range(args.cams):
+            fn(i)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory() # temporaries allocated per frame
+    tracemalloc.stop()
+
+    n = args.frames * args.cams
+    print(f"{name:<24} {elapsed / n * 1e3:7.3f} ms/frame   {n / elapsed:8.1f} frames/s   peak alloc {peak / 2**20:6.2f} MiB")
+
+
+work = [d.copy() for d in depth]
+run('np.where', lambda i: clip_where(depth[i], args.clip))
+run('DepthClipper (buffer)', lambda i: clippers[i](depth[i]))
+run('DepthClipper (in place)', lambda i: clippers[i](work[i], out=work[i]))
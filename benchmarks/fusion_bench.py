@@ -0,0 +1,66 @@
+""" - micro-benchmark: fusing the clouds of N cameras into the rig frame + voxel downsampling
+
+    python benchmarks/fusion_bench.py --cams 4 --frames 100 --stride 1 2 --voxel 0.01
+"""
+import sys
+import os.path as osp
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from utils.fusion import RigFusion, voxelDownsample, voxelKeys
+
+
+parser = argparse.ArgumentParser(description='Multi-camera point-cloud fusion micro-benchmark.')
+parser.add_argument('--cams', type=int, default=4)
+parser.add_argument('--frames', type=int, default=100, help='fused frames per setting')
+parser.add_argument('--width', type=int, default=640)
+parser.add_argument('--height', type=int, default=480)
+parser.add_argument('--stride', type=int, nargs='+', default=[1, 2], help='pixel strides to compare')
+parser.add_argument('--voxel', type=float, default=0.01, help='voxel size (m)')
+args = parser.parse_args()
+
+
+intrinsics = {'width': args.width, 'height': args.height, 'fx': 0.95 * args.width, 'fy': 0.95 * args.width,
+              'ppx': args.width / 2, 'ppy': args.height / 2, 'model': 'none', 'coeffs': [0] * 5}
+
+# cameras on a circle of 1.5 m around the origin, looking at it
+rig = {}
+for i in range(args.cams):
+    a = 2 * np.pi * i / args.cams
+    pose = np.eye(4)
+    pose[:3, :3] = [[np.cos(a), 0, -np.sin(a)], [0, 1, 0], [np.sin(a), 0, np.cos(a)]]
+    pose[:3, 3] = [1.5 * np.sin(a), 0, -1.5 * np.cos(a)]
+    rig[f'cam{i}'] = pose
+
+rng = np.random.default_rng(0)
+v, u = np.mgrid[0:args.height, 0:args.width]
+frames = {}
+for serial in rig:
+    depth = (1500 + 300 * np.sin(u / 40.0) * np.cos(v / 30.0) + rng.normal(0, 5, u.shape)).astype(np.uint16)
+    depth[rng.random(u.shape) < 0.1] = 0 # holes
+    frames[serial] = (depth, rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8))
+
+# same voxels as a sort-based reference
+fusion = RigFusion(rig, voxel_size=None)
+for serial in rig:
+    fusion.add_camera(serial, intrinsics, 0.001)
+points, colors = fusion(frames)
+fused, _ = voxelDownsample(points, colors, args.voxel)
+assert len(fused) == len(np.unique(voxelKeys(points, args.voxel)))
+
+print(f"{args.cams} cameras {args.width}x{args.height}, voxel {args.voxel * 100:g} cm")
+for stride in args.stride:
+    fusion = RigFusion(rig, voxel_size=args.voxel, stride=stride)
+    for serial in rig:
+        fusion.add_camera(serial, intrinsics, 0.001)
+    fusion(frames) # warm-up
+
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        points, colors = fusion(frames)
+    elapsed = time.perf_counter() - start
+    print(f"stride {stride}: {elapsed / args.frames * 1e3:7.2f} ms/fused frame   {args.frames / elapsed:6.1f} FPS   "
+          f"{len(points):8d} points")
@@ -0,0 +1,59 @@
+""" - micro-benchmark: viewer normals, np.gradient + np.cross vs. NormalEstimator (preallocated, in place)
+
+    python benchmarks/normals_bench.py --frames 100 --step 1 2 4
+"""
+import sys
+import os.path as osp
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from utils.normals import NormalEstimator
+
+
+parser = argparse.ArgumentParser(description='Normal estimation micro-benchmark.')
+parser.add_argument('--frames', type=int, default=100)
+parser.add_argument('--width', type=int, default=640)
+parser.add_argument('--height', type=int, default=480)
+parser.add_argument('--step', type=int, nargs='+', default=[1, 2, 4], help='NormalEstimator steps to compare')
+args = parser.parse_args()
+
+
+def normals_gradient(verts):
+    # the former pyglet_pointcloud_viewer.py implementation
+    dy, dx = np.gradient(verts, axis=(0, 1))
+    return np.cross(dx, dy)
+
+
+# a wavy surface 1 m in front of the camera, as rs.pointcloud vertices
+v, u = np.mgrid[0:args.height, 0:args.width].astype(np.float32)
+z = 1.0 + 0.05 * np.sin(u / 25) * np.cos(v / 20)
+verts = np.stack([(u - args.width / 2) / 600 * z, (v - args.height / 2) / 600 * z, z], axis=-1).astype(np.float32)
+
+# same directions
+unit = lambda n: n / np.linalg.norm(n, axis=-1, keepdims=True)
+assert np.allclose(unit(normals_gradient(verts)), unit(NormalEstimator()(verts)), atol=1e-4)
+
+
+def run(name, fn):
+    fn(0) # warm-up; buffers are allocated here
+    tracemalloc.start()
+    start = time.perf_counter()
+    for k in range(args.frames):
+        fn(k)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory() # temporaries allocated per frame
+    tracemalloc.stop()
+    print(f"{name:<28} {elapsed / args.frames * 1e3:7.3f} ms/frame   peak alloc {peak / 2**20:6.2f} MiB")
+
+
+print(f"{args.width}x{args.height}")
+run('np.gradient + np.cross', lambda k: normals_gradient(verts))
+for step in args.step:
+    estimator = NormalEstimator(step)
+    run(f'NormalEstimator step {step}', lambda k: estimator(verts, frame_id=k))
+estimator = NormalEstimator()
+run('NormalEstimator (paused)', lambda k: estimator(verts, frame_id=0))
@@ -2,7 +2,7 @@ import numpy as np
 import cv2 
 import pyrealsense2 as rs
 
-from utils import getDeviceSerial, getCamera
+from utils import getDeviceSerial, getCamera, DEFAULT_STREAMS, DepthColorizer, Deprojector, CloudSink, WriterPool
 
 
 # === Camera process === # 
@@ -11,7 +11,7 @@ print("******  Camera Loading...  ******", end="\n ")
 
 serial_list = getDeviceSerial()
 
-pipeline_1, config_1 = getCamera(serial_list[0])
+pipeline_1, config_1 = getCamera(serial_list[0], {name: DEFAULT_STREAMS[name] for name in ('depth', 'color')}) # no IR needed here
 
 # Start streaming from both cameras
 # ---------------------------------
@@ -38,12 +38,17 @@ align = rs.align(align_to)
 
 # == PointCloud == # 
 # -----------------
-pc = rs.pointcloud() 
-points = rs.points()
+# depth is aligned to color, so it is deprojected with the color intrinsics
+color_intrinsics = profile_1.get_stream(rs.stream.color).as_video_stream_profile().get_intrinsics()
+deproject = Deprojector(color_intrinsics, depth_scale)
 
-threshold_filter = rs.threshold_filter()
-threshold_filter.set_option(rs.option.max_distance, 1.5)
-threshold_filter.set_option(rs.option.min_distance, 0.5)
+cloud_writer = WriterPool(maxsize=4, policy='drop_newest') # .ply files are written in the background
+cloud_writer.open('cloud', CloudSink('.', fmt='ply', prefix='cloud_'))
+
+# == Colormap (lookup table; one per image since each owns its output buffer) == #
+# ----------------------------------------------------------------------------
+depth_colorizer = DepthColorizer(alpha=0.03, colormap=cv2.COLORMAP_BONE)
+bg_removed_colorizer = DepthColorizer(alpha=0.03, colormap=cv2.COLORMAP_BONE)
 
 
 try: 
@@ -80,8 +85,8 @@ try:
         # Render images:
         #   depth align to color on left
         #   depth on right
-        depth_colormap = cv2.applyColorMap(cv2.convertScaleAbs(depth_image, alpha=0.03), cv2.COLORMAP_BONE)
-        bg_removed_colormap = cv2.applyColorMap(cv2.convertScaleAbs(bg_removed, alpha=0.03), cv2.COLORMAP_BONE)
+        depth_colormap = depth_colorizer(depth_image)
+        bg_removed_colormap = bg_removed_colorizer(bg_removed)
 
 
         # Image blending 
@@ -107,18 +112,15 @@ try:
             break
         
         elif key == ord('s'): # press 's' key 
-            # PointCloud 
-#            aligned_depth_frame= threshold_filter.process(aligned_depth_frame)
-            points = pc.calculate(aligned_depth_frame)
-            pc.map_to(color_frame)
+            # PointCloud (XYZRGB of the valid depth pixels; min_depth/max_depth work like rs.threshold_filter)
+            points, colors = deproject(depth_image, color_image)
 
-            
-            print("Saving to 1.ply...")
-            points.export_to_ply("1.ply", color_frame)
-            print("Done")
+            print("Saving to cloud_*.ply...")
+            cloud_writer.write('cloud', (points, colors))
 
 
 
 finally:
     # Stop streaming
-    pipeline_1.stop()    
+    pipeline_1.stop()
+    cloud_writer.close() # waits for pending .ply files    
@@ -0,0 +1,591 @@
+""" - N realsense cameras; one pipeline per serial from getDeviceSerial()
+    - realsense ; (ref) https://github.com/IntelRealSense/librealsense/issues/1735
+"""
+import logging
+from pathlib import Path
+import os.path as osp
+import argparse
+import time
+import functools
+
+import numpy as np
+import cv2
+from omegaconf import OmegaConf
+import pyrealsense2 as rs
+
+from utils import depth_options, emitter_options, timestamp_options, getDepthScale, \
+                  DepthClipper, DepthColorizer, Mosaic, RawDepthWriter, TakeWriter, takePath, \
+                  CaptureGroup, SyncedCapture, WriterPool, ControlServer, PreviewThread, openSource, \
+                  Metrics, MetricsReporter, MetricsServer, SoftwareAligner, getCalibration, FilterChain, \
+                  ProcessCaptureGroup, DisplayProcessor, FramePublisher, colorToBGR, DeviceManager, streamConfig, DEFAULT_STREAMS, \
+                  PreTriggerRing
+
+
+# === Argparse === #
+
+parser = argparse.ArgumentParser(description='Set depth distance option.')
+parser.add_argument('--clip', type=float, default=1.5,
+                    help='distance clipping value (meter)')
+parser.add_argument('--alpha', type=float, default=0.03,
+                    help='OpenCV ColorMap alpha')
+parser.add_argument('--num_cams', type=int, default=0,
+                    help='use only the first N connected cameras (0: all)')
+parser.add_argument('--cmap', type=int, default=2,
+                    help='index into the color_maps list')
+parser.add_argument('--window', type=str, default='RealSense',
+                    help='title of the OpenCV window')
+parser.add_argument('--right_ir', action='store_true',
+                    help='also start the right IR stream of live cameras and show it in a fifth column (display only)')
+parser.add_argument('--rec_policy', type=str, default='drop_oldest', choices=['block', 'drop_oldest', 'drop_newest'],
+                    help='what to do when a video writer falls behind')
+parser.add_argument('--rec_queue', type=int, default=32,
+                    help='max. queued frames per recorded stream')
+parser.add_argument('--raw_depth', action='store_true',
+                    help='record the metric z16 depth losslessly (16-bit PNG sequence) instead of the colormap video')
+parser.add_argument('--take', action='store_true',
+                    help='record into a memory-mapped take (utils/take.py) instead of per-stream video files')
+parser.add_argument('--take_seconds', type=float, default=120,
+                    help='preallocated length of a take (sec)')
+parser.add_argument('--pretrigger', type=float, default=0,
+                    help='keep the last N sec of raw frames per camera and record them ahead of the frames after \'v\' (0: off)')
+parser.add_argument('--pretrigger_mb', type=float, default=1024,
+                    help='memory cap of the pre-trigger history of all cameras together (MB)')
+parser.add_argument('--headless', action='store_true',
+                    help='no OpenCV window; control through stdin / --control_socket')
+parser.add_argument('--control_socket', type=str, default=None,
+                    help='UNIX socket for commands (record, stop, snap, cmap, quit)')
+parser.add_argument('--preview_fps', type=float, default=0,
+                    help='headless: show a preview window at this rate in its own thread (0: none)')
+parser.add_argument('--source', type=str, action='append', default=None,
+                    help='frame source per camera instead of the connected devices (repeatable): '
+                         'live:<serial>, bag:<file.bag>, take:<dir>[:<cam_id>], synthetic[:WxH[@fps]]')
+parser.add_argument('--real_time', action='store_true',
+                    help='replay bag/take/synthetic sources at their recorded rate (default: as fast as possible)')
+parser.add_argument('--sync_ms', type=float, default=0,
+                    help='match framesets across cameras by timestamp within this tolerance (ms); 0: newest frameset of each camera')
+parser.add_argument('--align', type=str, default='rs', choices=['rs', 'software', 'none'],
+                    help='depth-to-color alignment: rs.align, per-camera cached tables (utils/align.py), '
+                         'or none (record unaligned depth + calibration; align offline)')
+parser.add_argument('--filter_workers', type=int, default=0,
+                    help='run the FILTERS chain of config.yaml on a pool of N threads per camera, '
+                         'overlapping filtering with the next wait (results N framesets later; 0: in the capture thread)')
+parser.add_argument('--procs', action='store_true',
+                    help='capture and colorize every camera in a process of its own; frames come back through shared memory')
+parser.add_argument('--proc_slots', type=int, default=4,
+                    help='--procs: framesets in each camera\'s shared-memory ring')
+parser.add_argument('--publish', action='store_true',
+                    help='publish every camera\'s frames in named shared memory for other local processes '
+                         '(--source shm:<serial>, utils.FrameSubscriber)')
+parser.add_argument('--refresh_devices', action='store_true',
+                    help='ignore the cached stream profiles / calibration of the cameras (DEVICES in config.yaml) and store them anew')
+parser.add_argument('--metrics_interval', type=float, default=5,
+                    help='log per-stage timings, FPS, drops and queue depths as one JSON line every N sec (0: off)')
+parser.add_argument('--metrics_port', type=int, default=0,
+                    help='serve the metrics on http://127.0.0.1:<port>/metrics (Prometheus) and /metrics.json (0: off)')
+
+args = parser.parse_args()
+if args.procs and args.sync_ms > 0:
+    parser.error("--sync_ms is not supported with --procs")
+metric_depth = args.raw_depth or args.take # record the depth as measured; clip it for display only
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+
+
+# === Camera setting === #
+# With --procs every camera process is spawned and imports this script as __mp_main__: what a
+# camera needs is defined up to here, the rig itself runs under __main__ below.
+cfg = OmegaConf.load('config.yaml')
+
+# concurrent start, per-serial cache of profiles / calibration, exposure warm-up (utils/devices.py)
+device_cfg = cfg.get('DEVICES') or {}
+devices = DeviceManager(cache_dir=device_cfg.get('cache_dir'), warmup=device_cfg.get('warmup'), refresh=args.refresh_devices)
+
+# the clipped depth of a frameset lives in its clipper's buffers until the main loop let it go:
+# capture queue + synchronizer window + the one being clipped + the one held by the loop
+sync_window = 8
+clip_buffers = 2 * sync_window + 2 if args.sync_ms > 0 else 2 + 2
+
+color_maps = [cv2.COLORMAP_JET, cv2.COLORMAP_RAINBOW, cv2.COLORMAP_BONE, cv2.COLORMAP_PINK]
+set_maps = args.cmap
+
+
+def cameraStreams(serial):
+    """Streams of a live camera (STREAMS in config.yaml); --right_ir adds the right IR stream"""
+    streams = streamConfig(cfg.get('STREAMS'), serial)
+    if args.right_ir and 'infrared_2' not in streams:
+        streams['infrared_2'] = dict(streams.get('infrared_1', DEFAULT_STREAMS['infrared_2']))
+    return streams
+
+
+def openCamera(index, source):
+    """Open and configure camera `index` from `source` (--source syntax) -> (pipeline, getFrames
+    options, info, clipper, filters); runs on a thread per camera (DeviceManager.startAll), with
+    --procs in the camera's own process"""
+    label = f"c{index+1}"
+    kind, _, serial = source.partition(':')
+    streams = cameraStreams(serial) if kind == 'live' else None # stream selection / profiles of live cameras
+    cached = devices.cached(serial, streams) if kind == 'live' else None
+
+    with devices.phase(label, 'open'):
+        pipeline = openSource(source, real_time=args.real_time, serial=f"{source}#{index}",
+                              streams={serial: streams} if streams is not None else None,
+                              validate=cached is None) # cached: the streams were validated before
+
+    # Start streaming from the camera
+    with devices.phase(label, 'start'):
+        profile = pipeline.start()
+    try:
+        return configureCamera(label, pipeline, profile, cached)
+    except Exception:
+        pipeline.stop() # release the device; startAll() only stops the cameras that opened completely
+        raise
+
+
+def configureCamera(label, pipeline, profile, cached):
+    """Calibration, options, aligner, clipper and filters of the started `pipeline` -> openCamera()'s tuple"""
+    with devices.phase(label, 'calibration'):
+        if not pipeline.rs_frames: # take / synthetic / shm: stored with the frames
+            calibration, depth_scale = getattr(pipeline, 'calibration', None), getDepthScale(profile)
+        elif pipeline.live and cached is not None and \
+                cached.get('firmware') == profile.get_device().get_info(rs.camera_info.firmware_version):
+            calibration, depth_scale = cached['calibration'], cached['depth_scale']
+            devices.note(label, "cached calibration")
+        else: # a live camera not cached with these streams, or a bag (its own calibration, never cached)
+            calibration = getCalibration(profile) if 'color' in pipeline.streams else None
+            depth_scale = getDepthScale(profile)
+            if pipeline.live:
+                devices.store(pipeline.serial, pipeline.stream_settings, profile=profile, depth_scale=depth_scale, calibration=calibration)
+
+    with devices.phase(label, 'options'):
+        # every camera uses its own depth scale and align object
+        clipping_distance, align = depth_options(profile, clipping_dist=args.clip)
+
+        if pipeline.live:
+            # Set dot-patterens for IR image
+            emitter_options(profile, set_emitter=0) # remove dot-patterns -> set_emitter=0
+                                                    # else -> set_emitter=1
+            if args.sync_ms > 0:
+                timestamp_options(profile, global_time=True)
+
+    if pipeline.aligned or args.align == 'none' or 'color' not in getattr(pipeline, 'streams', ('color',)):
+        # take / synthetic frames are stored aligned; nothing to align to without color
+        align = None
+    elif args.align == 'software' or not pipeline.rs_frames: # an unaligned take has no rs frames
+        align = SoftwareAligner.fromDict(calibration, copy=True) # new array per frame; frames are queued
+    clipper = DepthClipper(clipping_distance, buffers=clip_buffers) # per-camera clipping stage (bitmask compare)
+
+    # depth post-processing chain from config.yaml (FILTERS); needs librealsense frames
+    filters = None
+    if cfg.get('FILTERS'):
+        if pipeline.rs_frames: # live cameras and bags
+            filters = FilterChain.fromConfig(cfg.FILTERS, workers=args.filter_workers, name=pipeline.serial)
+            if filters.resizes and not hasattr(align, 'process'):
+                raise ValueError("A decimation filter changes the depth resolution; use it with --align rs")
+        else:
+            print(f"FILTERS are not applied to {pipeline.serial}: it has no librealsense frames")
+
+    options = [clipper, align, filters] # if not want 'clipping_distance', 'align', 'filters',
+                                        # set [None, None, None].
+    if metric_depth:
+        options = [None, align, filters] # keep the metric depth; clipping is done for display only
+
+    # the first frames come while auto-exposure is still settling (and after the emitter change)
+    devices.warmup(pipeline, label)
+    devices.report(label)
+
+    stream_settings = getattr(pipeline, 'stream_settings', {})
+    info = {'serial': pipeline.serial, # known after start() for bag files
+            'fps': max((st['fps'] for st in stream_settings.values()), default=getattr(pipeline, 'fps', 30.0)),
+            'depth_scale': depth_scale,
+            'calibration': (calibration, pipeline.aligned or align is not None)} # stored with a take
+    return pipeline, options, info, clipper, filters
+
+
+def openCameraProcess(index, sources):
+    """open_fn of ProcessCaptureGroup (--procs), run in the camera's process: its display
+    stages (colormap, clipping of metric depth) run there as well"""
+    pipeline, options, info, clipper, filters = openCamera(index, sources[index])
+    colorizer = DepthColorizer(alpha=args.alpha, colormap=color_maps[set_maps])
+    return pipeline, options, info, DisplayProcessor(colorizer, clipper if metric_depth else None)
+
+
+if __name__ == '__main__':
+    print(args)
+
+
+    # === Metrics === #
+    metrics = Metrics() # per-camera stage timers / counters; '_' holds the main-loop stages
+    loop_stats = metrics.camera()
+    reporter, metrics_server = None, None
+    if args.metrics_interval > 0:
+        reporter = MetricsReporter(metrics, interval=args.metrics_interval)
+        reporter.start()
+    if args.metrics_port > 0:
+        metrics_server = MetricsServer(metrics, args.metrics_port)
+
+
+    # === Video setting === #
+    fourcc = cv2.VideoWriter_fourcc(*'MP4V')
+    record = False
+
+
+    # === File system setting === #
+    spec = cfg.SPEC
+    path = osp.join('data', spec.cls_name, spec.ID)
+    types = ['rgb', 'depth', 'IR']
+
+    for i in types:
+        print(path)
+        DATA_DIR = Path(osp.join(path, i))
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+    s_num = 0  # scene number
+
+    # === Camera process === #
+    print("******  Camera Loading...  ******", end="\n ")
+
+    if args.source: # recorded / synthetic sources; see utils/sources.py
+        sources = args.source
+    else:
+        sources = [f"live:{serial}" for serial in devices.enumerate()]
+    if args.num_cams > 0:
+        sources = sources[:args.num_cams]
+    if not sources:
+        raise RuntimeError("No realsense device connected")
+
+    cam_ids = [f"c{i+1}" for i in range(len(sources))] # c1, c2, ... (file name prefix)
+    colorizers = [DepthColorizer(alpha=args.alpha, colormap=color_maps[set_maps]) for _ in sources] # per-camera lookup table + buffers
+
+
+    pipelines, clip_list, filter_chains = [], [], []
+    if args.procs:
+        # One process per camera: capture and the per-camera display stages run there, the
+        # frames come back through shared memory (utils/process_capture.py); the colorizers of
+        # the processes are their own
+        capture = ProcessCaptureGroup(functools.partial(openCameraProcess, sources=sources), len(sources),
+                                      slots=args.proc_slots, metrics=metrics)
+        with devices.phase('rig', 'start_all'): # the processes open their cameras concurrently
+            capture.start()
+        devices.report('rig')
+        infos = capture.info
+        clip_list = [None] * len(sources) # clipping happens in the camera processes
+    else:
+        # all cameras are opened, started and warmed up concurrently
+        pipelines, options_list, infos, clip_list, filter_chains = map(list, zip(*devices.startAll(lambda index: openCamera(index, sources[index]), len(sources))))
+
+    serial_list = [info['serial'] for info in infos]
+    depth_scales = [info['depth_scale'] for info in infos]
+    calibrations = [info['calibration'] for info in infos]
+    fps_list = [info['fps'] for info in infos] # video files play at their camera's rate
+
+    if not args.procs:
+        # One capture thread per camera
+        if args.sync_ms > 0:
+            capture = SyncedCapture(CaptureGroup(pipelines, options_list, serial_list, maxsize=sync_window, metrics=metrics),
+                                    tolerance_ms=args.sync_ms, window=sync_window)
+        else:
+            capture = CaptureGroup(pipelines, options_list, serial_list, metrics=metrics)
+        capture.start()
+
+    publishers = [] # FramePublisher per camera (--publish)
+    if args.publish:
+        publishers = [FramePublisher(serial, info=dict(depth_scale=depth_scale, aligned=aligned, calibration=calibration))
+                      for serial, depth_scale, (calibration, aligned) in zip(serial_list, depth_scales, calibrations)]
+        print(f"Publishing as {', '.join(publisher.name for publisher in publishers)}")
+
+    recorder = None # WriterPool with one writer thread per '{cam_id}_{img_type}' stream
+    pretriggers = [None] * len(serial_list) # PreTriggerRing per camera (--pretrigger); created with the first frames
+    take = None     # TakeWriter (--take)
+    mosaic = None   # display buffer; created with the first frames
+
+    # Key input: the OpenCV window, or commands from stdin / a UNIX socket (headless)
+    control, preview = None, None
+    if args.headless or args.control_socket:
+        control = ControlServer(use_stdin=args.headless, socket_path=args.control_socket)
+    if args.headless:
+        if args.preview_fps > 0:
+            preview = PreviewThread(fps=args.preview_fps, window=f"{args.window} (preview)", control=control)
+            preview.start()
+        print("Headless mode; commands: record, stop, snap, cmap, quit")
+    else:
+        cv2.namedWindow(args.window, cv2.WINDOW_NORMAL)
+    last_seq = [None] * len(serial_list) # a camera without a new frameset repeats its last one
+
+
+    def historyWriter(cam_id):
+        """write(frames, meta) for a pre-trigger flush: the raw frames converted like the live ones
+        below, on the flush thread (which may wait for the writers; the capture loop does not)"""
+        if take is not None:
+            return lambda frames, meta: take.append(cam_id, frames, meta)
+
+        colorizer = DepthColorizer(alpha=args.alpha, colormap=color_maps[set_maps]) # the loop's colorizers are not thread-safe
+        def write(frames, meta):
+            for img_type, frame in frames.items():
+                if img_type == 'rgb':
+                    frame = colorToBGR(frame) if frame.ndim == 2 else frame.copy()
+                elif img_type == 'depth' and not args.raw_depth:
+                    frame = colorizer(frame, out=np.empty((*frame.shape, 3), dtype=np.uint8))
+                elif img_type == 'IR':
+                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+                else:
+                    frame = frame.copy()
+                recorder.write(f"{cam_id}_{img_type}", frame, policy='block')
+        return write
+
+
+    try:
+        while True:
+            rec_images = [] # {img_type: image} per camera
+            raw_images = [] # {img_type: image} per camera, as captured (--take)
+
+            with metrics.timer('latest'):
+                packets = capture.latest()
+            is_new = [packet.seq != seq for packet, seq in zip(packets, last_seq)]
+            key = -1
+            if args.headless and not any(is_new):
+                key = control.poll() # commands work while the cameras stall; handled with their last framesets
+                if key == -1:
+                    time.sleep(0.001) # nothing new; no GUI redraw paces the loop
+                    continue
+            last_seq = [packet.seq for packet in packets]
+            loop_stats.frame() # main-loop FPS
+
+            if publishers:
+                # one copy into shared memory per new frameset; subscribers never hold us up
+                with metrics.timer('publish'):
+                    for publisher, packet, new in zip(publishers, packets, is_new):
+                        if new:
+                            publisher.publish(packet.images, dict(packet.meta, host_ts=packet.host_ts))
+
+            # the full mosaic is only composed when it is shown
+            show = not args.headless or (preview is not None and preview.due())
+            with metrics.timer('process'): # colorize / blend / compose, all cameras
+                for row, (packet, clipper, colorizer) in enumerate(zip(packets, clip_list, colorizers)):
+                    color_image, depth_image, leftIR_image, rightIR_image = packet.images # None: stream not enabled
+
+                    if mosaic is None:
+                        # one row per camera: RGB | depth colormap | blended | left IR [| right IR]
+                        mosaic = Mosaic(rows=len(serial_list), cols=5 if args.right_ir else 4,
+                                        tile_shape=next(i for i in packet.images if i is not None).shape)
+                    color_tile, colormap_tile, blended_tile, leftIR_tile = mosaic.row(row)[:4]
+
+                    raw_depth = depth_image
+                    raw_images.append({img_type: image for img_type, image in (('rgb', color_image), ('depth', raw_depth), ('IR', leftIR_image))
+                                       if image is not None})
+
+                    if packet.outputs is not None:
+                        # --procs: colormap and BGR IR were computed in the camera's process
+                        depth_colormap, leftIR_image = packet.outputs.get('colormap'), packet.outputs.get('IR')
+                        if show:
+                            for col, image in ((1, depth_colormap), (3, leftIR_image)):
+                                if image is not None:
+                                    mosaic.put(row, col, image)
+                    else:
+                        # Every stage writes into its tile of the display mosaic (other sizes are resized into it)
+                        # ------------------------------------------------------
+                        depth_colormap = None
+                        if depth_image is not None:
+                            if metric_depth:
+                                depth_image = clipper(depth_image) # into the clipper's buffer; the raw depth is kept
+                            fits = mosaic.fits(depth_image)
+                            depth_colormap = colorizer(depth_image, out=colormap_tile if fits else None) # Apply colormap on depth image (lookup table)
+                            if show and not fits:
+                                mosaic.put(row, 1, depth_colormap)
+
+                        # Convert grayscale IR image to 3-channel image
+                        # -------------------------------------------
+                        if leftIR_image is not None:
+                            fits = mosaic.fits(leftIR_image)
+                            leftIR_image = cv2.cvtColor(leftIR_image, cv2.COLOR_GRAY2BGR, dst=leftIR_tile if fits else None)
+                            if show and not fits:
+                                mosaic.put(row, 3, leftIR_image)
+
+                    if show and args.right_ir and rightIR_image is not None:
+                        mosaic.put(row, 4, rightIR_image) # gray -> BGR into its tile; not recorded
+
+                    if show and color_image is not None:
+                        color_bgr = colorToBGR(color_image) # YUYV is only converted when it is shown / encoded
+                        mosaic.put(row, 0, color_bgr)
+
+                        # Image blending
+                        # --------------
+                        if depth_colormap is not None and depth_colormap.shape == color_bgr.shape:
+                            if mosaic.fits(color_bgr):
+                                cv2.addWeighted(color_bgr, 0.5, depth_colormap, 1, 0, dst=blended_tile)
+                            else:
+                                mosaic.put(row, 2, cv2.addWeighted(color_bgr, 0.5, depth_colormap, 1, 0))
+
+                    rec_images.append({img_type: image for img_type, image in
+                                       (('rgb', color_image), ('depth', raw_depth if args.raw_depth else depth_colormap), ('IR', leftIR_image))
+                                       if image is not None})
+
+            # Show images from all cameras
+            with metrics.timer('display'):
+                if args.headless:
+                    if show:
+                        preview.submit(mosaic.image)
+                else:
+                    cv2.imshow(args.window, mosaic.image)
+                    key = cv2.waitKey(1)
+
+            if key == -1 and control is not None:
+                key = control.poll()
+
+
+            # Press esc or 'q' to close the image window
+            if key & 0xFF == ord('q') or key == 27: # ESC
+                if not args.headless:
+                    cv2.destroyAllWindows()
+                break
+
+            elif key == ord('m'): # press 'm' key; next colormap
+                set_maps = (set_maps + 1) % len(color_maps)
+                for colorizer in colorizers:
+                    colorizer.set_colormap(color_maps[set_maps])
+                if args.procs:
+                    capture.broadcast('set_colormap', color_maps[set_maps])
+
+            # Start: video capture signal
+            elif key == ord('s'): # press 's' key
+                print("Capturing for image...")
+
+                for cam_id, frames in zip(cam_ids, rec_images):
+                    cam_rgb_title = f"{cam_id}_rgb_{spec.cls_name}_{spec.ID}_{spec.scene}"
+                    if 'rgb' in frames:
+                        cv2.imwrite(f"{osp.join(path,cam_rgb_title)}.jpg", colorToBGR(frames['rgb']))
+
+            elif key == ord('v') and not record: # press 'v'
+                print("Recording start...")
+                record = True
+                s_num += 1
+
+                if args.take:
+                    take = TakeWriter(takePath(spec, s_num), spec, s_num, capacity=int(args.take_seconds * max(fps_list)), fps=max(fps_list))
+                    for cam_id, frames, serial, depth_scale, (calibration, aligned), fps, ring in \
+                            zip(cam_ids, raw_images, serial_list, depth_scales, calibrations, fps_list, pretriggers):
+                        # every camera is sized and replayed at its own rate, plus its pre-trigger history
+                        take.add_camera(cam_id, {img_type: (frame.shape, frame.dtype) for img_type, frame in frames.items()},
+                                        capacity=int(args.take_seconds * fps) + (ring.history if ring is not None else 0), fps=fps,
+                                        serial=serial, depth_scale=depth_scale, calibration=calibration, aligned=aligned)
+                    print(f" take: {take.directory}")
+                    for cam_id, serial in zip(cam_ids, serial_list):
+                        metrics.gauge(serial, 'take_frames', lambda take=take, cam_id=cam_id: take.count[cam_id])
+                else:
+                    recorder = WriterPool(maxsize=args.rec_queue, policy=args.rec_policy)
+                    for cam_id, frames, depth_scale, fps in zip(cam_ids, raw_images, depth_scales, fps_list):
+                        for img_type in types:
+                            if img_type not in frames: # stream not enabled
+                                continue
+                            cam_title = f"{cam_id}_{img_type}_{spec.cls_name}_{spec.ID}_s{s_num:04}"
+                            height, width = frames[img_type].shape[:2] # colormap / BGR IR have the size of the raw images
+                            if img_type == 'depth' and args.raw_depth:
+                                # path/depth/<cam_title>/000000.png, ... + meta.json with the depth scale
+                                recorder.open(f"{cam_id}_{img_type}", RawDepthWriter(osp.join(path, img_type, cam_title), depth_scale, fps=fps))
+                                continue
+                            recorder.open_video(f"{cam_id}_{img_type}", f"{osp.join(path, img_type, cam_title)}.mp4", fourcc, fps, (width, height), 1)
+                    for cam_id, serial in zip(cam_ids, serial_list): # writer queue depth; a writer that falls behind drops
+                        for img_type in types:
+                            if f"{cam_id}_{img_type}" in recorder.writers:
+                                metrics.gauge(serial, f"rec_queue_{img_type}", recorder.writers[f"{cam_id}_{img_type}"].qsize)
+
+                # the history goes to the recorder first (in the background); the live frames queue behind it
+                for cam_id, ring in zip(cam_ids, pretriggers):
+                    if ring is not None:
+                        print(f" pre-trigger {cam_id}: {len(ring)} frames ({ring.seconds:.1f} s)")
+                        ring.flush(historyWriter(cam_id))
+
+            elif key == 32 and record: # press 'SPACE'
+                print("Recording stop...")
+                record = False
+                for cam_id, ring in zip(cam_ids, pretriggers):
+                    if ring is not None:
+                        ring.wait() # the history and the live frames queued behind it are written
+                        print(f" pre-trigger {cam_id}: {ring.flushed} frames flushed, {ring.dropped} live frames dropped meanwhile")
+
+                if take is not None:
+                    for cam_id, count in take.close().items():
+                        print(f" {cam_id}: {count} frames, {take.dropped[cam_id]} dropped (take full)")
+                    take = None
+                    metrics.remove_gauges('take_')
+                    continue
+
+                for stream, stat in recorder.close().items(): # waits for the queued frames
+                    print(f" {stream}: {stat['written']} written, {stat['dropped']} dropped")
+                recorder = None
+                metrics.remove_gauges('rec_queue_')
+
+
+            if record == True and take is not None:
+                # copy straight into the memory-mapped take; no encoding involved
+                with metrics.timer('record'):
+                    for cam_id, packet, frames, new, ring in zip(cam_ids, packets, raw_images, is_new, pretriggers):
+                        if new:
+                            meta = dict(packet.meta, host_ts=packet.host_ts)
+                            if ring is not None and ring.queue(frames, meta): # behind the pre-trigger history
+                                continue
+                            take.append(cam_id, frames, meta)
+
+            elif record == True:
+                with metrics.timer('record'):
+                    for cam_id, packet, frames, raw, new, ring in zip(cam_ids, packets, rec_images, raw_images, is_new, pretriggers):
+                        if not new: # the camera's last frameset again (the loop runs faster than the cameras)
+                            continue
+                        if ring is not None and ring.queue(raw, dict(packet.meta, host_ts=packet.host_ts)): # behind the pre-trigger history
+                            continue
+                        for img_type, frame in frames.items():
+                            # frames point into the SDK frame buffer, reused buffers (colorizer) or shared-memory slots (--procs);
+                            # copy them before queueing so the writer neither holds librealsense's frame pool
+                            # nor sees them overwritten by the next frame
+                            if img_type == 'rgb' and frame.ndim == 2:
+                                frame = colorToBGR(frame) # YUYV -> new BGR array
+                            else:
+                                frame = frame.copy()
+                            recorder.write(f"{cam_id}_{img_type}", frame)
+
+            elif args.pretrigger > 0:
+                # keep the last seconds of raw frames; one copy into a preallocated slot per frame
+                with metrics.timer('pretrigger'):
+                    for i, (cam_id, serial, packet, frames, new) in enumerate(zip(cam_ids, serial_list, packets, raw_images, is_new)):
+                        if not new:
+                            continue
+                        if pretriggers[i] is None:
+                            try:
+                                ring = PreTriggerRing.forFrames(frames, args.pretrigger, fps_list[i], name=cam_id,
+                                                                max_bytes=int(args.pretrigger_mb * 2**20 / len(cam_ids)))
+                            except ValueError as e: # the cap is shared by all cameras
+                                parser.error(f"--pretrigger_mb {args.pretrigger_mb:g} is too small for {len(cam_ids)} cameras: {e}")
+                            print(f"Pre-trigger {cam_id}: {ring.history} frames ({ring.history / fps_list[i]:.1f} s) + {ring.capacity - ring.history} "
+                                  f"for the flush, {ring.nbytes / 2**20:.0f} MB")
+                            metrics.gauge(serial, 'pretrigger_frames', ring.__len__)
+                            metrics.gauge(serial, 'pretrigger_dropped', lambda ring=ring: ring.dropped)
+                            pretriggers[i] = ring
+                        pretriggers[i].push(frames, dict(packet.meta, host_ts=packet.host_ts))
+
+
+    finally:
+        # Stop streaming
+        if reporter is not None:
+            reporter.stop()
+            reporter.report() # the last (partial) interval
+        if metrics_server is not None:
+            metrics_server.close()
+        if preview is not None:
+            preview.stop()
+        if control is not None:
+            control.close()
+        capture.stop()
+        for publisher in publishers:
+            publisher.close()
+        for filters in filter_chains:
+            if filters is not None:
+                filters.close()
+        if args.sync_ms > 0:
+            print(f"Frame sync: {capture.stats()}")
+        for ring in pretriggers:
+            if ring is not None:
+                ring.wait()
+        if recorder is not None:
+            recorder.close()
+        if take is not None:
+            take.close()
+        for pipeline in pipelines:
+            pipeline.stop()
@@ -6,6 +6,12 @@ OpenGL Pointcloud viewer with http://pyglet.org
 
 Usage:
 ------
+    python pyglet_pointcloud_viewer.py                          # all connected cameras
+    python pyglet_pointcloud_viewer.py --source live:<serial> --source bag:<file.bag>
+
+Every camera is drawn in the rig frame (poses from the RIG section of config.yaml) from its own
+vertex buffers; the fused mode merges the visible cameras into one voxel-downsampled cloud.
+
 Mouse:
     Drag with left button to rotate around pivot (thick small axes),
     with right button to translate and the wheel to zoom.
@@ -18,9 +24,11 @@ Keyboard:
     [x]     Toggle point distance attenuation
     [c]     Toggle color source
     [l]     Toggle lighting
-    [f]     Toggle depth post-processing
+    [f]     Toggle depth post-processing (FILTERS of config.yaml)
+    [u]     Toggle fused cloud (visible cameras merged in the rig frame, --voxel grid)
+    [1-9]   Toggle camera 1-9
     [s]     Save PNG (./out.png)
-    [e]     Export points to ply (./out.ply)
+    [e]     Export points to ply (./out_<serial>_000000.ply or ./out_fused_000000.ply, ...; written in the background)
     [q/ESC] Quit
 
 Notes:
@@ -28,18 +36,52 @@ Notes:
 Using deprecated OpenGL (FFP lighting, matrix stack...) however, draw calls 
 are kept low with pyglet.graphics.* which uses glDrawArrays internally.
 
-Normals calculation is done with numpy on CPU which is rather slow, should really
-be done with shaders but was omitted for several reasons - brevity, for lowering
+Frames are processed (filters, rs.pointcloud, normals, fusion) in worker threads, one per
+camera plus one for the fused cloud, which publish ready arrays through a LatestSlot; the
+pyglet tick only uploads the newest ones and draws, so heavy filtering lowers the cloud rate
+but not the render rate or the mouse response.
+
+Each camera has two vertex lists, each in vertex buffers of its own: a new frame is copied
+into the list that is not drawn and the two are swapped, so an upload never waits for the
+buffer the GPU is still reading. Lists are only written when their camera delivered a new
+frame (or a setting changed while paused), so unchanged buffers are not uploaded again.
+
+Normals calculation is done with numpy on CPU (utils.NormalEstimator: preallocated buffers,
+in-place finite differences, --normals_step to compute them on a decimated grid), should
+really be done with shaders but was omitted for several reasons - brevity, for lowering
 dependencies (pyglet doesn't ship with shader support & recommends pyshaders)
-and for reference.
+and for reference. While paused, a changed setting re-processes the paused frame; its normals
+are cached and only computed again if decimation or post-processing changed.
 """
 
 import math
+import time
 import ctypes
+import threading
+from collections import namedtuple
+import argparse
 import pyglet
 import pyglet.gl as gl
 import numpy as np
 import pyrealsense2 as rs
+from omegaconf import OmegaConf
+
+from utils import enableSource, getDeviceSerial, WriterPool, CloudSink, RigFusion, loadRig, LatestSlot, NormalEstimator, \
+                  FilterChain, CameraMetrics
+
+
+parser = argparse.ArgumentParser(description='OpenGL pointcloud viewer.')
+parser.add_argument('--source', type=str, action='append', default=None,
+                    help='live[:<serial>] or bag:<file.bag> (recorded with librealsense); once per camera, '
+                         'default: all connected cameras')
+parser.add_argument('--voxel', type=float, default=0.01, help='voxel size (m) of the fused cloud, 0 = keep all points')
+parser.add_argument('--normals_step', type=int, default=1,
+                    help='compute the lighting normals on every n-th point per row / column and upsample them')
+args = parser.parse_args()
+
+cfg = OmegaConf.load('config.yaml')
+# [f] post-processing when config.yaml has no FILTERS
+DEFAULT_FILTERS = [{'disparity': {}}, {'spatial': {}}, {'temporal': {}}, {'depth': {}}]
 
 
 # https://stackoverflow.com/a/6802723
@@ -73,6 +115,11 @@ class AppState:
         self.color = True
         self.lighting = False
         self.postprocessing = False
+        self.export = False
+        self.changed = 0 # bumped by settings that change the processed cloud
+        self.fused = False
+        self.cpu_ms, self.fuse_ms, self.upload_ms, self.copy_ms = 0.0, 0.0, 0.0, 0.0
+        self.filter_text, self.filter_t0 = '', 0.0
 
     def reset(self):
         self.pitch, self.yaw, self.distance = 0, 0, 2
@@ -86,49 +133,6 @@ class AppState:
 
 state = AppState()
 
-# Configure streams
-pipeline = rs.pipeline()
-config = rs.config()
-
-pipeline_wrapper = rs.pipeline_wrapper(pipeline)
-pipeline_profile = config.resolve(pipeline_wrapper)
-device = pipeline_profile.get_device()
-
-found_rgb = False
-for s in device.sensors:
-    if s.get_info(rs.camera_info.name) == 'RGB Camera':
-        found_rgb = True
-        break
-if not found_rgb:
-    print("The demo requires Depth camera with Color sensor")
-    exit(0)
-
-config.enable_stream(rs.stream.depth, rs.format.z16, 30)
-other_stream, other_format = rs.stream.color, rs.format.rgb8
-config.enable_stream(other_stream, other_format, 30)
-
-# Start streaming
-pipeline.start(config)
-profile = pipeline.get_active_profile()
-
-depth_profile = rs.video_stream_profile(profile.get_stream(rs.stream.depth))
-depth_intrinsics = depth_profile.get_intrinsics()
-w, h = depth_intrinsics.width, depth_intrinsics.height
-
-# Processing blocks
-pc = rs.pointcloud()
-decimate = rs.decimation_filter()
-decimate.set_option(rs.option.filter_magnitude, 2 ** state.decimate)
-threshold_filter = rs.threshold_filter()
-threshold_filter.set_option(rs.option.max_distance, 1)
-threshold_filter.set_option(rs.option.min_distance, 0.5)
-colorizer = rs.colorizer()
-filters = [rs.disparity_transform(),
-           rs.spatial_filter(),
-           rs.temporal_filter(),
-           rs.disparity_transform(False)]
-
-
 # pyglet
 window = pyglet.window.Window(
     config=gl.Config(
@@ -151,28 +155,135 @@ def convert_fmt(fmt):
     }[fmt]
 
 
-# Create a VertexList to hold pointcloud data
-# Will pre-allocates memory according to the attributes below
-vertex_list = pyglet.graphics.vertex_list(
-    w * h, 'v3f/stream', 't2f/stream', 'n3f/stream')
-# Create and allocate memory for our color data
-other_profile = rs.video_stream_profile(profile.get_stream(other_stream))
+def stream_list(count, *formats):
+    """VertexList in a domain of its own, i.e. in its own vertex buffers"""
+    return pyglet.graphics.vertexdomain.create_domain(*formats).create(count)
+
+
+def upload(dst, src):
+    """Copy a contiguous numpy array into a vertex list attribute (e.g. vertex_list.vertices;
+    reading the attribute marks it for upload on the next draw)"""
+    ctypes.memmove(dst, src.ctypes.data, src.nbytes)
+
+
+# vertices (N, 3), texcoords (N, 2), normals (h, w, 3) or None, mapped image, its pyglet format,
+# depth intrinsics after decimation, and the rs frames the arrays are views of (kept alive)
+Cloud = namedtuple('Cloud', ['verts', 'texcoords', 'normals', 'image', 'fmt', 'intrinsics', 'frames'])
+
+
+class DoubleBuffer:
+    """Two vertex lists: `back` is written while `front` is drawn, swap() makes it the front"""
+
+    def __init__(self, count, *formats):
+        self.lists = [stream_list(count, *formats), stream_list(count, *formats)]
+        self.front = 0
+        self.fresh = False # front holds data that was not drawn (uploaded) yet
+
+    @property
+    def back(self):
+        return self.lists[1 - self.front]
+
+    def swap(self):
+        self.front = 1 - self.front
+        self.fresh = True
+
+    def draw(self, mode):
+        self.lists[self.front].draw(mode)
+        self.fresh = False
+
+
+class Camera:
+    """One camera: its pipeline, processing blocks, pose in the rig frame and vertex lists"""
+
+    def __init__(self, source):
+        self.pipeline = rs.pipeline()
+        config = enableSource(rs.config(), source)
+
+        pipeline_wrapper = rs.pipeline_wrapper(self.pipeline)
+        device = config.resolve(pipeline_wrapper).get_device()
+        if not any(s.get_info(rs.camera_info.name) == 'RGB Camera' for s in device.sensors):
+            print(f"The demo requires Depth camera with Color sensor ({source})")
+            exit(0)
+
+        config.enable_stream(rs.stream.depth, rs.format.z16, 30)
+        config.enable_stream(rs.stream.color, rs.format.rgb8, 30)
+
+        # Start streaming
+        profile = self.pipeline.start(config)
+        self.serial = profile.get_device().get_info(rs.camera_info.serial_number)
+        depth_profile = rs.video_stream_profile(profile.get_stream(rs.stream.depth))
+        color_profile = rs.video_stream_profile(profile.get_stream(rs.stream.color))
+        self.depth_intrinsics = depth_profile.get_intrinsics()
+        color_intrinsics = color_profile.get_intrinsics()
+
+        extrinsics = depth_profile.get_extrinsics_to(color_profile)
+        self.depth_to_color = np.eye(4)
+        self.depth_to_color[:3, :3] = np.reshape(extrinsics.rotation, (3, 3)).T # column-major
+        self.depth_to_color[:3, 3] = extrinsics.translation
+        self.set_pose(np.eye(4))
+
+        # Processing blocks
+        self.pc = rs.pointcloud()
+        self.decimate = rs.decimation_filter()
+        self.decimate.set_option(rs.option.filter_magnitude, 2 ** state.decimate)
+        self.threshold_filter = rs.threshold_filter()
+        self.threshold_filter.set_option(rs.option.max_distance, 1)
+        self.threshold_filter.set_option(rs.option.min_distance, 0.5)
+        self.colorizer = rs.colorizer()
+        self.filters = FilterChain.fromConfig(cfg.get('FILTERS') or DEFAULT_FILTERS, name=self.serial)
+        self.stats = CameraMetrics(self.serial) # per-filter timings for the overlay
+
+        w, h = self.depth_intrinsics.width, self.depth_intrinsics.height
+        self.points = DoubleBuffer(w * h, 'v3f/stream', 't2f/stream', 'n3f/stream')
+        image_w, image_h = (color_intrinsics.width, color_intrinsics.height) if state.color else (w, h)
+        self.image_data = pyglet.image.ImageData(image_w, image_h, convert_fmt(color_profile.format()),
+                                                 (gl.GLubyte * (image_w * image_h * 3))())
+        self.visible = True
+        self.slot = LatestSlot() # Cloud for the render loop
+        self.cloud = None        # newest Cloud, for fusion and export
+        self.texture_source = None
+        self.normals = NormalEstimator(args.normals_step)
+        self._normals_out = 0    # published normals rotate over 3 buffers (see process())
+        self._normals_buffers = {}
+
+    def set_pose(self, color_to_rig):
+        """RIG poses are given for the color camera; points are in the depth camera frame"""
+        self.pose = color_to_rig @ self.depth_to_color
+        self.pose_gl = (gl.GLfloat * 16)(*self.pose.T.ravel()) # column-major for glMultMatrixf
+
+
+# Configure streams: one pipeline per camera
+sources = args.source or [f'live:{serial}' for serial in getDeviceSerial()]
+if not sources:
+    print("No camera found")
+    exit(0)
+cameras = [Camera(source) for source in sources]
+rig = loadRig(cfg, [cam.serial for cam in cameras])
+for cam in cameras:
+    cam.set_pose(rig[cam.serial])
+
+fusion = RigFusion({cam.serial: cam.pose for cam in cameras}, voxel_size=args.voxel)
+fused = DoubleBuffer(1, 'v3f/stream', 'c3B/stream')
+fused.cloud = None
 
-image_w, image_h = w, h
-color_intrinsics = other_profile.get_intrinsics()
-color_w, color_h = color_intrinsics.width, color_intrinsics.height
+class CameraCloudSink(CloudSink):
+    """CloudSink for the Cloud of one camera; its points are colored in the writer thread"""
+    def write(self, cloud):
+        super().write(colored_points(cloud))
 
-if state.color:
-    image_w, image_h = color_w, color_h
 
-image_data = pyglet.image.ImageData(image_w, image_h, convert_fmt(
-other_profile.format()), (gl.GLubyte * (image_w * image_h * 3))())
+cloud_writer = WriterPool(maxsize=4, policy='drop_newest') # exports never block rendering
+for cam in cameras:
+    cloud_writer.open(cam.serial, CameraCloudSink('.', fmt='ply', prefix=f'out_{cam.serial}_'))
+cloud_writer.open('fused', CloudSink('.', fmt='ply', prefix='out_fused_'))
 
 if (pyglet.version <  '1.4' ):
     # pyglet.clock.ClockDisplay has be removed in 1.4
     fps_display = pyglet.clock.ClockDisplay()
 else:
     fps_display = pyglet.window.FPSDisplay(window)
+overlay = pyglet.text.Label('', font_size=10, x=10, anchor_y='top')
+filter_overlay = pyglet.text.Label('', font_size=10, x=10, anchor_y='top')
 
 
 @window.event
@@ -218,10 +329,13 @@ def on_key_press(symbol, modifiers):
 
     if symbol == pyglet.window.key.D:
         state.decimate = (state.decimate + 1) % 3
-        decimate.set_option(rs.option.filter_magnitude, 2 ** state.decimate)
+        state.changed += 1
+        for cam in cameras:
+            cam.decimate.set_option(rs.option.filter_magnitude, 2 ** state.decimate)
 
     if symbol == pyglet.window.key.C:
         state.color ^= True
+        state.changed += 1
 
     if symbol == pyglet.window.key.Z:
         state.scale ^= True
@@ -231,13 +345,26 @@ def on_key_press(symbol, modifiers):
 
     if symbol == pyglet.window.key.L:
         state.lighting ^= True
+        state.changed += 1
 
     if symbol == pyglet.window.key.F:
         state.postprocessing ^= True
+        state.changed += 1
+
+    if symbol == pyglet.window.key.U:
+        state.fused ^= True
+
+    if pyglet.window.key._1 <= symbol <= pyglet.window.key._9:
+        index = symbol - pyglet.window.key._1
+        if index < len(cameras):
+            cameras[index].visible ^= True
 
     if symbol == pyglet.window.key.S:
         pyglet.image.get_buffer_manager().get_color_buffer().save('out.png')
 
+    if symbol == pyglet.window.key.E:
+        state.export = True # once per key press, picked up by the next processed frame
+
     if symbol == pyglet.window.key.Q:
         window.close()
 
@@ -300,6 +427,43 @@ def grid(size=1, n=10, width=1):
     batch.draw()
 
 
+def draw_camera(cam):
+    """Textured points of a camera in the rig frame; returns the seconds spent if the buffers
+    were fresh (drawing them uploads the vertex buffers and the texture), else 0"""
+    t0 = time.perf_counter()
+    fresh = cam.points.fresh
+    image_data = cam.image_data
+
+    gl.glMatrixMode(gl.GL_TEXTURE)
+    gl.glLoadIdentity()
+    # texcoords are [0..1] and relative to top-left pixel corner, add 0.5 to center
+    gl.glTranslatef(0.5 / image_data.width, 0.5 / image_data.height, 0)
+    texture = image_data.get_texture()
+    # texture size may be increased by pyglet to a power of 2
+    tw, th = texture.owner.width, texture.owner.height
+    gl.glScalef(image_data.width / float(tw),
+                image_data.height / float(th), 1)
+
+    gl.glMatrixMode(gl.GL_MODELVIEW)
+    gl.glPushMatrix()
+    gl.glMultMatrixf(cam.pose_gl)
+
+    gl.glEnable(texture.target)
+    gl.glBindTexture(texture.target, texture.id)
+    gl.glTexParameteri(
+        gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+    cam.points.draw(gl.GL_POINTS)
+    gl.glDisable(texture.target)
+
+    gl.glPopMatrix()
+    return time.perf_counter() - t0 if fresh else 0.0
+
+
+def smooth(average, value, alpha=0.1):
+    """exponential moving average of the overlay timings"""
+    return value if average == 0 else average + alpha * (value - average)
+
+
 @window.event
 def on_draw():
     window.clear()
@@ -314,16 +478,6 @@ def on_draw():
     gl.glLoadIdentity()
     gl.gluPerspective(60, width / float(height), 0.01, 20)
 
-    gl.glMatrixMode(gl.GL_TEXTURE)
-    gl.glLoadIdentity()
-    # texcoords are [0..1] and relative to top-left pixel corner, add 0.5 to center
-    gl.glTranslatef(0.5 / image_data.width, 0.5 / image_data.height, 0)
-    image_texture = image_data.get_texture()
-    # texture size may be increased by pyglet to a power of 2
-    tw, th = image_texture.owner.width, image_texture.owner.height
-    gl.glScalef(image_data.width / float(tw),
-                image_data.height / float(th), 1)
-
     gl.glMatrixMode(gl.GL_MODELVIEW)
     gl.glLoadIdentity()
 
@@ -345,13 +499,14 @@ def on_draw():
     grid()
     gl.glPopMatrix()
 
+    w, h = cameras[0].depth_intrinsics.width, cameras[0].depth_intrinsics.height
     psz = max(window.get_size()) / float(max(w, h)) if state.scale else 1
     gl.glPointSize(psz)
     distance = (0, 0, 1) if state.attenuation else (1, 0, 0)
     gl.glPointParameterfv(gl.GL_POINT_DISTANCE_ATTENUATION,
                           (gl.GLfloat * 3)(*distance))
 
-    if state.lighting:
+    if state.lighting and not state.fused:
         ldir = [0.5, 0.5, 0.5]  # world-space lighting
         ldir = np.dot(state.rotation, (0, 0, 1))  # MeshLab style lighting
         ldir = list(ldir) + [0]  # w=0, directional light
@@ -364,27 +519,38 @@ def on_draw():
         gl.glEnable(gl.GL_NORMALIZE)
         gl.glEnable(gl.GL_LIGHTING)
 
-    gl.glColor3f(1, 1, 1)
-    texture = image_data.get_texture()
-    gl.glEnable(texture.target)
-    gl.glBindTexture(texture.target, texture.id)
-    gl.glTexParameteri(
-        gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
-
     # comment this to get round points with MSAA on
     gl.glEnable(gl.GL_POINT_SPRITE)
 
     if not state.scale and not state.attenuation:
         gl.glDisable(gl.GL_MULTISAMPLE)  # for true 1px points with MSAA on
-    vertex_list.draw(gl.GL_POINTS)
-    gl.glDisable(texture.target)
+
+    upload_time = 0.0
+    if state.fused:
+        t0, fresh = time.perf_counter(), fused.fresh
+        fused.draw(gl.GL_POINTS) # per-vertex colors, already in the rig frame
+        upload_time += time.perf_counter() - t0 if fresh else 0.0
+    else:
+        gl.glColor3f(1, 1, 1)
+        for cam in cameras:
+            if cam.visible:
+                upload_time += draw_camera(cam)
+    if upload_time or state.copy_ms:
+        state.upload_ms = smooth(state.upload_ms, state.copy_ms + upload_time * 1e3)
+        state.copy_ms = 0.0
+
     if not state.scale and not state.attenuation:
         gl.glEnable(gl.GL_MULTISAMPLE)
 
     gl.glDisable(gl.GL_LIGHTING)
 
     gl.glColor3f(0.25, 0.25, 0.25)
-    frustum(depth_intrinsics)
+    for cam in cameras:
+        if cam.visible:
+            gl.glPushMatrix()
+            gl.glMultMatrixf(cam.pose_gl)
+            frustum(cam.depth_intrinsics)
+            gl.glPopMatrix()
     axes()
 
     gl.glMatrixMode(gl.GL_PROJECTION)
@@ -397,108 +563,210 @@ def on_draw():
     gl.glDisable(gl.GL_DEPTH_TEST)
 
     fps_display.draw()
+    overlay.text = "cpu %.1f ms/frame  fuse %.1f ms  upload %.1f ms  %s" % (
+        state.cpu_ms, state.fuse_ms if state.fused else 0, state.upload_ms,
+        "  ".join("[%d] %s%s" % (i + 1, cam.serial, "" if cam.visible else " (hidden)") for i, cam in enumerate(cameras))
+        + ("  fused" if state.fused else ""))
+    overlay.y = height - 10
+    overlay.draw()
 
+    if state.postprocessing:
+        filter_overlay.text = filter_times()
+        filter_overlay.y = height - 26
+        filter_overlay.draw()
 
-def run(dt):
-    global w, h
-    window.set_caption("RealSense (%dx%d) %dFPS (%.2fms) %s" %
-                       (w, h, 0 if dt == 0 else 1.0 / dt, dt * 1000,
-                        "PAUSED" if state.paused else ""))
 
-    if state.paused:
-        return
+def filter_times():
+    """Mean cost of every filter stage per visible camera, refreshed once a second"""
+    now = time.perf_counter()
+    if now - state.filter_t0 >= 1.0:
+        state.filter_t0 = now
+        state.filter_text = "  ".join(
+            "%s: %s" % (cam.serial, " ".join("%s %.1f" % (stage[len('filter_'):], timing['mean_ms'])
+                                             for stage, timing in cam.stats.snapshot()['stages'].items()))
+            for cam in cameras if cam.visible) + "  (ms)"
+    return state.filter_text
 
-    success, frames = pipeline.try_wait_for_frames(timeout_ms=0)
-    if not success:
-        return
 
-    
+def process(cam, frames):
+    """Frameset of a camera -> Cloud"""
     depth_frame = frames.get_depth_frame().as_video_frame()
-    other_frame = frames.first(other_stream).as_video_frame()
+    color_frame = frames.first(rs.stream.color).as_video_frame()
 
-    depth_frame = decimate.process(depth_frame)
-    depth_frame = threshold_filter.process(depth_frame)
+    depth_frame = cam.decimate.process(depth_frame)
+    depth_frame = cam.threshold_filter.process(depth_frame)
 
     if state.postprocessing:
-        for f in filters:
-            depth_frame = f.process(depth_frame)
+        depth_frame = cam.filters.process(depth_frame, stats=cam.stats)
 
     # Grab new intrinsics (may be changed by decimation)
     depth_intrinsics = rs.video_stream_profile(
         depth_frame.profile).get_intrinsics()
     w, h = depth_intrinsics.width, depth_intrinsics.height
 
-    color_image = np.asanyarray(other_frame.get_data())
-
-    colorized_depth = colorizer.colorize(depth_frame)
-    depth_colormap = np.asanyarray(colorized_depth.get_data())
+    # the depth colormap is only computed when it is the color source
+    mapped_frame = color_frame if state.color else cam.colorizer.colorize(depth_frame)
+    mapped_image = np.asanyarray(mapped_frame.get_data())
 
-    if state.color:
-        mapped_frame, color_source = other_frame, color_image
-    else:
-        mapped_frame, color_source = colorized_depth, depth_colormap
-
-    points = pc.calculate(depth_frame)
-    pc.map_to(mapped_frame)
-
-    # handle color source or size change
-    fmt = convert_fmt(mapped_frame.profile.format())
-    global image_data
-
-    if (image_data.format, image_data.pitch) != (fmt, color_source.strides[0]):
-        if state.color:
-            global color_w, color_h
-            image_w, image_h = color_w, color_h
-        else:
-            image_w, image_h = w, h
-
-        empty = (gl.GLubyte * (image_w * image_h * 3))()
-        image_data = pyglet.image.ImageData(image_w, image_h, fmt, empty)
-
-    # copy image data to pyglet
-    image_data.set_data(fmt, color_source.strides[0], color_source.ctypes.data)
+    points = cam.pc.calculate(depth_frame)
+    cam.pc.map_to(mapped_frame)
 
     verts = np.asarray(points.get_vertices(2)).reshape(h, w, 3)
     texcoords = np.asarray(points.get_texture_coordinates(2))
 
-    if len(vertex_list.vertices) != verts.size:
-        vertex_list.resize(verts.size // 3)
-        # need to reassign after resizing
-        vertex_list.vertices = verts.ravel()
-        vertex_list.tex_coords = texcoords.ravel()
+    normals = None
+    if state.lighting and not state.fused:
+        # compute normals; a published Cloud must not change, so the output rotates over 3
+        # buffers: the render tick copies a buffer long before it is written again
+        buffers = cam._normals_buffers.get((h, w))
+        if buffers is None:
+            buffers = cam._normals_buffers[(h, w)] = [np.empty((h, w, 3), np.float32) for _ in range(3)]
+        frame_id = (frames.get_frame_number(), state.decimate, state.postprocessing)
+        if frame_id != cam.normals.frame_id:
+            cam._normals_out = (cam._normals_out + 1) % 3
+        normals = cam.normals(verts, frame_id=frame_id, out=buffers[cam._normals_out])
+
+        # OpenGL normalizes them for us, see GL_NORMALIZE above
+
+    return Cloud(verts.reshape(-1, 3), texcoords, normals, mapped_image,
+                 convert_fmt(mapped_frame.profile.format()), depth_intrinsics, (points, mapped_frame))
+
+
+def colored_points(cloud):
+    """Points with depth and their RGB colors, from the mapped image at their texture coordinates"""
+    valid = np.flatnonzero(cloud.verts[:, 2] > 0)
+    ch, cw = cloud.image.shape[:2]
+    uv = cloud.texcoords[valid]
+    px = np.clip((uv[:, 0] * cw).astype(np.intp), 0, cw - 1)
+    py = np.clip((uv[:, 1] * ch).astype(np.intp), 0, ch - 1)
+    colors = cloud.image[py, px, :3]
+    if cloud.fmt.startswith('BGR'):
+        colors = colors[:, ::-1]
+    return cloud.verts[valid], colors
+
+
+stop_event = threading.Event()
+new_cloud = threading.Event() # wakes the fusion worker
+fused_slot = LatestSlot()     # (points, colors) in the rig frame
+
+
+def camera_worker(cam):
+    """Wait for the frames of one camera and publish its processed Cloud"""
+    last_frames, changed = None, state.changed
+    while not stop_event.is_set():
+        success, frames = cam.pipeline.try_wait_for_frames(timeout_ms=100)
+        if not cam.visible:
+            continue # frames are still consumed, so a resumed camera starts from a new one
+        if state.paused:
+            if last_frames is None or changed == state.changed:
+                continue
+            frames = last_frames # a setting changed: process the paused frame again
+        elif not success:
+            continue
+        last_frames, changed = frames, state.changed
+        t0 = time.perf_counter()
+        cam.cloud = process(cam, frames)
+        cam.slot.put(cam.cloud)
+        new_cloud.set()
+        state.cpu_ms = smooth(state.cpu_ms, (time.perf_counter() - t0) * 1e3)
+
+
+def fusion_worker():
+    """Merge the newest clouds of the visible cameras whenever one of them has a new one"""
+    while not stop_event.is_set():
+        if not new_cloud.wait(0.1):
+            continue
+        new_cloud.clear()
+        if not state.fused:
+            continue
+        t0 = time.perf_counter()
+        clouds = {cam.serial: colored_points(cam.cloud) for cam in cameras if cam.visible and cam.cloud is not None}
+        fused_slot.put(fusion.merge(clouds))
+        state.fuse_ms = smooth(state.fuse_ms, (time.perf_counter() - t0) * 1e3)
+
+
+def upload_camera(cam, cloud):
+    """Copy a Cloud into the back vertex list and the texture of its camera"""
+    cam.depth_intrinsics = cloud.intrinsics
+    vertex_list = cam.points.back
+    if len(vertex_list.vertices) != cloud.verts.size:
+        vertex_list.resize(len(cloud.verts)) # decimation changed
 
     # copy our data to pre-allocated buffers, this is faster than assigning...
     # pyglet will take care of uploading to GPU
-    def copy(dst, src):
-        """copy numpy array to pyglet array"""
-        # timeit was mostly inconclusive, favoring slice assignment for safety
-        np.array(dst, copy=False)[:] = src.ravel()
-        # ctypes.memmove(dst, src.ctypes.data, src.nbytes)
+    upload(vertex_list.vertices, cloud.verts)
+    upload(vertex_list.tex_coords, cloud.texcoords)
+    if cloud.normals is not None:
+        upload(vertex_list.normals, cloud.normals)
+    cam.points.swap()
+
+    # handle color source or size change
+    fmt, image = cloud.fmt, cloud.image
+    if (cam.image_data.format, cam.image_data.pitch) != (fmt, image.strides[0]):
+        image_h, image_w = image.shape[:2]
+        empty = (gl.GLubyte * (image_w * image_h * 3))()
+        cam.image_data = pyglet.image.ImageData(image_w, image_h, fmt, empty)
 
-    copy(vertex_list.vertices, verts)
-    copy(vertex_list.tex_coords, texcoords)
+    # copy image data to pyglet; the texture is created from it when drawn,
+    # `cam.texture_source` keeps the image alive until then
+    cam.texture_source = cloud
+    cam.image_data.set_data(fmt, image.strides[0], image.ctypes.data)
 
-    if state.lighting:
-        # compute normals
-        dy, dx = np.gradient(verts, axis=(0, 1))
-        n = np.cross(dx, dy)
 
-        # can use this, np.linalg.norm or similar to normalize, but OpenGL can do this for us, see GL_NORMALIZE above
-        # norm = np.sqrt((n*n).sum(axis=2, keepdims=True))
-        # np.divide(n, norm, out=n, where=norm != 0)
+def upload_fused(points, colors):
+    vertex_list = fused.back
+    if len(vertex_list.vertices) != points.size:
+        vertex_list.resize(len(points))
+    upload(vertex_list.vertices, points)
+    upload(vertex_list.colors, colors)
+    fused.swap()
+    fused.cloud = points, colors # for export
 
-        # import cv2
-        # n = cv2.bilateralFilter(n, 5, 1, 1)
 
-        copy(vertex_list.normals, n)
+def run(dt):
+    """Render tick: upload what the workers published since the last tick"""
+    window.set_caption("RealSense (%d cameras) %dFPS (%.2fms) %s" %
+                       (len(cameras), 0 if dt == 0 else 1.0 / dt, dt * 1000,
+                        "PAUSED" if state.paused else ""))
+
+    # while paused the workers only publish when a setting changed, so nothing else is uploaded
+    t0 = time.perf_counter()
+    if state.fused:
+        cloud = fused_slot.get()
+        if cloud is not None and len(cloud[0]):
+            upload_fused(*cloud)
+    else:
+        for cam in cameras:
+            cloud = cam.slot.get()
+            if cloud is not None and cam.visible:
+                upload_camera(cam, cloud)
+    state.copy_ms += (time.perf_counter() - t0) * 1e3 # + the buffer uploads when drawn, see on_draw
+
+    if state.export:
+        state.export = False
+        if state.fused:
+            if fused.cloud is not None:
+                cloud_writer.write('fused', fused.cloud)
+        else:
+            for cam in cameras:
+                if cam.visible and cam.cloud is not None:
+                    cloud_writer.write(cam.serial, cam.cloud) # a new Cloud (and frames) per frame; colored by the writer
 
-    if keys[pyglet.window.key.E]:
-        points.export_to_ply('./out.ply', mapped_frame)
 
+workers = [threading.Thread(target=camera_worker, args=(cam,), name=f'process-{cam.serial}', daemon=True)
+           for cam in cameras]
+workers.append(threading.Thread(target=fusion_worker, name='fusion', daemon=True))
+for worker in workers:
+    worker.start()
 
 pyglet.clock.schedule(run)
 
 try:
     pyglet.app.run()
 finally:
-    pipeline.stop()
+    stop_event.set()
+    for worker in workers:
+        worker.join(1.0)
+    for cam in cameras:
+        cam.pipeline.stop()
+    cloud_writer.close() # waits for pending exports
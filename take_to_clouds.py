@@ -0,0 +1,23 @@
+""" - convert a recorded take (utils/take.py) into one point cloud per frame and camera
+    python take_to_clouds.py data/shakehand/0000/take_shakehand_0000_s0001 --fmt pcd --max_depth 2.0
+"""
+import argparse
+
+from utils import convertTake
+from utils.pointcloud import FORMATS
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a recorded take into per-frame point clouds.')
+    parser.add_argument('take', type=str, help='take directory (utils/take.py)')
+    parser.add_argument('--cam', type=str, action='append', default=None, help='camera id (repeatable; default: all)')
+    parser.add_argument('--fmt', type=str, default='ply', choices=FORMATS)
+    parser.add_argument('--out', type=str, default=None, help='output directory (default: <take>/cloud)')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--min_depth', type=float, default=0.0, help='meter')
+    parser.add_argument('--max_depth', type=float, default=None, help='meter')
+    args = parser.parse_args()
+
+    for cam_id, count in convertTake(args.take, args.cam, args.fmt, args.out, args.processes,
+                                     args.min_depth, args.max_depth).items():
+        print(f" {cam_id}: {count} clouds")
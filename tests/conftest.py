@@ -0,0 +1,4 @@
+import sys
+import os.path as osp
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__)))) # import utils from the repository root
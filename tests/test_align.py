@@ -0,0 +1,102 @@
+""" - software alignment (utils/align.py) against librealsense's own projection functions
+"""
+import json
+import tracemalloc
+
+import numpy as np
+import pyrealsense2 as rs
+import pytest
+
+from utils import SoftwareAligner
+
+
+CALIBRATION = {
+    'depth_intrinsics': {'width': 64, 'height': 48, 'fx': 50.0, 'fy': 51.0, 'ppx': 31.5, 'ppy': 24.2,
+                         'model': 'brown_conrady', 'coeffs': [0.0] * 5},
+    'color_intrinsics': {'width': 80, 'height': 60, 'fx': 90.0, 'fy': 88.0, 'ppx': 40.3, 'ppy': 29.7,
+                         'model': 'none', 'coeffs': [0.0] * 5},
+    'depth_to_color': {'rotation': [0.9998, 0.0175, 0.0, -0.0175, 0.9998, 0.0, 0.0, 0.0, 1.0],
+                       'translation': [0.015, 0.001, 0.0005]},
+    'depth_scale': 0.001,
+}
+DISTORTED = dict(CALIBRATION, color_intrinsics=dict(CALIBRATION['color_intrinsics'], model='modified_brown_conrady',
+                                                    coeffs=[0.1, -0.05, 0.001, 0.002, 0.01]))
+
+
+def _intrinsics(d):
+    intrinsics = rs.intrinsics()
+    intrinsics.width, intrinsics.height = d['width'], d['height']
+    intrinsics.fx, intrinsics.fy, intrinsics.ppx, intrinsics.ppy = d['fx'], d['fy'], d['ppx'], d['ppy']
+    intrinsics.model, intrinsics.coeffs = getattr(rs.distortion, d['model']), list(d['coeffs'])
+    return intrinsics
+
+
+def _align_images(calibration, depth):
+    """rs.align's align_images, one pixel at a time through rs2_deproject / transform / project"""
+    di, ci = _intrinsics(calibration['depth_intrinsics']), _intrinsics(calibration['color_intrinsics'])
+    extrinsics = rs.extrinsics()
+    extrinsics.rotation = calibration['depth_to_color']['rotation']
+    extrinsics.translation = calibration['depth_to_color']['translation']
+
+    aligned = np.zeros((ci.height, ci.width), dtype=np.uint16)
+    for y in range(di.height):
+        for x in range(di.width):
+            z = int(depth[y, x])
+            if not z:
+                continue
+            corners = []
+            for corner in (-0.5, 0.5):
+                point = rs.rs2_deproject_pixel_to_point(di, [x + corner, y + corner], z * calibration['depth_scale'])
+                pixel = rs.rs2_project_point_to_pixel(ci, rs.rs2_transform_point_to_point(extrinsics, point))
+                corners.append([int(np.float32(p) + np.float32(0.5)) for p in pixel])
+            (x0, y0), (x1, y1) = corners
+            if x0 < 0 or y0 < 0 or x1 >= ci.width or y1 >= ci.height:
+                continue
+            block = aligned[y0:y1 + 1, x0:x1 + 1]
+            block[(block == 0) | (block > z)] = z
+    return aligned
+
+
+def _depth(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    depth = rng.integers(300, 3000, shape, dtype=np.uint16)
+    depth[rng.random(shape) < 0.1] = 0 # holes
+    return depth
+
+
+@pytest.mark.parametrize('calibration', [CALIBRATION, DISTORTED], ids=['none', 'modified_brown_conrady'])
+def test_matches_librealsense(calibration):
+    stored = json.loads(json.dumps(calibration)) # as read back from a take's meta.json
+    aligner = SoftwareAligner.fromDict(stored)
+    depth = _depth((48, 64))
+    np.testing.assert_array_equal(aligner(depth), _align_images(calibration, depth))
+
+
+def test_out_and_batch():
+    aligner = SoftwareAligner.fromDict(CALIBRATION)
+    depths = np.stack([_depth((48, 64), seed) for seed in range(3)])
+    batch = aligner.align_batch(depths)
+    assert batch.shape == (3, 60, 80)
+    out = np.empty((60, 80), dtype=np.uint16)
+    assert aligner(depths[1], out=out) is out
+    np.testing.assert_array_equal(out, batch[1])
+    with pytest.raises(ValueError):
+        aligner(depths[0][:, :32])
+
+
+@pytest.mark.parametrize('calibration', [CALIBRATION, DISTORTED], ids=['none', 'modified_brown_conrady'])
+def test_no_per_frame_temporaries(calibration):
+    # larger than NumPy's cast buffers (8192 elements), so a buffered or temporary pass would show
+    scale = {'width': 4, 'height': 4, 'fx': 4, 'fy': 4, 'ppx': 4, 'ppy': 4}
+    calibration = dict(calibration, **{key: {k: v * scale.get(k, 1) for k, v in calibration[key].items()}
+                                       for key in ('depth_intrinsics', 'color_intrinsics')})
+    aligner = SoftwareAligner.fromDict(calibration)
+    depth = _depth((192, 256))
+    aligner(depth) # warm-up
+    tracemalloc.start()
+    try:
+        aligner(depth)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 16 << 10 # np.minimum.at's own bookkeeping; a depth-sized temporary is >= 49 KiB
@@ -0,0 +1,111 @@
+""" - capture workers (utils/capture.py) on synthetic sources and fake read functions
+"""
+import time
+import threading
+
+import pytest
+
+from utils import CaptureWorker, CaptureGroup, LatestSlot, SyntheticSource
+
+
+class _Frames:
+    """read_fn that hands out `count` framesets, then blocks like a camera without new frames"""
+    def __init__(self, count):
+        self.count = count
+        self.read = 0
+        self.more = threading.Event()
+
+    def __call__(self, pipeline, *options, meta=None, **kwargs):
+        if self.read >= self.count:
+            self.more.wait(0.01)
+            raise RuntimeError("Frame didn't arrive within 10")
+        self.read += 1
+        if meta is not None:
+            meta['timestamp'] = float(self.read)
+            meta['frame_number'] = self.read
+        return ('color', 'depth', None, None)
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_worker_lifecycle():
+    source = SyntheticSource(64, 48)
+    source.start()
+    worker = CaptureWorker(source, [None, None], serial='c1')
+    worker.start()
+    packet = worker.latest(timeout=2.0)
+    assert packet is not None and packet.serial == 'c1'
+    color, depth, leftIR, rightIR = packet.images
+    assert color.shape == (48, 64, 3) and depth.shape == (48, 64)
+
+    worker.stop()
+    worker.join(1.0)
+    assert not worker.is_alive()
+
+
+def test_latest_drops_older_framesets():
+    frames = _Frames(5)
+    worker = CaptureWorker(None, [], maxsize=2, read_fn=frames)
+    worker.start()
+    _wait_until(lambda: frames.read == 5 and worker.qsize() == 2)
+    packet = worker.latest(timeout=0)
+    assert packet.meta['frame_number'] == 5
+    assert worker.dropped == 4 # 3 overwritten in the queue + 1 discarded by latest()
+    assert worker.latest(timeout=0) is None
+    worker.stop()
+    worker.join(1.0)
+
+
+def test_group_reuses_the_last_packet():
+    frames = _Frames(1)
+    group = CaptureGroup([None], [[]], serials=['c1'], read_fn=frames).start()
+    first, = group.latest(timeout=2.0)
+    again, = group.latest(timeout=0.1) # nothing new: the same packet again, not a new one
+    assert again is first and again.seq == first.seq
+
+    frames.count = 2
+    _wait_until(lambda: frames.read == 2)
+    _wait_until(lambda: group.workers[0].qsize() == 1)
+    new, = group.latest()
+    assert new.seq == first.seq + 1
+    group.stop()
+
+
+def test_group_without_frames_raises():
+    group = CaptureGroup([None], [[]], serials=['c1'], read_fn=_Frames(0)).start()
+    with pytest.raises(RuntimeError, match="No frames from camera c1"):
+        group.latest(timeout=0.05)
+    group.stop()
+
+
+def test_dead_worker_raises():
+    frames = _Frames(1)
+    def read(pipeline, *options, meta=None, **kwargs):
+        if frames.read == 1:
+            raise ValueError("lost the device")
+        return frames(pipeline, *options, meta=meta)
+
+    group = CaptureGroup([None], [[]], serials=['c1'], read_fn=read).start()
+    worker = group.workers[0]
+    _wait_until(lambda: not worker.is_alive())
+    assert isinstance(worker.failure, ValueError)
+    for _ in range(2): # not the last packet forever
+        with pytest.raises(RuntimeError, match="camera c1 failed: ValueError: lost the device"):
+            group.latest(timeout=0.1)
+    with pytest.raises(RuntimeError, match="camera c1 failed"):
+        worker.drain()
+    group.stop()
+
+
+def test_latest_slot():
+    slot = LatestSlot()
+    assert slot.get() is None
+    slot.put(1)
+    slot.put(2)
+    assert slot.get() == 2 and slot.skipped == 1
+    assert slot.get() is None
@@ -0,0 +1,50 @@
+""" - lossless raw depth recording (utils/depth_io.py)
+"""
+import numpy as np
+import pytest
+
+from utils import RawDepthWriter, readRawDepth, loadRawDepthMeta, WriterPool
+
+
+def _depths(count, shape=(48, 64)):
+    rng = np.random.default_rng(0)
+    depths = rng.integers(0, 65536, (count, *shape), dtype=np.uint16) # the full z16 range
+    depths[:, :8] = 0                                                 # flat regions (RLE)
+    depths[:, -1] = 65535
+    return depths
+
+
+def test_round_trip_is_lossless(tmp_path):
+    depths = _depths(3)
+    writer = RawDepthWriter(str(tmp_path / 'depth'), depth_scale=0.001, fps=15.0)
+    for depth in depths:
+        writer.write(depth)
+    writer.release()
+
+    frames = list(readRawDepth(str(tmp_path / 'depth')))
+    assert len(frames) == 3
+    for frame, depth in zip(frames, depths):
+        assert frame.dtype == np.uint16
+        np.testing.assert_array_equal(frame, depth)
+    assert loadRawDepthMeta(str(tmp_path / 'depth')) == {'depth_scale': 0.001, 'fps': 15.0, 'count': 3, 'shape': [48, 64],
+                                                          'dtype': 'uint16', 'format': 'png'}
+
+    meter = next(readRawDepth(str(tmp_path / 'depth'), meter=True))
+    assert meter.dtype == np.float32
+    np.testing.assert_allclose(meter, depths[0] * np.float32(0.001))
+
+
+def test_through_a_writer_pool(tmp_path):
+    depths = _depths(5)
+    pool = WriterPool(maxsize=8, policy='block')
+    pool.open('c1_depth', RawDepthWriter(str(tmp_path / 'depth'), depth_scale=0.001))
+    for depth in depths:
+        pool.write('c1_depth', depth.copy())
+    assert pool.close()['c1_depth']['written'] == 5
+    np.testing.assert_array_equal(np.stack(list(readRawDepth(str(tmp_path / 'depth')))), depths)
+
+
+def test_rejects_non_z16(tmp_path):
+    writer = RawDepthWriter(str(tmp_path / 'depth'), depth_scale=0.001)
+    with pytest.raises(TypeError):
+        writer.write(np.zeros((4, 4), np.uint8))
@@ -0,0 +1,37 @@
+""" - parallel camera bring-up (utils/devices.py DeviceManager.startAll)
+"""
+import pytest
+
+from utils import DeviceManager
+
+
+class _Pipeline:
+    def __init__(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+
+def test_start_all_returns_every_camera():
+    results = DeviceManager().startAll(lambda index: (_Pipeline(), index), 3)
+    assert [index for _, index in results] == [0, 1, 2]
+    assert all(pipeline.running for pipeline, _ in results)
+
+
+def test_failed_start_stops_the_started_cameras():
+    pipelines = {}
+    def open_fn(index):
+        if index == 1:
+            raise RuntimeError("xioctl(VIDIOC_S_FMT) failed: device busy")
+        pipelines[index] = _Pipeline()
+        return pipelines[index], {'serial': str(index)}
+
+    with pytest.raises(RuntimeError, match='device busy'):
+        DeviceManager().startAll(open_fn, 3)
+    assert sorted(pipelines) == [0, 2] and not any(pipeline.running for pipeline in pipelines.values())
+
+    stopped = []
+    with pytest.raises(RuntimeError):
+        DeviceManager().startAll(open_fn, 3, stop_fn=lambda result: stopped.append(result[1]['serial']))
+    assert sorted(stopped) == ['0', '2']
@@ -0,0 +1,46 @@
+""" - preallocated display mosaic (utils/display.py)
+"""
+import tracemalloc
+
+import numpy as np
+import cv2
+
+from utils import Mosaic
+
+
+def _ir(shape, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+
+
+def test_put_grey_into_its_tile():
+    mosaic = Mosaic(rows=2, cols=3, tile_shape=(48, 64))
+    ir = _ir((48, 64))
+    tile = mosaic.put(1, 2, ir)
+    assert tile is mosaic.tile(1, 2)
+    np.testing.assert_array_equal(tile, cv2.cvtColor(ir, cv2.COLOR_GRAY2BGR))
+    assert not mosaic.image[:48].any() and not mosaic.image[48:, :128].any() # the other tiles stay black
+
+    small = _ir((24, 32), seed=1)
+    mosaic.put(0, 0, small) # resized to the tile
+    expected = cv2.resize(cv2.cvtColor(small, cv2.COLOR_GRAY2BGR), (64, 48), interpolation=cv2.INTER_NEAREST)
+    np.testing.assert_array_equal(mosaic.tile(0, 0), expected)
+
+
+def test_put_grey_allocates_nothing():
+    mosaic = Mosaic(rows=1, cols=2, tile_shape=(240, 320))
+    ir, small = _ir((240, 320)), _ir((120, 160))
+    mosaic.put(0, 0, ir), mosaic.put(0, 1, small) # warm-up: the resize buffer
+    tracemalloc.start()
+    try:
+        mosaic.put(0, 0, ir)
+        mosaic.put(0, 1, small)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 4 << 10 # a BGR copy of the frame is 225 KiB
+
+
+def test_put_color():
+    mosaic = Mosaic(rows=1, cols=1, tile_shape=(48, 64))
+    color = np.dstack([_ir((48, 64), seed) for seed in range(3)])
+    np.testing.assert_array_equal(mosaic.put(0, 0, color), color)
@@ -0,0 +1,83 @@
+""" - depth filter chain (utils/filters.py) on frames of a librealsense software device
+"""
+import threading
+
+import numpy as np
+import pyrealsense2 as rs
+import pytest
+
+from utils import FilterChain
+
+
+STAGES = [('decimation', {'filter_magnitude': 2}), ('spatial', {'filter_smooth_alpha': 0.5}), ('hole_filling', {})]
+
+
+class _DepthDevice:
+    """z16 frames of a software device (no camera needed)"""
+    def __init__(self, width=64, height=48):
+        self.device = rs.software_device()
+        self.sensor = self.device.add_sensor("Depth")
+        intrinsics = rs.intrinsics()
+        intrinsics.width, intrinsics.height = width, height
+        intrinsics.fx, intrinsics.fy, intrinsics.ppx, intrinsics.ppy = 50.0, 50.0, width / 2, height / 2
+        stream = rs.video_stream()
+        stream.type, stream.index, stream.uid = rs.stream.depth, 0, 0
+        stream.width, stream.height, stream.fps, stream.bpp, stream.fmt = width, height, 30, 2, rs.format.z16
+        stream.intrinsics = intrinsics
+        self.profile = self.sensor.add_video_stream(stream)
+        self.sensor.add_read_only_option(rs.option.depth_units, 0.001)
+        self.queue = rs.frame_queue(64, keep_frames=True)
+        self.sensor.open(self.profile)
+        self.sensor.start(self.queue)
+        self.pixels = [] # the frames view them
+
+    def frame(self, depth, k):
+        self.pixels.append(depth)
+        frame = rs.software_video_frame()
+        frame.pixels, frame.bpp, frame.stride = depth, 2, depth.shape[1] * 2
+        frame.timestamp, frame.domain, frame.frame_number = k * 33.3, rs.timestamp_domain.hardware_clock, k
+        frame.profile = self.profile.as_video_stream_profile()
+        self.sensor.on_video_frame(frame)
+        return self.queue.wait_for_frame()
+
+
+def _depths(count, shape=(48, 64)):
+    rng = np.random.default_rng(0)
+    depths = rng.integers(300, 3000, (count, *shape), dtype=np.uint16)
+    depths[rng.random(depths.shape) < 0.1] = 0 # holes
+    return depths
+
+
+def _filtered(chain, frames):
+    results = [chain.process(frame) for frame in frames]
+    results += [chain.process(frames[-1]) for _ in range(chain.workers)] # flush the frames in flight
+    return [np.asanyarray(result.get_data()).copy() for result in results if result is not None][:len(frames)]
+
+
+def test_workers_match_the_serial_chain():
+    device = _DepthDevice()
+    frames = [device.frame(depth, k) for k, depth in enumerate(_depths(12))]
+    expected = _filtered(FilterChain(STAGES), frames)
+    assert expected[0].shape == (24, 32)
+
+    chain = FilterChain(STAGES, workers=3)
+    threads = set()
+    run = chain._run
+    chain._run = lambda frame, stats: (threads.add(threading.get_ident()), run(frame, stats))[1]
+    for result, reference in zip(_filtered(chain, frames), expected):
+        np.testing.assert_array_equal(result, reference)
+
+    # every pool thread ran blocks of its own, none of the chain's
+    assert len(chain._copies) == len(threads) > 1
+    blocks = [id(block) for copy in chain._copies for block in copy] + [id(stage[2]) for stage in chain.stages]
+    assert len(set(blocks)) == len(blocks)
+    chain.set_option('spatial', 'filter_smooth_alpha', 0.25)
+    assert all(copy[1].get_option(rs.option.filter_smooth_alpha) == pytest.approx(0.25) for copy in chain._copies)
+    chain.close()
+
+
+def test_stateful_filters_need_one_worker():
+    device = _DepthDevice()
+    chain = FilterChain([('temporal', {})], workers=2)
+    with pytest.raises(ValueError, match='workers=1'):
+        chain.process(device.frame(_depths(1)[0], 0))
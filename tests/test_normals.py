@@ -0,0 +1,48 @@
+""" - viewer normals (utils/normals.py) against the former np.gradient + np.cross code
+"""
+import numpy as np
+import pytest
+
+from utils import NormalEstimator
+
+
+def normals_gradient(verts):
+    # the former pyglet_pointcloud_viewer.py implementation
+    dy, dx = np.gradient(verts, axis=(0, 1))
+    return np.cross(dx, dy)
+
+
+def _verts(height=48, width=64, seed=0):
+    """A wavy, noisy surface about 1 m in front of the camera, as rs.pointcloud vertices"""
+    v, u = np.mgrid[0:height, 0:width].astype(np.float32)
+    z = 1.0 + 0.05 * np.sin(u / 5) * np.cos(v / 4) + np.random.default_rng(seed).normal(0, 0.002, (height, width))
+    return np.stack([(u - width / 2) / 60 * z, (v - height / 2) / 60 * z, z], axis=-1).astype(np.float32)
+
+
+@pytest.mark.parametrize('shape', [(48, 64), (3, 3), (7, 5)], ids=str)
+def test_matches_gradient_cross(shape):
+    verts = _verts(*shape)
+    # differences are twice np.gradient's, so the normals are 4 times as long, same direction
+    np.testing.assert_allclose(NormalEstimator()(verts), 4 * normals_gradient(verts), rtol=1e-4, atol=1e-7)
+
+
+@pytest.mark.parametrize('step', [2, 3])
+def test_step_repeats_the_coarse_normals(step):
+    verts = _verts(47, 64) # not a multiple of 2 or 3
+    normals = NormalEstimator(step)(verts)
+    coarse = 4 * normals_gradient(verts[::step, ::step])
+    nearest = coarse.repeat(step, axis=0).repeat(step, axis=1)[:47, :64]
+    np.testing.assert_allclose(normals, nearest, rtol=1e-4, atol=1e-7)
+
+
+def test_out_and_frame_id():
+    estimator = NormalEstimator()
+    verts = _verts()
+    out = np.empty_like(verts)
+    assert estimator(verts, frame_id=1, out=out) is out
+    assert estimator(_verts(seed=1), frame_id=1) is out # same frame: not computed again
+    again = estimator(_verts(seed=1), frame_id=2)
+    assert again is not out
+    np.testing.assert_allclose(again, 4 * normals_gradient(_verts(seed=1)), rtol=1e-4, atol=1e-7)
+    with pytest.raises(ValueError, match='too small'):
+        NormalEstimator(step=2)(_verts(4, 64))
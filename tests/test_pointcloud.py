@@ -0,0 +1,81 @@
+""" - point clouds of a stored synthetic take (utils/pointcloud.py convertTake, utils/take.py)
+"""
+import re
+import os.path as osp
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from utils import Deprojector, convertTake
+from utils.take import TakeWriter, TakeReader
+
+
+INTRINSICS = {'width': 8, 'height': 6, 'fx': 10.0, 'fy': 10.0, 'ppx': 4.0, 'ppy': 3.0, 'model': 'none', 'coeffs': [0.0] * 5}
+CALIBRATION = {'depth_intrinsics': INTRINSICS, 'color_intrinsics': INTRINSICS,
+               'depth_to_color': {'rotation': [1, 0, 0, 0, 1, 0, 0, 0, 1], 'translation': [0.0, 0.0, 0.0]},
+               'depth_scale': 0.001}
+GREY = 153
+
+
+def _depth():
+    """1000 (1 m) on the left half, the clipped grey background on the right, one hole"""
+    depth = np.full((6, 8), 1000, dtype=np.uint16)
+    depth[:, 4:] = GREY
+    depth[0, 0] = 0
+    return depth
+
+
+def _take(directory, aligned=True, **clip):
+    """Two frames of one camera; `clip`: add_camera(depth_clip=...) (none: metric depth)"""
+    take = TakeWriter(str(directory), SimpleNamespace(cls_name='test', ID=0), 1, capacity=2)
+    take.add_camera('c1', {'rgb': ((6, 8, 3), 'uint8'), 'depth': ((6, 8), 'uint16')},
+                    depth_scale=0.001, calibration=CALIBRATION, aligned=aligned, **clip)
+    for k in range(2):
+        take.append('c1', {'rgb': np.full((6, 8, 3), k, np.uint8), 'depth': _depth()}, {'frame_number': k})
+    take.close()
+    return str(directory)
+
+
+def _cloud(filename):
+    """z of the points of a binary PLY written by writePLY"""
+    with open(filename, 'rb') as f:
+        data = f.read()
+    header, body = data.split(b'end_header\n', 1)
+    count = int(re.search(rb'element vertex (\d+)', header).group(1))
+    return np.frombuffer(body, dtype=[('xyz', '<f4', 3), ('rgb', 'u1', 3)], count=count)['xyz'][:, 2]
+
+
+@pytest.mark.parametrize('aligned', [True, False], ids=['aligned', 'software_aligned'])
+def test_clipped_take_has_no_background_points(tmp_path, aligned):
+    directory = _take(tmp_path / 'take', aligned=aligned, depth_clip={'grey_color': GREY})
+    assert TakeReader(directory).clipValue('c1') == GREY
+    assert convertTake(directory, processes=1) == {'c1': 2}
+    for k in range(2):
+        z = _cloud(osp.join(directory, 'cloud', 'c1', f"{k:06d}.ply"))
+        np.testing.assert_allclose(z, 1.0) # none at 153 mm
+        if aligned:
+            assert len(z) == 6 * 4 - 1 # left half, minus the hole
+
+
+@pytest.mark.parametrize('clip', [{}, {'depth_clip': None}], ids=['default', 'explicit'])
+def test_metric_take_keeps_every_measurement(tmp_path, clip):
+    directory = _take(tmp_path / 'take', **clip)
+    assert TakeReader(directory).clipValue('c1') is None
+    convertTake(directory, processes=1)
+    z = _cloud(osp.join(directory, 'cloud', 'c1', '000000.ply'))
+    assert len(z) == 6 * 8 - 1 and np.isclose(z, GREY * 0.001).sum() == 6 * 4 # 153 mm is a measurement here
+
+
+def test_depth_clip_needs_grey_color(tmp_path):
+    take = TakeWriter(str(tmp_path / 'take'), SimpleNamespace(cls_name='test', ID=0), 1, capacity=1)
+    with pytest.raises(ValueError, match='grey_color'):
+        take.add_camera('c1', {'depth': ((6, 8), 'uint16')}, depth_clip={'clipping_distance': 1.0})
+
+
+def test_deprojector_invalid():
+    deproject = Deprojector(INTRINSICS, depth_scale=0.001)
+    points, _ = deproject(_depth(), invalid=GREY)
+    assert len(points) == 6 * 4 - 1
+    np.testing.assert_allclose(points[:, 2], 1.0)
+    assert len(deproject(_depth())[0]) == 6 * 8 - 1
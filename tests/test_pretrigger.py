@@ -0,0 +1,141 @@
+""" - pre-trigger history (utils/pretrigger.py) and the writers' backpressure policies (utils/recorder.py)
+"""
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from utils import PreTriggerRing, WriterPool
+
+
+def _frames(k):
+    return {'rgb': np.full((4, 6, 3), k, np.uint8), 'depth': np.full((4, 6), k, np.uint16)}
+
+
+def _ring(capacity=6, history=4):
+    return PreTriggerRing({key: (image.shape, image.dtype) for key, image in _frames(0).items()}, capacity, history)
+
+
+# === PreTriggerRing === #
+
+def test_for_frames_cap():
+    frames = _frames(0)
+    frame_bytes = sum(image.nbytes for image in frames.values()) + 24 # + index entry
+    ring = PreTriggerRing.forFrames(frames, seconds=1.0, fps=30.0, max_bytes=10 * frame_bytes)
+    assert (ring.history, ring.capacity) == (5, 10) # the headroom takes at most half the slots
+    assert PreTriggerRing.forFrames(frames, seconds=1.0, fps=30.0, max_bytes=frame_bytes).history == 1
+    with pytest.raises(ValueError, match='max_bytes'):
+        PreTriggerRing.forFrames(frames, seconds=1.0, fps=30.0, max_bytes=frame_bytes - 1)
+
+
+def test_history_keeps_the_newest_frames():
+    ring = _ring()
+    for k in range(10):
+        ring.push(_frames(k), {'frame_number': k})
+    assert len(ring) == ring.history == 4
+    written = []
+    ring.flush(lambda images, meta: written.append((int(images['depth'][0, 0]), meta['frame_number'])))
+    ring.wait()
+    assert written == [(k, k) for k in range(6, 10)] # oldest first
+    assert not ring.queue(_frames(10)) # caught up: the caller writes live frames itself
+
+
+def test_live_frames_queue_behind_the_history():
+    ring = _ring()
+    for k in range(4):
+        ring.push(_frames(k), {'frame_number': k})
+    release, written = threading.Event(), []
+    def write(images, meta):
+        release.wait(5)
+        written.append(meta['frame_number'])
+    ring.flush(write)
+    queued = [ring.queue(_frames(k), {'frame_number': k}) for k in range(4, 8)]
+    assert queued == [True] * 4 # queued, or dropped while the ring is full
+    assert ring.dropped == 2    # 6 slots: the history and 2 live frames; the write holds the first slot
+    release.set()
+    ring.wait()
+    assert written == [0, 1, 2, 3, 4, 5]
+
+
+# === WriterPool policies === #
+
+class _SlowSink:
+    def __init__(self):
+        self.go = threading.Event()
+        self.frames = []
+
+    def write(self, frame):
+        self.go.wait(5)
+        self.frames.append(frame)
+
+    def release(self):
+        pass
+
+
+def test_policy_override_blocks_instead_of_dropping():
+    pool = WriterPool(maxsize=1, policy='drop_newest')
+    sink = _SlowSink()
+    pool.open('s', sink)
+    pool.write('s', 0)
+    while pool.writers['s'].qsize(): # the writer took frame 0 and waits in the sink
+        time.sleep(0.001)
+    assert pool.write('s', 1)     # queued
+    assert not pool.write('s', 2) # full: the stream's own policy drops it
+
+    done = threading.Event()
+    threading.Thread(target=lambda: (pool.write('s', 3, policy='block'), done.set()), daemon=True).start()
+    assert not done.wait(0.2) # waits for room instead of dropping
+    sink.go.set()
+    assert done.wait(5)
+    stats = pool.close()
+    assert sink.frames == [0, 1, 3] and stats['s']['dropped'] == 1
+    with pytest.raises(ValueError):
+        pool.open('t', _SlowSink()).put(0, policy='drop')
+    pool.close()
+
+
+class _FailingSink(_SlowSink):
+    def write(self, frame):
+        if frame == 0:
+            raise IOError("disk full")
+        super().write(frame)
+
+
+def test_block_drops_after_a_sink_error():
+    pool = WriterPool(maxsize=1, policy='block')
+    sink = _FailingSink()
+    writer = pool.open('s', sink)
+    writer.put(0)
+    while writer.error is None:
+        time.sleep(0.001)
+    writer.put(1)
+    while writer.qsize(): # the writer waits in the sink with frame 1
+        time.sleep(0.001)
+    assert writer.put(2)     # room
+    assert not writer.put(3) # full and the sink failed: dropped at once, the queue stays bounded
+    assert writer.qsize() == 1
+    sink.go.set()
+    stats = pool.close()
+    assert sink.frames == [1, 2] and stats['s'] == {'written': 2, 'dropped': 2, 'queued': 0}
+
+
+def test_close_wakes_a_blocked_producer():
+    pool = WriterPool(maxsize=1, policy='block')
+    sink = _SlowSink()
+    writer = pool.open('s', sink)
+    writer.put(0)
+    while writer.qsize():
+        time.sleep(0.001)
+    writer.put(1)
+    result = []
+    producer = threading.Thread(target=lambda: result.append(writer.put(2)), daemon=True)
+    producer.start()
+    closer = threading.Thread(target=pool.close, daemon=True)
+    time.sleep(0.05)
+    closer.start()
+    producer.join(5)
+    assert result == [False] # dropped by close(), not appended to the flushing queue
+    sink.go.set()
+    closer.join(5)
+    assert not closer.is_alive() and sink.frames == [0, 1]
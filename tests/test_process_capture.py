@@ -0,0 +1,120 @@
+""" - shared-memory frame rings and process-per-camera capture (utils/process_capture.py)
+"""
+import time
+import functools
+from multiprocessing import resource_tracker
+
+import numpy as np
+import pytest
+
+from utils import FrameRing, ProcessCaptureGroup
+
+
+LAYOUT = {'color': ((6, 8, 3), np.uint8), 'depth': ((6, 8), np.uint16), 'sum': ((1,), np.int64)}
+
+
+# === FrameRing === #
+
+def test_ring_round_trip():
+    ring = FrameRing(LAYOUT, slots=3)
+    try:
+        for slot in range(3):
+            arrays = ring.arrays(slot)
+            arrays['color'][:] = slot
+            arrays['depth'][:] = 1000 + slot
+            arrays['sum'][0] = -slot
+            assert all(array.ctypes.data % 64 == 0 for array in arrays.values()) # cache-line aligned
+
+        other = FrameRing(*ring.describe(), track=False) # as a camera / main process maps it
+        resource_tracker.register(ring.shm._name, 'shared_memory') # one tracker here for both, see test_shm_stream.py
+        assert not other.owner and other.layout == ring.layout
+        for slot in range(3):
+            arrays = other.arrays(slot)
+            assert (arrays['color'] == slot).all() and (arrays['depth'] == 1000 + slot).all() and arrays['sum'][0] == -slot
+        other.arrays(1)['depth'][2, 3] = 7 # the same memory
+        assert ring.arrays(1)['depth'][2, 3] == 7
+        other.close()
+    finally:
+        ring.close()
+
+
+# === ProcessCaptureGroup === #
+# open_fn / read_fn run in the spawned camera processes, so they are module-level
+
+class _Counter:
+    def __init__(self, index):
+        self.index = index
+        self.count = 0
+
+    def stop(self):
+        pass
+
+
+class _Sum:
+    """processor: 'sum' = the depth's sum + offset"""
+    offset = 0
+
+    def layout(self, images):
+        return {'sum': ((1,), np.int64)}
+
+    def set_offset(self, offset):
+        self.offset = offset
+
+    def __call__(self, arrays):
+        arrays['sum'][0] = int(arrays['depth'].sum()) + self.offset
+
+
+def _read(pipeline, *options, meta=None, stats=None):
+    time.sleep(0.002)
+    pipeline.count += 1
+    k = 100 * pipeline.index + pipeline.count % 100
+    if meta is not None:
+        meta['frame_number'] = pipeline.count
+    return np.full((6, 8, 3), k % 256, np.uint8), np.full((6, 8), k, np.uint16), None, None
+
+
+def _open(index, fail=False):
+    if fail:
+        raise ValueError(f"no camera {index}")
+    return _Counter(index), [], {'serial': f"cam{index}", 'depth_scale': 0.001}, _Sum()
+
+
+def _check(packet, index, offset=0):
+    color, depth, leftIR, rightIR = packet.images
+    k = 100 * index + packet.meta['frame_number'] % 100 # what the camera process wrote
+    assert packet.serial == f"cam{index}" and leftIR is None and rightIR is None
+    assert (depth == k).all() and (color == k % 256).all()
+    assert packet.outputs['sum'][0] == depth.size * k + offset
+
+
+def test_latest_reads_back_what_was_written():
+    group = ProcessCaptureGroup(_open, 2, slots=3, read_fn=_read).start()
+    try:
+        assert [info['serial'] for info in group.info] == ['cam0', 'cam1']
+        seqs = []
+        for _ in range(20):
+            packets = group.latest()
+            time.sleep(0.005) # the cameras keep writing the other slots meanwhile
+            for index, packet in enumerate(packets):
+                _check(packet, index) # the held slot is not overwritten
+            seqs.append([packet.seq for packet in packets])
+        assert seqs[-1][0] > seqs[0][0] and seqs[-1][1] > seqs[0][1]
+
+        group.broadcast('set_offset', 5)
+        deadline = time.monotonic() + 5
+        while not all(packet.outputs['sum'][0] % 48 == 5 for packet in group.latest()): # 48 pixels
+            assert time.monotonic() < deadline, "the processors did not get the call"
+            time.sleep(0.005)
+        for index, packet in enumerate(group.latest()):
+            _check(packet, index, offset=5)
+    finally:
+        group.stop()
+
+
+def test_open_error_is_raised():
+    group = ProcessCaptureGroup(functools.partial(_open, fail=True), 1)
+    try:
+        with pytest.raises(RuntimeError, match="no camera 0"):
+            group.start()
+    finally:
+        group.stop()
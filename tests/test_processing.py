@@ -0,0 +1,61 @@
+""" - depth clipping and colorizing (utils/processing.py) against the former np.where / cv2 code
+"""
+import numpy as np
+import cv2
+import pytest
+
+from utils import DepthClipper, DepthColorizer
+
+
+def clip_where(depth_img, clipping_distance, grey_color=153):
+    # the former getFrames() implementation
+    return np.where((depth_img > clipping_distance) | (depth_img <= 0), grey_color, depth_img)
+
+
+def _depth(shape=(48, 64), clip=1500):
+    rng = np.random.default_rng(0)
+    depth = rng.integers(0, 4000, shape, dtype=np.uint16)
+    edges = np.clip([int(clip) - 1, int(clip), int(clip) + 1], 0, 65535)
+    depth.flat[:8] = [0, 1, *edges, 65534, 65535, 153]
+    return depth
+
+
+@pytest.mark.parametrize('clip', [1500, 1500.5, 0, 0.5, 65535], ids=str)
+def test_clipper_matches_np_where(clip):
+    depth = _depth(clip=clip)
+    expected = clip_where(depth, clip)
+    clipper = DepthClipper(clip)
+    np.testing.assert_array_equal(clipper(depth), expected)
+
+    work = depth.copy()
+    assert clipper(work, out=work) is work # in place
+    np.testing.assert_array_equal(work, expected)
+
+
+def test_clipper_buffers():
+    clipper = DepthClipper(1500, grey_color=0, buffers=2)
+    first, second, third = (clipper(_depth()) for _ in range(3))
+    assert first is not second and third is first # the next buffer in turn
+    np.testing.assert_array_equal(second, clip_where(_depth(), 1500, grey_color=0))
+    assert clipper(_depth((24, 32))).shape == (24, 32) # a new size gets new buffers
+
+
+@pytest.mark.parametrize('colormap', [cv2.COLORMAP_JET, cv2.COLORMAP_BONE], ids=['jet', 'bone'])
+@pytest.mark.parametrize('alpha', [0.03, 0.5])
+def test_colorizer_matches_apply_color_map(colormap, alpha):
+    depth = _depth()
+    depth.flat[8:11] = [65535, 255 / alpha, 256 / alpha] # saturation of convertScaleAbs
+    expected = cv2.applyColorMap(cv2.convertScaleAbs(depth, alpha=alpha), colormap)
+    colorizer = DepthColorizer(alpha=alpha, colormap=colormap)
+    np.testing.assert_array_equal(colorizer(depth), expected)
+
+    out = np.empty((*depth.shape, 3), np.uint8)
+    assert colorizer(depth, out=out) is out
+    np.testing.assert_array_equal(out, expected)
+
+
+def test_colorizer_set_colormap():
+    depth = _depth()
+    colorizer = DepthColorizer(alpha=0.03, colormap=cv2.COLORMAP_JET)
+    colorizer.set_colormap(cv2.COLORMAP_BONE, alpha=0.1)
+    np.testing.assert_array_equal(colorizer(depth), cv2.applyColorMap(cv2.convertScaleAbs(depth, alpha=0.1), cv2.COLORMAP_BONE))
@@ -0,0 +1,55 @@
+""" - shared-memory fan-out (utils/shm_stream.py) and ShmSource within one process
+"""
+import os
+
+import numpy as np
+import pytest
+from multiprocessing import resource_tracker
+
+from utils import FramePublisher, FrameSubscriber
+from utils.sources import ShmSource
+
+
+def _retrack(publisher):
+    # publisher and subscriber share this process' resource tracker: attaching took the
+    # publisher's block off it, and close() would report the unlink as unknown
+    resource_tracker.register(publisher.ring.shm._name, 'shared_memory')
+
+
+def _images(k):
+    return (np.full((4, 6, 3), k, np.uint8), np.full((4, 6), k, np.uint16), None, None)
+
+
+@pytest.fixture
+def publisher():
+    pub = FramePublisher(f"test{os.getpid()}", slots=3, info={'depth_scale': 0.001})
+    pub.publish(_images(1), {'frame_number': 1})
+    yield pub
+    pub.close()
+
+
+def test_views_are_invalidated_when_the_slot_is_reused(publisher):
+    sub = FrameSubscriber(publisher.info['serial'], timeout=1.0)
+    _retrack(publisher)
+    frame = sub.next(timeout=1.0)
+    assert frame.seq == 1 and frame.valid() and frame.images['depth'][0, 0] == 1
+    assert frame.meta['frame_number'] == 1
+    for k in range(2, 4): # slots - 1 more frames: still intact
+        publisher.publish(_images(k), {'frame_number': k})
+    assert frame.valid()
+    publisher.publish(_images(4), {'frame_number': 4}) # the slot of frame 1 is taken again
+    assert not frame.valid()
+    assert sub.seqs.ctypes.data % 8 == 0 # the sequence words are aligned int64
+    sub.close()
+
+
+def test_shm_source_copies(publisher):
+    source = ShmSource(publisher.info['serial'], timeout=1.0)
+    _retrack(publisher)
+    frames = source.wait_for_frames(1000)
+    for k in range(2, 8): # the publisher laps its ring twice
+        publisher.publish(_images(k), {'frame_number': k})
+    depth = np.asanyarray(frames.get_depth_frame().get_data())
+    color = np.asanyarray(frames.get_color_frame().get_data())
+    assert depth[0, 0] == 1 and color[0, 0, 0] == 1
+    source.stop()
@@ -0,0 +1,74 @@
+""" - per-camera stream selection from config.yaml (utils/realsense_utils.py streamConfig / validateStreams)
+"""
+import pyrealsense2 as rs
+import pytest
+from omegaconf import OmegaConf
+
+from utils import streamConfig, validateStreams, DEFAULT_STREAMS
+
+
+CONFIG = OmegaConf.create("""
+default:
+  depth: {width: 640, height: 480, fps: 30, format: z16}
+  color: {width: 640, height: 480, fps: 30, format: bgr8}
+  infrared_1: {width: 640, height: 480, fps: 30, format: y8}
+'123456789012':
+  depth: {width: 848, height: 480, fps: 90}
+'210987654321':
+  depth: {}
+  color: {format: yuyv}
+""")
+
+
+def _device(serial='123456789012'):
+    """Software device offering the modes of (stream, index, width, height, fps, format) below"""
+    modes = [(rs.stream.depth, 0, 640, 480, 30, rs.format.z16), (rs.stream.depth, 0, 848, 480, 90, rs.format.z16),
+             (rs.stream.infrared, 1, 640, 480, 30, rs.format.y8), (rs.stream.infrared, 2, 640, 480, 30, rs.format.y8),
+             (rs.stream.color, 0, 640, 480, 30, rs.format.bgr8), (rs.stream.color, 0, 640, 480, 30, rs.format.yuyv)]
+    device = rs.software_device()
+    sensors = {'stereo': device.add_sensor("Stereo Module"), 'rgb': device.add_sensor("RGB Camera")}
+    for uid, (stream_type, index, width, height, fps, fmt) in enumerate(modes):
+        stream = rs.video_stream()
+        stream.type, stream.index, stream.uid = stream_type, index, uid
+        stream.width, stream.height, stream.fps, stream.fmt = width, height, fps, fmt
+        stream.bpp = 3 if fmt == rs.format.bgr8 else 1 if fmt == rs.format.y8 else 2
+        stream.intrinsics = rs.intrinsics()
+        sensors['rgb' if stream_type == rs.stream.color else 'stereo'].add_video_stream(stream)
+    device.register_info(rs.camera_info.serial_number, serial)
+    return device
+
+
+def test_stream_config_selection():
+    default = streamConfig(CONFIG, serial='000000000000') # no entry of its own
+    assert list(default) == ['depth', 'color', 'infrared_1'] and default['color']['format'] == 'bgr8'
+
+    fast = streamConfig(CONFIG, serial=123456789012) # the serial as a number works too
+    assert fast == {'depth': {'width': 848, 'height': 480, 'fps': 90, 'format': 'z16'}}
+
+    yuyv = streamConfig(CONFIG, serial='210987654321') # missing fields from DEFAULT_STREAMS
+    assert yuyv == {'depth': DEFAULT_STREAMS['depth'], 'color': dict(DEFAULT_STREAMS['color'], format='yuyv')}
+
+    assert streamConfig(None) == DEFAULT_STREAMS
+    assert streamConfig({'other': {'depth': {}}}, serial='1') == DEFAULT_STREAMS # no 'default' entry
+
+
+def test_stream_config_unknown_stream():
+    with pytest.raises(ValueError, match="Unknown stream 'infrared'"):
+        streamConfig({'default': {'infrared': {}}})
+
+
+@pytest.mark.parametrize('serial', ['000000000000', '123456789012', '210987654321'])
+def test_validate_supported_streams(serial):
+    validateStreams(_device(serial), streamConfig(CONFIG, serial=serial))
+    validateStreams(_device(), DEFAULT_STREAMS) # both IR streams by their index
+
+
+@pytest.mark.parametrize('streams, message', [
+    ({'depth': dict(DEFAULT_STREAMS['depth'], fps=60)}, r"depth 640x480@60 z16 is not supported; supported: 640x480@30 z16, 848x480@90 z16"),
+    ({'color': dict(DEFAULT_STREAMS['color'], width=1280, height=720)}, r"color 1280x720@30 bgr8 is not supported"),
+    ({'infrared_1': dict(DEFAULT_STREAMS['infrared_1'], format='y16')}, r"infrared_1 640x480@30 y16 is not supported"),
+], ids=['fps', 'resolution', 'format'])
+def test_validate_unsupported_streams(streams, message):
+    with pytest.raises(ValueError, match=message) as error:
+        validateStreams(_device(), streams)
+    assert str(error.value).startswith("123456789012: ")
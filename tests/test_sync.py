@@ -0,0 +1,54 @@
+""" - timestamp matching (utils/sync.py) on synthetic timestamps
+"""
+import pytest
+
+from utils import FrameSynchronizer
+
+
+def _sync(**kwargs):
+    return FrameSynchronizer(['c1', 'c2'], timestamp=lambda t: t, **kwargs)
+
+
+def test_pairs_within_tolerance():
+    sync = _sync(tolerance_ms=5)
+    for t in (0.0, 33.3, 66.7):
+        sync.push('c1', t)
+        sync.push('c2', t + 2.0)
+    assert [sync.pop() for _ in range(3)] == [{'c1': t, 'c2': t + 2.0} for t in (0.0, 33.3, 66.7)]
+    assert sync.pop() is None
+    assert sync.stats()['skew_ms_max'] == pytest.approx(2.0)
+
+
+def test_unmatchable_frames_are_dropped():
+    sync = _sync(tolerance_ms=5)
+    sync.push('c1', 0.0)    # c2 lost this one
+    sync.push('c1', 33.0)
+    sync.push('c2', 34.0)
+    assert sync.pop() == {'c1': 33.0, 'c2': 34.0}
+    assert sync.dropped == {'c1': 1, 'c2': 0}
+
+
+def test_out_of_order_frames_are_rejected():
+    sync = _sync(tolerance_ms=5)
+    sync.push('c1', 10.0)
+    sync.push('c1', 10.0) # repeated
+    sync.push('c1', 5.0)  # older than a buffered one
+    sync.push('c2', 11.0)
+    assert sync.pop() == {'c1': 10.0, 'c2': 11.0}
+
+    # the buffers are empty now; late frames must not be paired again
+    sync.push('c1', 9.0)
+    sync.push('c2', 10.5)
+    sync.push('c1', 10.0)
+    assert sync.pop() is None
+    assert sync.dropped == {'c1': 4, 'c2': 1}
+
+
+def test_window_overflow():
+    sync = _sync(tolerance_ms=1, window=3)
+    for t in range(5):
+        sync.push('c1', float(t * 10))
+    assert sync.stats()['buffered']['c1'] == 3
+    assert sync.dropped['c1'] == 2
+    sync.push('c2', 40.0)
+    assert sync.pop_latest() == {'c1': 40.0, 'c2': 40.0}
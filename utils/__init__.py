@@ -1,5 +1,24 @@
-from .realsense_utils import getCamera, getDeviceSerial, getFrames, depth_options, emitter_options
-
+from .realsense_utils import getCamera, getDeviceSerial, getFrames, depth_options, emitter_options, timestamp_options, \
+                             clipDepth, getDepthScale, streamConfig, validateStreams, colorToBGR, DEFAULT_STREAMS
+from .capture import CaptureWorker, CaptureGroup, FramePacket, LatestSlot
+from .sync import FrameSynchronizer, SyncedCapture
+from .recorder import WriterPool, StreamWriter
+from .depth_io import RawDepthWriter, readRawDepth, loadRawDepthMeta
+from .take import TakeWriter, TakeReader, takePath
+from .processing import DepthClipper, DepthColorizer, DisplayProcessor
+from .display import Mosaic
+from .control import ControlServer, PreviewThread
+from .sources import LiveSource, BagSource, TakeSource, SyntheticSource, ShmSource, openSource, enableSource
+from .metrics import Metrics, CameraMetrics, MetricsReporter, MetricsServer
+from .align import SoftwareAligner, getCalibration
+from .pointcloud import Deprojector, CloudSink, writeCloud, convertTake
+from .fusion import RigFusion, loadRig, voxelDownsample
+from .normals import NormalEstimator
+from .filters import FilterChain
+from .process_capture import ProcessCaptureGroup, FrameRing
+from .shm_stream import FramePublisher, FrameSubscriber
+from .devices import DeviceManager
+from .pretrigger import PreTriggerRing
 
 
 
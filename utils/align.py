@@ -0,0 +1,277 @@
+""" - software depth-to-color alignment with cached per-camera tables
+
+Same mapping as rs.align(rs.stream.color) (librealsense align_images): every depth pixel is
+deprojected at its two corners, moved into the color camera and projected; the depth value
+fills the covered color pixels and the nearest one wins. What depends only on the calibration,
+the corner rays rotated into the color frame, is computed once per camera, so a frame costs a
+few vectorized NumPy passes into buffers allocated with the aligner. Per frame only
+np.minimum.at allocates, a few KiB of its own (benchmarks/align_bench.py reports the peak);
+the planes of the nearest-wins merge are regrown only for a larger pixel footprint than the
+one estimated from the calibration.
+
+    aligner = SoftwareAligner.fromProfile(profile)              # live / bag
+    aligner = SoftwareAligner.fromDict(take.meta['cameras']['c1']['calibration'])  # stored
+    aligned = aligner(depth_img)                                # (color_h, color_w) uint16
+    aligned = aligner.align_batch(take.stream('c1', 'depth'))   # offline, a whole take
+"""
+import numpy as np
+import pyrealsense2 as rs
+
+
+# === Calibration (stored as plain dicts, e.g. in a take's meta.json) === #
+
+def intrinsicsToDict(intrinsics) -> dict:
+    return {'width': intrinsics.width, 'height': intrinsics.height,
+            'fx': intrinsics.fx, 'fy': intrinsics.fy, 'ppx': intrinsics.ppx, 'ppy': intrinsics.ppy,
+            'model': str(intrinsics.model).split('.')[-1], 'coeffs': list(intrinsics.coeffs)}
+
+
+def extrinsicsToDict(extrinsics) -> dict:
+    # rotation is column-major, as in librealsense
+    return {'rotation': list(extrinsics.rotation), 'translation': list(extrinsics.translation)}
+
+
+def getCalibration(profile) -> dict:
+    """Depth / color intrinsics, depth->color extrinsics and depth scale of a started pipeline"""
+    depth_profile = profile.get_stream(rs.stream.depth).as_video_stream_profile()
+    color_profile = profile.get_stream(rs.stream.color).as_video_stream_profile()
+    return {'depth_intrinsics': intrinsicsToDict(depth_profile.get_intrinsics()),
+            'color_intrinsics': intrinsicsToDict(color_profile.get_intrinsics()),
+            'depth_to_color': extrinsicsToDict(depth_profile.get_extrinsics_to(color_profile)),
+            'depth_scale': profile.get_device().first_depth_sensor().get_depth_scale()}
+
+
+# === Distortion models (rs2_deproject_pixel_to_point / rs2_project_point_to_pixel) === #
+
+def _undistort(x, y, intr):
+    model, c = intr['model'], intr['coeffs']
+    if model in ('inverse_brown_conrady', 'brown_conrady'):
+        # iterated to convergence as in librealsense (10 iterations)
+        xo, yo = x, y
+        for _ in range(10):
+            r2 = x * x + y * y
+            icdist = 1 / (1 + ((c[4] * r2 + c[1]) * r2 + c[0]) * r2)
+            xq, yq = x / icdist, y / icdist
+            delta_x = 2 * c[2] * xq * yq + c[3] * (r2 + 2 * xq * xq)
+            delta_y = 2 * c[3] * xq * yq + c[2] * (r2 + 2 * yq * yq)
+            x, y = (xo - delta_x) * icdist, (yo - delta_y) * icdist
+        return x, y
+    if model != 'none' and any(c):
+        raise ValueError(f"Cannot deproject from '{model}' intrinsics")
+    return x, y
+
+
+def _distort(x, y, intr, scratch=None):
+    """In place on x, y (normalized image coordinates). Like rs.align, only the forward
+    (modified) Brown-Conrady model is applied when projecting into the color image.
+    `scratch`: four arrays like x for the terms (default: allocated); same order of
+    operations as rs2_project_point_to_pixel."""
+    c = [float(k) for k in intr['coeffs']]
+    r2, f, a, b = scratch if scratch is not None else [np.empty_like(x) for _ in range(4)]
+    np.multiply(x, x, out=r2)
+    np.multiply(y, y, out=a)
+    r2 += a
+    np.multiply(r2, c[0], out=f) # f = 1 + c0 r2 + c1 r2^2 + c4 r2^3
+    f += 1
+    np.multiply(r2, c[1], out=a)
+    a *= r2
+    f += a
+    np.multiply(r2, c[4], out=a)
+    a *= r2
+    a *= r2
+    f += a
+    x *= f
+    y *= f
+    xy = np.multiply(x, y, out=f)
+    np.multiply(xy, 2 * c[2], out=a) # dx = x + 2 c2 xy + c3 (r2 + 2 x^2)
+    a += x
+    np.multiply(x, 2, out=b)
+    b *= x
+    b += r2
+    b *= c[3]
+    a += b
+    np.multiply(y, 2, out=b)         # dy = y + 2 c3 xy + c2 (r2 + 2 y^2)
+    b *= y
+    b += r2
+    b *= c[2]
+    xy *= 2 * c[3]
+    y += xy
+    y += b
+    np.copyto(x, a)
+
+
+# === Aligner === #
+
+class SoftwareAligner:
+    """Align z16 depth to the color image of one camera; `aligner(depth) -> aligned depth`.
+
+    The returned array is the aligner's own buffer (overwritten by the next call) unless `out`
+    is given, or `copy=True` for a new array per frame.
+    """
+    def __init__(self, depth_intrinsics, color_intrinsics, depth_to_color, depth_scale, copy=False):
+        self.depth_intrinsics = dict(depth_intrinsics)
+        self.color_intrinsics = dict(color_intrinsics)
+        self.depth_to_color = dict(depth_to_color)
+        self.depth_scale = float(depth_scale)
+        self.copy = copy
+
+        di, ci = self.depth_intrinsics, self.color_intrinsics
+        self.depth_shape = (di['height'], di['width'])
+        self.color_shape = (ci['height'], ci['width'])
+        n = di['height'] * di['width']
+
+        # Per-camera table: corner rays of every depth pixel, rotated into the color frame
+        # --------------------------------------------------------------------------------
+        R = np.asarray(depth_to_color['rotation'], dtype=np.float64).reshape(3, 3).T # column-major
+        t = np.asarray(depth_to_color['translation'], dtype=np.float64)
+        v, u = np.mgrid[0:di['height'], 0:di['width']].astype(np.float64)
+
+        # Without color distortion the intrinsics fold into the table as well:
+        # pixel_x + 0.5 = (ax * z + bx) / (az * z + bz), one multiply-add per term per frame
+        self._distorted = ci['model'] == 'modified_brown_conrady' and any(ci['coeffs'])
+        K = np.eye(3) if self._distorted else np.array([[ci['fx'], 0, ci['ppx'] + 0.5],
+                                                        [0, ci['fy'], ci['ppy'] + 0.5],
+                                                        [0, 0, 1]])
+        self._offset = (K @ t).astype(np.float32)
+        self._rays = []
+        for corner in (-0.5, 0.5): # top-left / bottom-right corner of the depth pixel
+            x, y = _undistort((u + corner - di['ppx']) / di['fx'], (v + corner - di['ppy']) / di['fy'], di)
+            rays = np.stack([x.ravel(), y.ravel(), np.ones(n)])
+            self._rays.append((K @ R @ rays).astype(np.float32)) # (3, n)
+
+        # Reused per-frame buffers
+        # ------------------------
+        f32 = lambda: np.empty(n, dtype=np.float32)
+        ip = lambda: np.empty(n, dtype=np.intp) # one integer type: mixed ones are cast through buffers
+        self._z, self._X, self._Y, self._Z = f32(), f32(), f32(), f32()
+        self._scratch = [f32() for _ in range(4)] if self._distorted else None
+        self._px = [(ip(), ip()) for _ in self._rays] # color pixel of each corner
+        self._ok = np.empty(n, dtype=bool)
+        self._mask = np.empty(n, dtype=bool)
+        self._spanx, self._spany = ip(), ip()   # size of the covered rectangle - 1
+        self._d = np.empty(n, dtype=np.uint16)
+        self._index = ip()
+        self._zbuf = np.empty(self.color_shape, dtype=np.uint16)
+        self._shift = np.empty(self.color_shape, dtype=np.uint16) # a plane shifted by one pixel
+
+        # One plane per rectangle size, sized for the footprint of a depth pixel at infinity
+        # (parallax only shrinks it) plus one color pixel for the rounding of the corners
+        with np.errstate(divide='ignore', invalid='ignore'):
+            far = [rays[:2] / rays[2] for rays in self._rays]
+        scale = np.array([[ci['fx']], [ci['fy']]]) if self._distorted else 1.0
+        span = np.nan_to_num((far[1] - far[0]) * scale, nan=0.0, posinf=0.0, neginf=0.0).max(axis=1)
+        self._planes = None # flat (rectangle sizes, color_h, color_w) + sink slot
+        self._reserve(int(span[0]) + 1, int(span[1]) + 1)
+
+    @classmethod
+    def fromDict(cls, calibration, **kwargs):
+        """From getCalibration() output (e.g. stored in a take's meta.json)"""
+        return cls(calibration['depth_intrinsics'], calibration['color_intrinsics'],
+                   calibration['depth_to_color'], calibration['depth_scale'], **kwargs)
+
+    @classmethod
+    def fromProfile(cls, profile, **kwargs):
+        return cls.fromDict(getCalibration(profile), **kwargs)
+
+    def _reserve(self, max_x, max_y):
+        """Planes for rectangles up to (max_x + 1) x (max_y + 1) color pixels; reallocated only
+        for a frame with a larger footprint than any before (objects very close to the camera)"""
+        size = (max_x + 1) * (max_y + 1) * self.color_shape[0] * self.color_shape[1]
+        if self._planes is None or self._planes.size <= size:
+            self._planes = np.empty(size + 1, dtype=np.uint16)
+        return size
+
+    def _project(self, rays, offset, px, py):
+        """Color pixel of the corner points at depth self._z, rounded as librealsense does"""
+        X, Y, Z, z = self._X, self._Y, self._Z, self._z
+        np.multiply(rays[2], z, out=Z)
+        Z += offset[2]
+        for dst, ray, b in ((X, rays[0], offset[0]), (Y, rays[1], offset[1])):
+            np.multiply(ray, z, out=dst)
+            dst += b
+            dst /= Z
+        if self._distorted:
+            ci = self.color_intrinsics
+            _distort(X, Y, ci, self._scratch)
+            X *= float(ci['fx']) # Python floats: NumPy float64 scalars would cast X through buffers
+            X += float(ci['ppx']) + 0.5
+            Y *= float(ci['fy'])
+            Y += float(ci['ppy']) + 0.5
+        np.copyto(px, X, casting='unsafe') # truncation, like static_cast<int>(pixel + 0.5f)
+        np.copyto(py, Y, casting='unsafe')
+
+    def __call__(self, depth, out=None):
+        if depth.shape != self.depth_shape:
+            raise ValueError(f"Depth image {depth.shape} does not match the intrinsics {self.depth_shape}")
+        depth = depth.reshape(-1)
+        height, width = self.color_shape
+
+        with np.errstate(divide='ignore', invalid='ignore'): # depth 0 -> nan; masked below
+            np.copyto(self._z, depth)
+            self._z *= np.float32(self.depth_scale)
+            for rays, (px, py) in zip(self._rays, self._px):
+                self._project(rays, self._offset, px, py)
+
+        # a depth pixel is used only if both corners land inside the color image
+        (x0, y0), (x1, y1) = self._px
+        spanx, spany = np.subtract(x1, x0, out=self._spanx), np.subtract(y1, y0, out=self._spany)
+        ok, skip = self._ok, self._mask
+        np.not_equal(depth, 0, out=ok)
+        for lo, hi, bound in ((x0, x1, width), (y0, y1, height)):
+            lo, hi = lo.view(np.uintp), hi.view(np.uintp) # negative -> huge: 0 <= lo <= hi < bound in two tests
+            ok &= np.less_equal(lo, hi, out=skip)
+            ok &= np.less(hi, bound, out=skip)
+        np.logical_not(ok, out=skip)
+        np.copyto(spanx, 0, where=skip)
+        np.copyto(spany, 0, where=skip)
+        max_x, max_y = int(spanx.max()), int(spany.max())
+
+        # Every depth pixel fills the color pixels [x0, x1] x [y0, y1] it covers; the nearest wins.
+        # Each one is scattered once, at (x0, y0) of the plane of its rectangle size; the planes
+        # are then widened by dense 1-pixel shifts (nested like Horner's rule) and merged,
+        # instead of one scatter per covered color pixel.
+        size = self._reserve(max_x, max_y)
+        plane_stack = self._planes[:size].reshape(-1, height, width)
+        plane_stack.fill(0xFFFF)
+
+        index = self._index
+        np.multiply(spany, max_x + 1, out=index)
+        index += spanx
+        index *= height
+        index += y0
+        index *= width
+        index += x0
+        np.copyto(index, size, where=skip) # past the planes: the sink slot
+        np.subtract(depth, 1, out=self._d) # 1..65535 -> 0..65534, so the empty 0xFFFF wraps to 0 below
+        np.minimum.at(self._planes, index, self._d)
+
+        # The shifts go through self._shift (np.minimum into an overlapping view of its own input
+        # copies the input first) on flat views (strided column slices are buffered); column 0
+        # wraps to the previous row, so it is copied back.
+        zbuf, shift, flat = self._zbuf, self._shift, self._shift.reshape(-1)
+        for sy in range(max_y, -1, -1):
+            rows = plane_stack[sy * (max_x + 1) + max_x]
+            for sx in range(max_x - 1, -1, -1):
+                np.minimum(rows.reshape(-1)[1:], rows.reshape(-1)[:-1], out=flat[1:]) # widen by one column
+                np.copyto(shift[:, 0], rows[:, 0])
+                np.minimum(shift, plane_stack[sy * (max_x + 1) + sx], out=rows)
+            if sy == max_y:
+                np.copyto(zbuf, rows)
+            else:
+                shift[0] = zbuf[0]
+                np.minimum(zbuf[1:], zbuf[:-1], out=shift[1:]) # widen by one row
+                np.minimum(shift, rows, out=zbuf)
+
+        if out is None:
+            out = np.empty(self.color_shape, dtype=np.uint16) if self.copy else self._zbuf
+        np.add(self._zbuf, 1, out=out) # 0xFFFF (no depth) -> 0
+        return out
+
+    def align_batch(self, depths, out=None):
+        """Align a stack of depth frames (N, h, w), e.g. TakeReader.stream(cam_id, 'depth').
+        `out` may be a (memory-mapped) (N, color_h, color_w) uint16 array."""
+        if out is None:
+            out = np.empty((len(depths),) + self.color_shape, dtype=np.uint16)
+        for k in range(len(depths)):
+            self(depths[k], out=out[k])
+        return out
@@ -0,0 +1,194 @@
+""" - threaded capture workers; one thread per realsense pipeline
+
+Each worker blocks on its own `wait_for_frames()` and keeps only the newest framesets
+in a small bounded queue, so a slow camera never stalls the others.
+"""
+import time
+import threading
+from collections import deque, namedtuple
+
+from .realsense_utils import getFrames
+
+
+# images  : (color_img, depth_img, leftIR_img, rightIR_img) as returned by getFrames()
+# seq     : running index of the frameset in this worker
+# host_ts : time.monotonic() when the frameset arrived
+# meta    : {'timestamp', 'domain', 'frame_number'} filled by getFrames()
+# outputs : {name: image} processed in a camera process (utils/process_capture.py), else None
+FramePacket = namedtuple('FramePacket', ['serial', 'seq', 'host_ts', 'images', 'meta', 'outputs'], defaults=(None,))
+
+
+class LatestSlot:
+    """Latest-value hand-off from one producer thread to one consumer without a lock.
+
+    put() publishes (seq, value) with a single reference assignment, which is atomic under
+    the GIL; get() returns the newest value it has not returned yet, or None, and never
+    blocks. A published value must not be modified afterwards (publish new arrays, or arrays
+    that keep the frames they view alive).
+    """
+    def __init__(self):
+        self._item = (0, None)
+        self._seen = 0
+        self.skipped = 0 # values replaced before the consumer got them
+
+    def put(self, value):
+        self._item = (self._item[0] + 1, value)
+
+    def get(self):
+        seq, value = self._item
+        if seq == self._seen:
+            return None
+        self.skipped += seq - self._seen - 1
+        self._seen = seq
+        return value
+
+
+class CaptureWorker(threading.Thread):
+    """Read framesets from one pipeline in a background thread.
+
+    `pipeline` is anything with a `wait_for_frames()` (e.g. rs.pipeline or a fake one for testing),
+    `read_fn(pipeline, *options, meta=dict)` converts it into images (default: getFrames).
+    With `metrics` (utils.metrics.Metrics) the read stages, frame rate, drops and the
+    queue depth are reported under the camera's serial; read_fn then also gets `stats=`.
+    """
+    def __init__(self, pipeline, options, serial=None, maxsize=2, read_fn=getFrames, metrics=None):
+        super().__init__(name=f"capture-{serial}", daemon=True)
+        self.pipeline = pipeline
+        self.options = options
+        self.serial = serial
+        self.read_fn = read_fn
+        self.stats = None
+        if metrics is not None:
+            self.stats = metrics.camera(serial)
+            metrics.gauge(serial, 'capture_queue', self.qsize)
+
+        self._queue = deque(maxlen=maxsize) # bounded; the oldest frameset is dropped when full
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+        self.seq = 0
+        self.dropped = 0   # framesets overwritten before the consumer read them
+        self.errors = 0    # timeouts / invalid framesets
+        self.error = None  # last exception
+        self.failure = None # exception that ended the worker; latest() / drain() raise it
+
+    def run(self):
+        kwargs = {'stats': self.stats} if self.stats is not None else {}
+        while not self._stop_event.is_set():
+            meta = {}
+            try:
+                images = self.read_fn(self.pipeline, *self.options, meta=meta, **kwargs)
+            except RuntimeError as e: # e.g. "Frame didn't arrive within 5000"
+                self.errors += 1
+                self.error = e
+                if self.stats is not None:
+                    self.stats.count('errors')
+                continue
+            except Exception as e: # anything else ends the worker; the consumer gets it from latest()
+                self.errors += 1
+                self.error = e
+                with self._cond:
+                    self.failure = e
+                    self._cond.notify_all()
+                return
+
+            if images[0] is False: # getFrames() returns (False, False) on an invalid frameset
+                self.errors += 1
+                if self.stats is not None:
+                    self.stats.count('errors')
+                continue
+
+            packet = FramePacket(self.serial, self.seq, time.monotonic(), images, meta)
+            self.seq += 1
+
+            with self._cond:
+                if len(self._queue) == self._queue.maxlen:
+                    self.dropped += 1
+                    if self.stats is not None:
+                        self.stats.count('overwritten')
+                self._queue.append(packet)
+                self._cond.notify_all()
+
+    def latest(self, timeout=None):
+        """Pop the newest frameset (older ones are discarded).
+        Returns None if nothing arrived within `timeout` seconds (timeout=0 never blocks);
+        raises RuntimeError once the worker died of an exception.
+        """
+        with self._cond:
+            if not self._queue and timeout != 0:
+                self._cond.wait_for(lambda: self._queue or self._stop_event.is_set() or self.failure is not None, timeout)
+            self._raise_failure()
+            if not self._queue:
+                return None
+            packet = self._queue.pop()
+            self.dropped += len(self._queue)
+            self._queue.clear()
+            return packet
+
+    def drain(self):
+        """Pop every queued frameset, oldest first (never blocks)."""
+        with self._cond:
+            self._raise_failure()
+            packets = list(self._queue)
+            self._queue.clear()
+            return packets
+
+    def qsize(self):
+        return len(self._queue)
+
+    def _raise_failure(self):
+        if self.failure is not None:
+            raise RuntimeError(f"Capture of camera {self.serial} failed: "
+                               f"{type(self.failure).__name__}: {self.failure}") from self.failure
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+
+class CaptureGroup:
+    """Run one CaptureWorker per pipeline and read the newest frameset of every camera.
+
+    >>> group = CaptureGroup(pipelines, options_list, serial_list)
+    >>> group.start()
+    >>> packets = group.latest()  # list with one FramePacket per camera
+    """
+    def __init__(self, pipelines, options_list, serials=None, maxsize=2, read_fn=getFrames, metrics=None):
+        if serials is None:
+            serials = [str(i) for i in range(len(pipelines))]
+
+        self.workers = [CaptureWorker(pipeline, options, serial, maxsize=maxsize, read_fn=read_fn, metrics=metrics)
+                        for pipeline, options, serial in zip(pipelines, options_list, serials)]
+        self._last = [None] * len(self.workers)
+
+    def __len__(self):
+        return len(self.workers)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        return self
+
+    def latest(self, timeout=5.0):
+        """Newest frameset of every camera.
+
+        Blocks (up to `timeout` sec) only until every camera delivered its first frameset;
+        afterwards a camera without a new frameset reuses its previous one,
+        so the slowest device never holds back the loop. Raises RuntimeError once a worker died.
+        """
+        for i, worker in enumerate(self.workers):
+            wait = timeout if self._last[i] is None else 0
+            packet = worker.latest(timeout=wait)
+            if packet is not None:
+                self._last[i] = packet
+            elif self._last[i] is None:
+                raise RuntimeError(f"No frames from camera {worker.serial} within {timeout} sec")
+        return list(self._last)
+
+    def stop(self, join_timeout=1.0):
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.join(join_timeout)
@@ -0,0 +1,147 @@
+""" - headless control and throttled preview
+
+Commands (one per line, from stdin and/or a UNIX socket) are translated into the
+same key codes the OpenCV window produces, so the capture loop handles both alike:
+
+    record | v      start recording
+    stop   | space  stop recording
+    snap   | s      save a sample image
+    cmap   | m      next depth colormap
+    quit   | q      exit
+
+    $ echo record | nc -U /tmp/realsense.sock
+"""
+import os
+import sys
+import time
+import socket
+import threading
+from collections import deque
+
+import numpy as np
+import cv2
+
+
+COMMANDS = {'record': ord('v'), 'v': ord('v'),
+            'stop': 32, 'space': 32,
+            'snap': ord('s'), 'snapshot': ord('s'), 's': ord('s'),
+            'cmap': ord('m'), 'm': ord('m'),
+            'quit': ord('q'), 'q': ord('q'), 'exit': ord('q')}
+
+
+class ControlServer:
+    """Collect commands from stdin / a UNIX socket; `poll()` works like cv2.waitKey(1)"""
+    def __init__(self, use_stdin=True, socket_path=None):
+        self.socket_path = socket_path
+        self._keys = deque()
+        self._threads = []
+        self._server = None
+
+        if use_stdin:
+            self._spawn(self._read_stdin, 'control-stdin')
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(socket_path)
+            self._server.listen(4)
+            self._spawn(self._accept, 'control-socket')
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def handle(self, line) -> str:
+        """Queue the key of one command line; returns the reply"""
+        command = line.strip().lower()
+        if not command:
+            return ''
+        if command not in COMMANDS:
+            return f"unknown command '{command}', use one of {sorted(COMMANDS)}"
+        self._keys.append(COMMANDS[command])
+        return 'ok'
+
+    def press(self, key):
+        """Queue a raw key code (e.g. from a preview window)"""
+        if key != -1:
+            self._keys.append(key)
+
+    def poll(self) -> int:
+        """Next key code, or -1 if there is none (never blocks)"""
+        try:
+            return self._keys.popleft()
+        except IndexError:
+            return -1
+
+    def _read_stdin(self):
+        for line in sys.stdin:
+            reply = self.handle(line)
+            if reply and reply != 'ok':
+                print(reply)
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError: # closed
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile('r') as rfile, conn.makefile('w') as wfile:
+            for line in rfile:
+                wfile.write(self.handle(line) + '\n')
+                wfile.flush()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class PreviewThread(threading.Thread):
+    """Show images at a throttled rate in its own thread.
+
+    The capture loop calls `due()` and, only then, `submit(img)` which copies the image
+    into the preview's own buffer; imshow/waitKey never run in the capture loop.
+    Keys pressed in the preview window are forwarded to `control`.
+    """
+    def __init__(self, fps=5.0, window='RealSense (preview)', control=None):
+        super().__init__(name='preview', daemon=True)
+        self.period = 1.0 / fps
+        self.window = window
+        self.control = control
+
+        self._buffer = None
+        self._fresh = False
+        self._next = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def due(self) -> bool:
+        return time.monotonic() >= self._next
+
+    def submit(self, img):
+        with self._lock:
+            if self._buffer is None or self._buffer.shape != img.shape:
+                self._buffer = np.empty_like(img)
+            np.copyto(self._buffer, img)
+            self._fresh = True
+        self._next = time.monotonic() + self.period
+
+    def run(self):
+        cv2.namedWindow(self.window, cv2.WINDOW_NORMAL)
+        while not self._stop_event.is_set():
+            with self._lock:
+                if self._fresh:
+                    cv2.imshow(self.window, self._buffer)
+                    self._fresh = False
+            key = cv2.waitKey(max(int(self.period * 1000), 1))
+            if self.control is not None:
+                self.control.press(key)
+        cv2.destroyWindow(self.window)
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,185 @@
+""" - parallel, cached bring-up of the cameras of a rig
+
+    devices = DeviceManager(cache_dir='~/.cache/realsense', warmup={'max_frames': 60})
+    serials = devices.enumerate()                             # one rs.context query, timed
+    results = devices.startAll(openCamera, len(sources))      # openCamera(index) on a thread each
+    ...                                                       # (in openCamera:)
+    with devices.phase('c1', 'start'):
+        profile = pipeline.start()
+    entry = devices.cached(serial, streams)                   # None: not seen with these streams yet
+    devices.store(serial, streams, profile=profile, depth_scale=..., calibration=...)
+    devices.warmup(pipeline, 'c1')                            # discard frames until exposure settles
+    devices.report('c1')                                      # one log line with the phase times
+
+pipeline.start() of several devices mostly waits on USB and the firmware, so it runs
+concurrently. Per serial the resolved stream profiles, depth scale and calibration are kept in
+<cache_dir>/<serial>.json (one file per camera, so --procs children write their own). A later run
+with the same streams skips the stream validation (device and profile enumeration) and the
+calibration queries. Phase times are logged by logger 'realsense.devices'.
+"""
+import os
+import json
+import time
+import logging
+import os.path as osp
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pyrealsense2 as rs
+
+from .metrics import _Timer
+from .realsense_utils import getDeviceSerial
+
+
+logger = logging.getLogger('realsense.devices')
+
+DEFAULT_WARMUP = {
+    'min_frames': 5,           # always discarded
+    'max_frames': 90,          # give up waiting for a settled exposure after this many frames
+    'max_seconds': 5.0,        # ... or this long
+    'stable_frames': 5,        # consecutive frames whose exposure changed less than
+    'tolerance': 0.02,         # this fraction
+}
+
+
+def _exposures(frames):
+    """Actual exposure of the depth / color frames of a frameset (metadata), () if not reported"""
+    exposures = []
+    for frame in (frames.get_depth_frame(), frames.get_color_frame()):
+        if frame and frame.supports_frame_metadata(rs.frame_metadata_value.actual_exposure):
+            exposures.append(frame.get_frame_metadata(rs.frame_metadata_value.actual_exposure))
+    return tuple(exposures)
+
+
+class _PhaseTimes:
+    """Phase: seconds of one camera; add_time() as in CameraMetrics, for _Timer"""
+    def __init__(self):
+        self.times = {}
+        self.notes = []
+
+    def add_time(self, phase, seconds):
+        self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+
+class DeviceManager:
+    """`cache_dir`: where the per-serial cache files are kept (None: no cache); `refresh`
+    ignores (and rewrites) cached entries. `warmup`: overrides of DEFAULT_WARMUP, None / {}
+    keeps the defaults, `{'max_frames': 0}` turns the warm-up off."""
+    def __init__(self, cache_dir=None, warmup=None, refresh=False):
+        self.cache_dir = osp.expanduser(cache_dir) if cache_dir else None
+        self.warmup_settings = dict(DEFAULT_WARMUP, **dict(warmup or {}))
+        self.refresh = refresh
+        self.phases = defaultdict(_PhaseTimes) # label: _PhaseTimes
+        self._lock = threading.Lock()
+
+    # --- Phases --- #
+
+    def phase(self, label, name):
+        """Context manager timing one startup phase of camera `label`"""
+        return _Timer(self.phases[label], name)
+
+    def note(self, label, text):
+        self.phases[label].notes.append(text)
+
+    def report(self, label):
+        phases = self.phases[label]
+        times = ", ".join(f"{name} {seconds:.2f} s" for name, seconds in phases.times.items())
+        notes = f" ({'; '.join(phases.notes)})" if phases.notes else ""
+        logger.info(f"{label}: {times}, total {sum(phases.times.values()):.2f} s{notes}")
+
+    # --- Bring-up --- #
+
+    def enumerate(self):
+        """Serials of the connected devices"""
+        with self.phase('rig', 'enumerate'):
+            return getDeviceSerial()
+
+    def startAll(self, open_fn, count, stop_fn=None):
+        """[open_fn(0), ..., open_fn(count - 1)], each on a thread of its own; the first
+        exception is raised once every camera finished, after `stop_fn(result)` released the
+        cameras that did start (default: result[0].stop(), the pipeline of a (pipeline, ...) tuple)"""
+        with self.phase('rig', 'start_all'):
+            with ThreadPoolExecutor(max(count, 1), thread_name_prefix='device-start') as pool:
+                futures = [pool.submit(open_fn, index) for index in range(count)]
+            errors = [future.exception() for future in futures]
+            if any(error is not None for error in errors):
+                stop_fn = stop_fn or (lambda result: result[0].stop())
+                for future, error in zip(futures, errors):
+                    if error is None: # started; a retry would find the device busy
+                        try:
+                            stop_fn(future.result())
+                        except Exception as e:
+                            logger.warning(f"Stopping a started camera failed: {e}")
+                raise next(error for error in errors if error is not None)
+            results = [future.result() for future in futures]
+        self.report('rig')
+        return results
+
+    def warmup(self, pipeline, label):
+        """Discard frames of a live source until the exposure of its depth / color frames
+        settled (see DEFAULT_WARMUP); -> number of discarded frames. Recorded sources are skipped."""
+        settings = self.warmup_settings
+        if not getattr(pipeline, 'live', False) or settings['max_frames'] <= 0:
+            return 0
+
+        with self.phase(label, 'warmup'):
+            deadline = time.monotonic() + settings['max_seconds']
+            count, stable, last, settled = 0, 0, None, False
+            while count < settings['max_frames'] and time.monotonic() < deadline:
+                ok, frames = pipeline.try_wait_for_frames(1000)
+                if not ok:
+                    continue
+                count += 1
+                exposures = _exposures(frames)
+                if exposures and last is not None and len(exposures) == len(last):
+                    changed = any(abs(e - l) > settings['tolerance'] * max(l, 1) for e, l in zip(exposures, last))
+                    stable = 0 if changed else stable + 1
+                last = exposures
+                if count >= settings['min_frames']:
+                    if not exposures: # no exposure metadata (e.g. not enabled in the kernel driver)
+                        settled = None
+                        break
+                    if stable >= settings['stable_frames']:
+                        settled = True
+                        break
+
+        state = {True: "settled", False: "not settled", None: "no exposure metadata"}[settled]
+        self.note(label, f"warm-up: {count} frames discarded, exposure {state}")
+        return count
+
+    # --- Cache --- #
+
+    def _path(self, serial):
+        return osp.join(self.cache_dir, f"{serial}.json")
+
+    def cached(self, serial, streams):
+        """Cache entry of `serial` if it was stored with the same `streams` (streamConfig()), else None"""
+        if self.cache_dir is None or self.refresh or not osp.isfile(self._path(serial)):
+            return None
+        try:
+            with open(self._path(serial)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('streams') == streams else None
+
+    def store(self, serial, streams, profile=None, **values):
+        """Write the cache entry of `serial`: the requested `streams`, the stream profiles
+        `profile` resolved to and `values` (e.g. depth_scale, calibration); JSON-serializable"""
+        if self.cache_dir is None:
+            return
+        entry = {'serial': serial, 'streams': streams, **values}
+        if profile is not None:
+            entry['resolved'] = [{'stream': str(p.stream_type()).split('.')[-1], 'index': p.stream_index(),
+                                  'format': str(p.format()).split('.')[-1], 'fps': p.fps(),
+                                  **({'width': p.as_video_stream_profile().width(), 'height': p.as_video_stream_profile().height()}
+                                     if p.is_video_stream_profile() else {})}
+                                 for p in profile.get_streams()]
+            entry['firmware'] = profile.get_device().get_info(rs.camera_info.firmware_version)
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{self._path(serial)}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(entry, f, indent=1)
+            os.replace(tmp, self._path(serial)) # readers never see a partial file
@@ -0,0 +1,62 @@
+""" - preallocated display mosaic
+
+One BGR buffer laid out as a grid of `rows` (cameras) x `cols` (panels). Every processing
+stage writes straight into its tile view (numpy `out=` / OpenCV `dst=`), so composing
+the preview allocates nothing per frame (unlike np.hstack / np.vstack).
+"""
+import numpy as np
+import cv2
+
+
+class Mosaic:
+    """
+    >>> mosaic = Mosaic(rows=len(serial_list), cols=4, tile_shape=(480, 640))
+    >>> np.copyto(mosaic.tile(0, 0), color_image)
+    >>> cv2.cvtColor(leftIR_image, cv2.COLOR_GRAY2BGR, dst=mosaic.tile(0, 3))
+    >>> cv2.imshow('RealSense', mosaic.image)
+    """
+    def __init__(self, rows, cols, tile_shape, channels=3):
+        self.rows = rows
+        self.cols = cols
+        self.tile_h, self.tile_w = tile_shape[:2]
+        self.image = np.zeros((rows * self.tile_h, cols * self.tile_w, channels), dtype=np.uint8)
+
+        # views are created once; each shares memory with self.image
+        self._tiles = [[self.image[r * self.tile_h:(r + 1) * self.tile_h, c * self.tile_w:(c + 1) * self.tile_w]
+                        for c in range(cols)] for r in range(rows)]
+        self._gray = None # tile-sized single-channel buffer for resizing grey images; created on first use
+
+    @property
+    def tile_shape(self):
+        return (self.tile_h, self.tile_w)
+
+    def tile(self, row, col):
+        return self._tiles[row][col]
+
+    def row(self, row):
+        """Tile views of one row (camera), left to right"""
+        return self._tiles[row]
+
+    def put(self, row, col, img):
+        """Copy an image that was not produced in place; resized if it does not fit the tile"""
+        tile = self._tiles[row][col]
+        if img.ndim == 2 and img.dtype == tile.dtype: # IR: expanded to BGR straight into the tile
+            if img.shape != tile.shape[:2]:
+                if self._gray is None:
+                    self._gray = np.empty(tile.shape[:2], dtype=np.uint8)
+                img = cv2.resize(img, (self.tile_w, self.tile_h), dst=self._gray, interpolation=cv2.INTER_NEAREST)
+            cv2.cvtColor(img, cv2.COLOR_GRAY2BGR, dst=tile)
+            return tile
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        if img.shape[:2] == tile.shape[:2]:
+            np.copyto(tile, img)
+        else:
+            cv2.resize(img, (self.tile_w, self.tile_h), dst=tile, interpolation=cv2.INTER_NEAREST)
+        return tile
+
+    def fits(self, img):
+        return img.shape[:2] == (self.tile_h, self.tile_w)
+
+    def clear(self):
+        self.image.fill(0)
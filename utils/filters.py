@@ -0,0 +1,155 @@
+""" - configurable librealsense depth post-processing chain with per-stage timing
+
+Defined in config.yaml (applied in order; the chain is empty if the list is):
+
+    FILTERS:
+      - decimation: {filter_magnitude: 2}
+      - threshold: {min_distance: 0.1, max_distance: 4.0}
+      - disparity: {}                 # depth -> disparity (spatial / temporal work better on it)
+      - spatial: {filter_smooth_alpha: 0.5, filter_smooth_delta: 20}
+      - temporal: {}
+      - depth: {}                     # disparity -> depth
+      - hole_filling: {holes_fill: 1}
+
+    chain = FilterChain.fromConfig(cfg.get('FILTERS'), name=serial)
+    frames = chain.process(frames, stats=metrics.camera(serial))   # frameset or depth frame
+
+Option names are rs.option names. With `stats` (utils.metrics.CameraMetrics) every stage is
+timed as 'filter_<name>'. `workers` > 0 runs the chain on a pool of its own, so filtering
+one frameset overlaps waiting for the next (results come `workers` framesets later). The
+processing blocks keep state and are not thread-safe: with `workers` > 1 every pool thread
+runs blocks of its own, built from the same options.
+"""
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pyrealsense2 as rs
+
+from .realsense_utils import _noTimer
+
+
+FILTERS = {
+    'decimation': rs.decimation_filter,
+    'threshold': rs.threshold_filter,
+    'disparity': rs.disparity_transform,
+    'depth': lambda: rs.disparity_transform(False),
+    'spatial': rs.spatial_filter,
+    'temporal': rs.temporal_filter,
+    'hole_filling': rs.hole_filling_filter,
+}
+
+_STATEFUL = ('temporal',) # need the framesets one after another, in order
+
+
+class FilterChain:
+    def __init__(self, stages=(), workers=0, name=''):
+        """`stages`: [(filter name, {option: value}), ...]"""
+        self.stages = [] # [stage name, filter kind, rs filter, enabled, {option: value}]
+        self.workers = workers
+        self.name = name
+        self._executor = None
+        self._pending = deque()
+        self._local = threading.local()
+        self._copies = [] # the blocks of every pool thread (workers > 1)
+        self._lock = threading.Lock()
+        for kind, options in stages:
+            self.add(kind, **(options or {}))
+
+    @classmethod
+    def fromConfig(cls, specs, **kwargs):
+        """From the FILTERS list of config.yaml: [{filter name: {option: value}}, ...]"""
+        stages = []
+        for spec in specs or []:
+            (kind, options), = dict(spec).items()
+            stages.append((kind, dict(options or {})))
+        return cls(stages, **kwargs)
+
+    @staticmethod
+    def _block(kind, options):
+        block = FILTERS[kind]()
+        for option, value in options.items():
+            block.set_option(getattr(rs.option, option), value)
+        return block
+
+    def add(self, kind, **options):
+        if kind not in FILTERS:
+            raise ValueError(f"Unknown filter '{kind}', use one of {list(FILTERS)}")
+        block = self._block(kind, options)
+        count = sum(stage[1] == kind for stage in self.stages)
+        name = kind if not count else f"{kind}_{count + 1}"
+        with self._lock:
+            self.stages.append([name, kind, block, True, dict(options)])
+            for blocks in self._copies:
+                blocks.append(self._block(kind, options))
+        return self
+
+    def __len__(self):
+        return sum(stage[3] for stage in self.stages)
+
+    def set_option(self, kind, option, value):
+        """Set an option (rs.option name) on every stage of one filter kind, e.g. at runtime"""
+        with self._lock:
+            for i, (_, stage_kind, block, _, options) in enumerate(self.stages):
+                if stage_kind == kind:
+                    options[option] = value
+                    for stage_block in [block] + [blocks[i] for blocks in self._copies]:
+                        stage_block.set_option(getattr(rs.option, option), value)
+
+    def enable(self, on=True, kinds=None):
+        """Switch all stages (or those of `kinds`) on / off"""
+        for stage in self.stages:
+            if kinds is None or stage[1] in kinds:
+                stage[3] = on
+
+    @property
+    def resizes(self):
+        """True if a decimation stage changes the depth resolution"""
+        return any(enabled and kind == 'decimation' and block.get_option(rs.option.filter_magnitude) > 1
+                   for _, kind, block, enabled, _ in self.stages)
+
+    def _blocks(self):
+        """The processing blocks of the calling thread: copies of its own in a pool of workers > 1"""
+        if self.workers <= 1:
+            return [stage[2] for stage in self.stages]
+        blocks = getattr(self._local, 'blocks', None)
+        if blocks is None:
+            with self._lock:
+                blocks = [self._block(kind, options) for _, kind, _, _, options in self.stages]
+                self._copies.append(blocks)
+            self._local.blocks = blocks
+        return blocks
+
+    def _run(self, frame, stats):
+        timer = stats.timer if stats is not None else _noTimer
+        frameset = frame.is_frameset()
+        for (name, _, _, enabled, _), block in zip(self.stages, self._blocks()):
+            if enabled:
+                with timer(f'filter_{name}'):
+                    frame = block.process(frame)
+        return frame.as_frameset() if frameset else frame
+
+    def process(self, frame, stats=None):
+        """Filtered frame (a frameset stays a frameset; only its depth frame is filtered).
+
+        With `workers`, the frame is queued on the chain's pool and the oldest result is
+        returned once `workers` framesets are in flight; None until then."""
+        if not self.workers:
+            return self._run(frame, stats)
+
+        if self._executor is None:
+            if self.workers > 1 and any(stage[1] in _STATEFUL for stage in self.stages):
+                raise ValueError(f"A chain with {_STATEFUL} filters needs its framesets in order; use workers=1")
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=f'filters-{self.name}')
+        self._pending.append(self._executor.submit(self._run, frame, stats))
+        if len(self._pending) <= self.workers:
+            return None
+        return self._pending.popleft().result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._pending.clear()
+            self._copies.clear()
+            self._local = threading.local()
@@ -0,0 +1,206 @@
+""" - multi-camera point-cloud fusion in a common rig frame
+
+Every camera's pose (camera -> rig, 4x4, meter) comes from the RIG section of config.yaml:
+
+    RIG:
+      '123456789012': [1, 0, 0, 0,  0, 1, 0, 0,  0, 0, 1, 0,  0, 0, 0, 1]
+
+    fusion = RigFusion(loadRig(cfg, serial_list), voxel_size=0.01)
+    fusion.add_camera(serial, calibration['color_intrinsics'], depth_scale) # depth aligned to color
+    points, colors = fusion({serial: (depth_img, color_img), ...})
+
+The rig transform is folded into each camera's cached pixel-ray grid, so a pixel goes to the rig
+frame with one multiply-add per axis. The merged points are reduced with a hashed voxel grid
+(one point per occupied voxel at the mean position and mean color).
+"""
+import numpy as np
+
+from .pointcloud import pixelRays
+
+
+# === Rig calibration === #
+
+def loadRig(cfg, serials=None) -> dict:
+    """{serial: 4x4 camera -> rig transform} from the RIG section of an OmegaConf config.
+    Serials without an entry keep their own camera frame (identity)."""
+    rig = {str(serial): np.asarray(list(pose), dtype=np.float64).reshape(4, 4)
+           for serial, pose in (cfg.get('RIG') or {}).items()}
+    for serial in serials or []:
+        if serial not in rig:
+            print(f"No RIG pose for camera {serial}; using its own frame")
+            rig[serial] = np.eye(4)
+    return rig
+
+
+# === Voxel grid === #
+
+# odd 64-bit constants for multiplicative hashing (2^64 / golden ratio first)
+_MULTIPLIERS = [np.uint64(m) for m in (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)]
+_BITS = 21 # per axis: +-2^20 voxels (10 km at 1 cm)
+
+
+def voxelKeys(points, voxel_size):
+    """int64 key of the voxel of every point (21 bits per axis)"""
+    keys = np.zeros(len(points), dtype=np.int64)
+    q = np.empty(len(points), dtype=np.float32)
+    for axis in range(3):
+        np.multiply(points[:, axis], np.float32(1.0 / voxel_size), out=q)
+        np.floor(q, out=q)
+        q += 1 << (_BITS - 1) # exact in float32 (< 2^24)
+        qa = q.astype(np.int64)
+        qa &= (1 << _BITS) - 1
+        qa <<= (2 - axis) * _BITS
+        keys |= qa
+    return keys
+
+
+def _hashSlots(keys, multiplier, offset):
+    """Slot of every key in a power-of-two table of >= len(keys) slots placed at `offset`,
+    or -1 if another key took the slot; returns (slots, table size)"""
+    bits = max(12, int(np.ceil(np.log2(len(keys)))))
+    slot = ((keys.view(np.uint64) * multiplier) >> np.uint64(64 - bits)).astype(np.intp)
+    owner = np.empty(1 << bits, dtype=np.int64)
+    owner[slot] = keys # one of the keys of each slot wins
+    lost = owner[slot] != keys
+    slot += offset
+    slot[lost] = -1
+    return slot, 1 << bits
+
+
+def voxelDownsample(points, colors=None, voxel_size=0.01):
+    """One point per occupied voxel: mean position (and mean color). Voxels are grouped by
+    hashing their keys into a table of ~N slots (exact: keys that lose their slot are hashed
+    again), so nothing is sorted."""
+    n = len(points)
+    if n == 0:
+        return points[:0], None if colors is None else colors[:0]
+
+    keys = voxelKeys(points, voxel_size)
+    slot, size = _hashSlots(keys, _MULTIPLIERS[0], 0)
+    for rehash in range(1, len(_MULTIPLIERS) + 1):
+        clash = np.flatnonzero(slot < 0)
+        if not len(clash):
+            break
+        if rehash < len(_MULTIPLIERS):
+            sub, sub_size = _hashSlots(keys[clash], _MULTIPLIERS[rehash], size)
+        else: # practically never
+            _, sub = np.unique(keys[clash], return_inverse=True)
+            sub_size = int(sub.max()) + 1
+            sub += size
+        slot[clash] = sub
+        size += sub_size
+
+    # dense voxel ids, then per-voxel sums
+    count = np.bincount(slot, minlength=size)
+    occupied = np.flatnonzero(count)
+    lut = np.empty(size, dtype=np.intp)
+    lut[occupied] = np.arange(len(occupied))
+    voxel = lut[slot]
+    count = count[occupied]
+
+    def mean(column):
+        return np.bincount(voxel, weights=column, minlength=len(occupied)) / count
+
+    out_points = np.empty((len(occupied), 3), dtype=np.float32)
+    for axis in range(3):
+        out_points[:, axis] = mean(points[:, axis])
+    if colors is None:
+        return out_points, None
+
+    out_colors = np.empty((len(occupied), 3), dtype=np.uint8)
+    for channel in range(3):
+        out_colors[:, channel] = np.rint(mean(colors[:, channel]))
+    return out_points, out_colors
+
+
+# === Fusion === #
+
+class _RigCamera:
+    def __init__(self, intrinsics, depth_scale, pose, stride):
+        rays = pixelRays(intrinsics) # (2, h*w)
+        height, width = intrinsics['height'], intrinsics['width']
+        self.shape = (height, width)
+        self.stride = stride
+        xy = rays.reshape(2, height, width)[:, ::stride, ::stride].reshape(2, -1)
+        rays = np.vstack([xy, np.ones((1, xy.shape[1]), dtype=np.float32)])
+        self.rays = (pose[:3, :3] @ rays).astype(np.float32) # (3, n) in the rig frame
+        self.origin = pose[:3, 3].astype(np.float32)
+        self.depth_scale = np.float32(depth_scale)
+        self.z = np.empty(xy.shape[1], dtype=np.float32)
+        self.valid = np.empty(xy.shape[1], dtype=bool)
+
+
+class RigFusion:
+    """Merge the clouds of several cameras in the rig frame and voxel-downsample them.
+
+    `stride` deprojects every stride-th pixel per row and column (stride 2: a quarter of the points),
+    `voxel_size` 0 / None keeps every point."""
+    def __init__(self, rig, voxel_size=0.01, stride=1, min_depth=0.0, max_depth=None):
+        self.rig = rig
+        self.voxel_size = voxel_size
+        self.stride = stride
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.cameras = {}
+        self._points = np.empty((0, 3), dtype=np.float32)
+        self._colors = np.empty((0, 3), dtype=np.uint8)
+
+    def add_camera(self, serial, intrinsics, depth_scale):
+        """`intrinsics`: dict (utils.align.intrinsicsToDict) of the stream the depth is aligned to"""
+        pose = self.rig.get(serial, np.eye(4))
+        self.cameras[serial] = _RigCamera(intrinsics, depth_scale, pose, self.stride)
+        capacity = sum(len(cam.z) for cam in self.cameras.values())
+        self._points = np.empty((capacity, 3), dtype=np.float32)
+        self._colors = np.empty((capacity, 3), dtype=np.uint8)
+
+    def _deproject(self, cam, depth, color, points, colors):
+        """Valid points of one camera, in the rig frame, into points / colors; returns their number"""
+        depth = depth[::cam.stride, ::cam.stride].reshape(-1)
+        z, valid = cam.z, cam.valid
+        np.multiply(depth, cam.depth_scale, out=z, casting='unsafe')
+        np.greater(depth, max(self.min_depth / cam.depth_scale, 0), out=valid)
+        if self.max_depth is not None:
+            valid &= z <= self.max_depth
+
+        index = np.flatnonzero(valid)
+        k = len(index)
+        z = z[index]
+        for axis in range(3):
+            np.multiply(cam.rays[axis, index], z, out=points[:k, axis])
+            points[:k, axis] += cam.origin[axis]
+        if color is not None:
+            color = color[::cam.stride, ::cam.stride].reshape(-1, color.shape[-1])
+            np.take(color[:, 2::-1], index, axis=0, out=colors[:k]) # BGR -> RGB
+        else:
+            colors[:k] = 0
+        return k
+
+    def __call__(self, frames):
+        """frames: {serial: (depth_img, color_img BGR or None)} -> (points (N, 3) float32, colors (N, 3) uint8 RGB)"""
+        k = 0
+        for serial, (depth, color) in frames.items():
+            k += self._deproject(self.cameras[serial], depth, color, self._points[k:], self._colors[k:])
+
+        points, colors = self._points[:k], self._colors[:k]
+        if self.voxel_size:
+            return voxelDownsample(points, colors, self.voxel_size)
+        return points.copy(), colors.copy()
+
+    def merge(self, clouds):
+        """Clouds that are already deprojected (e.g. rs.pointcloud vertices with depth), in each
+        camera's frame: {serial: (points (N, 3) float32, colors (N, 3) uint8 RGB or None)}
+        -> (points, colors) in the rig frame, voxel-downsampled like __call__"""
+        n = sum(len(points) for points, _ in clouds.values())
+        points, colors = np.empty((n, 3), dtype=np.float32), np.empty((n, 3), dtype=np.uint8)
+        k = 0
+        for serial, (cam_points, cam_colors) in clouds.items():
+            pose = self.rig.get(serial, np.eye(4))
+            dst = points[k:k + len(cam_points)]
+            np.matmul(cam_points, pose[:3, :3].T.astype(np.float32), out=dst)
+            dst += pose[:3, 3].astype(np.float32)
+            colors[k:k + len(cam_points)] = 0 if cam_colors is None else cam_colors
+            k += len(cam_points)
+
+        if self.voxel_size:
+            return voxelDownsample(points, colors, self.voxel_size)
+        return points, colors
@@ -0,0 +1,200 @@
+""" - low-overhead capture metrics
+
+    metrics = Metrics()
+    cam = metrics.camera('c1')                 # per-camera view
+    with cam.timer('clip'): ...                # stage timer (count / total / max)
+    cam.frame(frame_number)                    # achieved FPS + drops from frame-number gaps
+    metrics.gauge('c1', 'queue', worker.qsize) # sampled only when reported
+
+Reported as one JSON log line every `interval` seconds (MetricsReporter) and, optionally,
+as Prometheus text on http://127.0.0.1:<port>/metrics (MetricsServer).
+"""
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+logger = logging.getLogger('realsense.metrics')
+
+GLOBAL = '_' # camera key of metrics that belong to no camera
+
+
+class _Timer:
+    __slots__ = ('stats', 'stage', 't0')
+
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add_time(self.stage, time.perf_counter() - self.t0)
+
+
+class CameraMetrics:
+    """Counters of one camera. Updates are plain attribute/dict operations (GIL-atomic enough
+    for statistics), so the hot path takes no lock."""
+    def __init__(self, name):
+        self.name = name
+        self.stages = defaultdict(lambda: [0, 0.0, 0.0]) # stage: [count, total sec, max sec] since last report
+        self.counters = defaultdict(int)                 # monotonic totals
+        self.frames = 0
+        self.last_frame_number = None
+        self._window_frames = 0
+        self._window_t0 = time.monotonic()
+
+    def timer(self, stage):
+        return _Timer(self, stage)
+
+    def add_time(self, stage, seconds):
+        entry = self.stages[stage]
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def frame(self, frame_number=None):
+        """One frameset arrived; a jump in `frame_number` counts the frames in between as dropped"""
+        self.frames += 1
+        self._window_frames += 1
+        if frame_number is not None:
+            if self.last_frame_number is not None and frame_number > self.last_frame_number + 1:
+                self.counters['dropped_frames'] += frame_number - self.last_frame_number - 1
+            self.last_frame_number = frame_number
+
+    def snapshot(self, reset=True):
+        now = time.monotonic()
+        elapsed = max(now - self._window_t0, 1e-9)
+        stages = {stage: {'count': count, 'mean_ms': total / count * 1e3 if count else 0.0, 'max_ms': peak * 1e3}
+                  for stage, (count, total, peak) in list(self.stages.items())}
+        snap = {'fps': self._window_frames / elapsed, 'frames': self.frames,
+                'counters': dict(self.counters), 'stages': stages}
+        if reset:
+            self.stages = defaultdict(lambda: [0, 0.0, 0.0])
+            self._window_frames = 0
+            self._window_t0 = now
+        return snap
+
+
+class Metrics:
+    """Registry of CameraMetrics plus gauges that are sampled at report time"""
+    def __init__(self):
+        self.cameras = {}
+        self.gauges = {} # (camera, name): callable
+        self._lock = threading.Lock()
+        self._last = {}
+
+    def camera(self, name=GLOBAL) -> CameraMetrics:
+        if name not in self.cameras:
+            with self._lock:
+                self.cameras.setdefault(name, CameraMetrics(name))
+        return self.cameras[name]
+
+    def timer(self, stage, camera=GLOBAL):
+        return self.camera(camera).timer(stage)
+
+    def gauge(self, camera, name, fn):
+        """Register `fn()` (e.g. a queue size) to be read whenever metrics are reported"""
+        self.gauges[(camera, name)] = fn
+
+    def remove_gauges(self, prefix):
+        for key in [key for key in self.gauges if key[1].startswith(prefix)]:
+            del self.gauges[key]
+
+    def snapshot(self, reset=True):
+        """{camera: {fps, frames, counters, stages, gauges}}; the stage window restarts if `reset`"""
+        with self._lock:
+            snap = {name: cam.snapshot(reset) for name, cam in self.cameras.items()}
+            for (camera, name), fn in list(self.gauges.items()):
+                try:
+                    value = fn()
+                except Exception: # e.g. a closed writer
+                    continue
+                snap.setdefault(camera, {}).setdefault('gauges', {})[name] = value
+            self._last = snap
+        return snap
+
+    @property
+    def last(self):
+        """Latest reported snapshot (used by the HTTP endpoint, which must not reset the window)"""
+        return self._last
+
+    def prometheus(self):
+        """Prometheus text exposition of the latest snapshot"""
+        lines = []
+        for camera, snap in (self._last or self.snapshot(reset=False)).items():
+            label = f'camera="{camera}"'
+            if 'fps' in snap:
+                lines.append(f'realsense_fps{{{label}}} {snap["fps"]:.3f}')
+                lines.append(f'realsense_frames_total{{{label}}} {snap["frames"]}')
+            for name, value in snap.get('counters', {}).items():
+                lines.append(f'realsense_{name}_total{{{label}}} {value}')
+            for stage, stats in snap.get('stages', {}).items():
+                lines.append(f'realsense_stage_mean_ms{{{label},stage="{stage}"}} {stats["mean_ms"]:.4f}')
+                lines.append(f'realsense_stage_max_ms{{{label},stage="{stage}"}} {stats["max_ms"]:.4f}')
+            for name, value in snap.get('gauges', {}).items():
+                lines.append(f'realsense_{name}{{{label}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsReporter(threading.Thread):
+    """Log one structured (JSON) line with all metrics every `interval` seconds"""
+    def __init__(self, metrics, interval=5.0, log=logger):
+        super().__init__(name='metrics-reporter', daemon=True)
+        self.metrics = metrics
+        self.interval = interval
+        self.log = log
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()
+
+    def report(self):
+        snap = self.metrics.snapshot(reset=True)
+        self.log.info(json.dumps({'ts': time.time(), 'metrics': snap}, default=float))
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class MetricsServer:
+    """/metrics (Prometheus text) and /metrics.json on 127.0.0.1:<port>, served from a thread"""
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        registry = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, ctype = registry.prometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, ctype = json.dumps(registry.last, default=float), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args): # no access log on stderr
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-http', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,236 @@
+""" - vectorized point clouds and binary PLY / PCD export
+
+    deproject = Deprojector(calibration['color_intrinsics'], depth_scale) # depth aligned to color
+    points, colors = deproject(depth_img, color_img)                      # (N, 3) float32 m, (N, 3) uint8 RGB
+    writeCloud('1.ply', points, colors)
+
+The per-pixel rays of an intrinsics are computed once and cached, so a cloud costs three
+multiplies and a mask. CloudSink writes numbered files from a WriterPool thread; convertTake()
+turns a whole recorded take into per-frame clouds on all cores (see take_to_clouds.py).
+"""
+import os
+import os.path as osp
+import functools
+from multiprocessing import Pool
+
+import numpy as np
+
+from .align import SoftwareAligner, intrinsicsToDict, _undistort
+from .take import TakeReader
+
+
+FORMATS = ('ply', 'pcd')
+
+
+# === Deprojection === #
+
+@functools.lru_cache(maxsize=16)
+def _rayGrid(key):
+    width, height, fx, fy, ppx, ppy, model, coeffs = key
+    v, u = np.mgrid[0:height, 0:width].astype(np.float64)
+    x, y = _undistort((u - ppx) / fx, (v - ppy) / fy, {'model': model, 'coeffs': coeffs})
+    rays = np.stack([x.ravel(), y.ravel()]).astype(np.float32)
+    rays.flags.writeable = False # shared by every Deprojector of the same intrinsics
+    return rays
+
+
+def pixelRays(intrinsics):
+    """(2, h*w) x/z and y/z of every pixel center; cached per intrinsics"""
+    i = intrinsics if isinstance(intrinsics, dict) else intrinsicsToDict(intrinsics)
+    return _rayGrid((i['width'], i['height'], i['fx'], i['fy'], i['ppx'], i['ppy'], i['model'], tuple(i['coeffs'])))
+
+
+class Deprojector:
+    """z16 depth (+ color of the same size, i.e. depth aligned to color) -> XYZRGB points.
+    `intrinsics`: rs.intrinsics or intrinsicsToDict() of the stream the depth is in."""
+    def __init__(self, intrinsics, depth_scale=0.001):
+        self.intrinsics = intrinsics if isinstance(intrinsics, dict) else intrinsicsToDict(intrinsics)
+        self.depth_scale = depth_scale
+        self.shape = (self.intrinsics['height'], self.intrinsics['width'])
+        self.rays = pixelRays(self.intrinsics)
+        self._xyz = np.empty((self.shape[0] * self.shape[1], 3), dtype=np.float32)
+        self._valid = np.empty(self.shape[0] * self.shape[1], dtype=bool)
+        self._mask = np.empty_like(self._valid)
+
+    def organized(self, depth, out=None):
+        """(h, w, 3) points in meter, 0 where there is no depth; the buffer is reused unless `out`"""
+        xyz = self._xyz if out is None else out.reshape(-1, 3)
+        z = xyz[:, 2]
+        np.multiply(depth.reshape(-1), np.float32(self.depth_scale), out=z, casting='unsafe')
+        np.multiply(self.rays[0], z, out=xyz[:, 0])
+        np.multiply(self.rays[1], z, out=xyz[:, 1])
+        return xyz.reshape(*self.shape, 3)
+
+    def __call__(self, depth, color=None, min_depth=0.0, max_depth=None, bgr=True, invalid=None):
+        """Points with depth (within [min_depth, max_depth] meter) as new arrays:
+        (N, 3) float32 and, with `color`, (N, 3) uint8 RGB (`bgr`: color is OpenCV BGR).
+        `invalid`: z16 value that is no measurement either, e.g. the grey background of
+        clipped depth (TakeReader.clipValue())"""
+        if depth.shape != self.shape:
+            raise ValueError(f"Depth image {depth.shape} does not match the intrinsics {self.shape}")
+        xyz = self.organized(depth).reshape(-1, 3)
+
+        depth = depth.reshape(-1)
+        valid = np.greater(depth, max(min_depth / self.depth_scale, 0), out=self._valid)
+        if max_depth is not None:
+            valid &= np.less_equal(depth, max_depth / self.depth_scale, out=self._mask)
+        if invalid is not None:
+            valid &= np.not_equal(depth, invalid, out=self._mask)
+
+        index = np.flatnonzero(valid) # np.take with indices is much faster than boolean row indexing
+        points = np.take(xyz, index, axis=0)
+        if color is None:
+            return points, None
+        colors = np.take(color.reshape(-1, color.shape[-1]), index, axis=0)
+        return points, (colors[:, 2::-1] if bgr else colors[:, :3])
+
+
+# === Files === #
+
+def writePLY(filename, points, colors=None):
+    """Binary little-endian PLY; x y z float, red green blue uchar"""
+    fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if colors is not None:
+        fields += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+    data = _pack(points, colors, fields)
+
+    header = ['ply', 'format binary_little_endian 1.0', f'element vertex {len(data)}',
+              'property float x', 'property float y', 'property float z']
+    if colors is not None:
+        header += ['property uchar red', 'property uchar green', 'property uchar blue']
+    header += ['end_header']
+    with open(filename, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        data.tofile(f)
+
+
+def writePCD(filename, points, colors=None):
+    """Binary PCD v0.7; rgb packed into 4 bytes as PCL does (declared as float)"""
+    fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if colors is not None:
+        fields += [('rgb', '<u4')]
+    data = np.empty(len(points), dtype=fields)
+    data['x'], data['y'], data['z'] = points[:, 0], points[:, 1], points[:, 2]
+    if colors is not None:
+        colors = colors.astype(np.uint32)
+        data['rgb'] = (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+
+    names = ' '.join(name for name, _ in fields)
+    header = ['# .PCD v0.7 - Point Cloud Data file format', 'VERSION 0.7', f'FIELDS {names}',
+              'SIZE' + ' 4' * len(fields), 'TYPE' + ' F' * len(fields), 'COUNT' + ' 1' * len(fields),
+              f'WIDTH {len(data)}', 'HEIGHT 1', 'VIEWPOINT 0 0 0 1 0 0 0', f'POINTS {len(data)}', 'DATA binary']
+    with open(filename, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        data.tofile(f)
+
+
+def _pack(points, colors, fields):
+    data = np.empty(len(points), dtype=fields)
+    data['x'], data['y'], data['z'] = points[:, 0], points[:, 1], points[:, 2]
+    if colors is not None:
+        data['red'], data['green'], data['blue'] = colors[:, 0], colors[:, 1], colors[:, 2]
+    return data
+
+
+def writeCloud(filename, points, colors=None):
+    """.ply or .pcd by extension"""
+    ext = osp.splitext(filename)[1].lower()
+    if ext == '.ply':
+        return writePLY(filename, points, colors)
+    if ext == '.pcd':
+        return writePCD(filename, points, colors)
+    raise ValueError(f"Unknown point cloud format '{ext}', use one of {FORMATS}")
+
+
+class CloudSink:
+    """WriterPool sink; write((points, colors)) -> <directory>/<prefix>000000.<fmt>, ...
+
+    >>> recorder.open('c1_cloud', CloudSink(osp.join(path, 'cloud', cam_title)))
+    >>> recorder.write('c1_cloud', deproject(depth_img, color_img))
+    """
+    def __init__(self, directory, fmt='ply', prefix=''):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown point cloud format '{fmt}', use one of {FORMATS}")
+        self.directory = directory
+        self.fmt = fmt
+        self.prefix = prefix
+        self.count = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, k):
+        return osp.join(self.directory, f"{self.prefix}{k:06d}.{self.fmt}")
+
+    def write(self, cloud):
+        points, colors = cloud
+        writeCloud(self.filename(self.count), points, colors)
+        self.count += 1
+
+    def release(self):
+        pass
+
+
+# === Bulk conversion of a take === #
+
+def _takeDeprojector(take, cam_id):
+    """Deprojector (+ SoftwareAligner if the take holds unaligned depth) of one camera"""
+    cam_meta = take.meta['cameras'][cam_id]
+    calibration = cam_meta.get('calibration')
+    depth_scale = cam_meta.get('depth_scale', 0.001)
+    if calibration is None:
+        raise ValueError(f"Take has no calibration for camera {cam_id} (recorded from a synthetic source?)")
+
+    aligner = None
+    if not cam_meta.get('aligned', True):
+        aligner = SoftwareAligner.fromDict(calibration)
+    return Deprojector(calibration['color_intrinsics'], depth_scale), aligner
+
+
+def _convertFrames(job):
+    directory, cam_id, frames, out_dir, fmt, min_depth, max_depth = job
+    take = TakeReader(directory) # memory-mapped; cheap to open in every process
+    deproject, aligner = _takeDeprojector(take, cam_id)
+    depth, color = take.stream(cam_id, 'depth'), take.stream(cam_id, 'rgb')
+
+    invalid = take.clipValue(cam_id) # clipped depth: its background is no measurement
+    if aligner is not None and invalid is not None:
+        work, mask = np.empty(depth.shape[1:], depth.dtype), np.empty(depth.shape[1:], bool)
+
+    for k in frames:
+        depth_img = depth[k]
+        if aligner is not None:
+            if invalid is not None: # a hole before aligning, or the near background would cover measured depth
+                np.copyto(work, depth_img)
+                np.copyto(work, 0, where=np.equal(depth_img, invalid, out=mask))
+                depth_img = work
+            depth_img = aligner(depth_img)
+        points, colors = deproject(depth_img, color[k], min_depth, max_depth, invalid=None if aligner is not None else invalid)
+        writeCloud(osp.join(out_dir, f"{k:06d}.{fmt}"), points, colors)
+    return len(frames)
+
+
+def convertTake(directory, cam_ids=None, fmt='ply', out_dir=None, processes=None, min_depth=0.0, max_depth=None):
+    """Write one cloud per recorded frame: <out_dir>/<cam_id>/000000.<fmt>, ... using `processes`
+    worker processes (default: all cores). Returns {cam_id: frames converted}. In takes of
+    clipped depth (TakeReader.clipValue()) the grey background gives no points."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown point cloud format '{fmt}', use one of {FORMATS}")
+    take = TakeReader(directory)
+    cam_ids = cam_ids or take.cameras
+    out_dir = out_dir or osp.join(directory, 'cloud')
+    processes = processes or os.cpu_count()
+
+    jobs = []
+    for cam_id in cam_ids:
+        _takeDeprojector(take, cam_id) # fail early, not in the workers
+        os.makedirs(osp.join(out_dir, cam_id), exist_ok=True)
+        count = take.meta['cameras'][cam_id]['count']
+        chunk = max(1, -(-count // (processes * 4))) # a few chunks per process balance the load
+        jobs += [(directory, cam_id, range(k, min(k + chunk, count)), osp.join(out_dir, cam_id), fmt, min_depth, max_depth)
+                 for k in range(0, count, chunk)]
+
+    counts = dict.fromkeys(cam_ids, 0)
+    with Pool(processes) as pool:
+        for job, n in zip(jobs, pool.imap(_convertFrames, jobs)):
+            counts[job[1]] += n
+    return counts
+
@@ -0,0 +1,145 @@
+""" - pre-trigger history: the last N seconds of raw frames per camera, flushed ahead of a recording
+
+    ring = PreTriggerRing.forFrames(frames, seconds=3.0, fps=30.0, max_bytes=256 << 20, name='c1')
+    ring.push(frames, meta)                    # every frame while not recording; copied into a slot
+    ...                                        # 'v':
+    ring.flush(write)                          # background: write(images, meta) for the history, oldest first
+    if not ring.queue(frames, meta):           # live frames queue behind the history until it is written,
+        write_live(frames)                     # then the caller writes them itself
+    ring.wait()                                # before the recorder is closed
+
+`frames` is {stream: image} (e.g. 'rgb', 'depth', 'IR'), the raw images as captured. All slots
+are allocated once (forFrames: as many as `seconds` at `fps`, at most `max_bytes`), so keeping
+the history costs one copy per frame and no allocation. `write` gets views into the slot, which
+is reused once it returns, so it has to copy (or convert) what it keeps.
+
+While a flush is running the ring is a FIFO: the live frames that arrive meanwhile fill the slots
+beyond the history (`headroom`) and those the flush already wrote; a full ring drops incoming
+live frames (`dropped`) instead of overwriting history that is not written yet.
+"""
+import math
+import threading
+
+import numpy as np
+
+from .take import INDEX_DTYPE
+
+
+class PreTriggerRing:
+    """`layout`: {stream: (shape, dtype)} of one frame, `capacity`: slots, `history`: frames
+    kept while not flushing (default: all slots)"""
+    def __init__(self, layout, capacity, history=None, name=''):
+        history = capacity if history is None else history
+        if not 1 <= history <= capacity:
+            raise ValueError(f"A pre-trigger ring needs 1 <= history <= capacity (history {history}, capacity {capacity})")
+        self.layout = {key: (tuple(shape), np.dtype(dtype)) for key, (shape, dtype) in layout.items()}
+        self.capacity = capacity
+        self.history = history
+        self.name = name
+        self.arrays = {key: np.empty((capacity, *shape), dtype) for key, (shape, dtype) in self.layout.items()}
+        self.index = np.zeros(capacity, dtype=INDEX_DTYPE)
+        self.nbytes = sum(array.nbytes for array in self.arrays.values()) + self.index.nbytes
+
+        self.start = 0    # slot of the oldest frame
+        self.count = 0    # frames held
+        self.dropped = 0  # live frames lost because the ring was full during the last flush
+        self.flushed = 0  # frames written by the last flush
+        self.draining = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @classmethod
+    def forFrames(cls, frames, seconds, fps, max_bytes=None, headroom=0.5, name=''):
+        """Ring for framesets like `frames` ({stream: image}): `seconds` of history at `fps` plus
+        `headroom` seconds for the live frames of a flush; at most `max_bytes`, taken off the history
+        (ValueError if not even one frameset fits)"""
+        frame_bytes = sum(image.nbytes for image in frames.values()) + INDEX_DTYPE.itemsize
+        history, extra = math.ceil(seconds * fps), math.ceil(headroom * fps)
+        if max_bytes is not None and (history + extra) * frame_bytes > max_bytes:
+            slots = max_bytes // frame_bytes
+            if slots < 1:
+                raise ValueError(f"A frameset of pre-trigger ring '{name}' takes {frame_bytes / 2**20:.2f} MB, "
+                                 f"more than its max_bytes ({max_bytes / 2**20:.2f} MB)")
+            extra = min(extra, slots // 2)
+            history = slots - extra
+        return cls({key: (image.shape, image.dtype) for key, image in frames.items()}, history + extra, history, name=name)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def seconds(self):
+        """Time span of the held frames (host clock)"""
+        if self.count < 2:
+            return 0.0
+        last = (self.start + self.count - 1) % self.capacity
+        return float(self.index['host_ts'][last] - self.index['host_ts'][self.start])
+
+    def _push(self, frames, meta):
+        if self.draining and self.count == self.capacity: # keep the frames that are not written yet
+            self.dropped += 1
+            return
+        if not self.draining and self.count >= self.history:
+            self.start = (self.start + 1) % self.capacity # overwrite the oldest frame
+            self.count -= 1
+
+        slot = (self.start + self.count) % self.capacity
+        for key, array in self.arrays.items():
+            np.copyto(array[slot], frames[key])
+        meta = meta or {}
+        self.index[slot] = (meta.get('timestamp', np.nan), meta.get('host_ts', np.nan), meta.get('frame_number', -1))
+        self.count += 1
+
+    def push(self, frames, meta=None):
+        """Keep a frame as history (the oldest one is overwritten once `history` frames are held)"""
+        with self._lock:
+            self._push(frames, meta)
+
+    def queue(self, frames, meta=None):
+        """During a flush: queue a live frame behind the history and return True; else False,
+        and the caller writes the frame itself (the flush has caught up)"""
+        with self._lock:
+            if not self.draining:
+                return False
+            self._push(frames, meta)
+            return True
+
+    def flush(self, write):
+        """Call `write(images, meta)` for every held frame, oldest first, then for the live
+        frames queued meanwhile; on a thread of its own"""
+        with self._lock:
+            self.draining = True
+            self.flushed, self.dropped = 0, 0
+        self._thread = threading.Thread(target=self._run, args=(write,), name=f"pretrigger-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self, write):
+        try:
+            while True:
+                with self._lock:
+                    if self.count == 0: # caught up; the next live frame goes straight to the recorder
+                        self.draining = False
+                        return
+                    slot = self.start
+
+                images = {key: array[slot] for key, array in self.arrays.items()} # the slot stays held meanwhile
+                timestamp, host_ts, frame_number = self.index[slot].tolist()
+                write(images, {'timestamp': timestamp, 'host_ts': host_ts, 'frame_number': frame_number})
+
+                with self._lock:
+                    self.start = (self.start + 1) % self.capacity
+                    self.count -= 1
+                    self.flushed += 1
+        finally:
+            with self._lock:
+                self.draining = False
+
+    def wait(self):
+        """Until the flush wrote everything it holds"""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {'frames': self.count, 'history': self.history, 'capacity': self.capacity, 'mb': round(self.nbytes / 2**20, 1),
+                'flushed': self.flushed, 'dropped': self.dropped}
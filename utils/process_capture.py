@@ -0,0 +1,280 @@
+""" - one capture process per camera; frames are handed over in shared-memory rings
+
+Threads (utils/capture.py) keep every camera's NumPy / OpenCV work in one interpreter. Here each
+camera runs its source, getFrames() and its per-camera processing (e.g. colormap, IR -> BGR) in
+a process of its own and writes the results into a ring of preallocated slots in one
+multiprocessing.shared_memory block. Only slot indices, timestamps and stage timings go through
+a pipe; the main process maps the slots as NumPy arrays, so no pixel data is pickled or copied.
+
+    group = ProcessCaptureGroup(openCamera, len(sources), metrics=metrics).start()
+    packets = group.latest()        # FramePacket per camera; images are views into the rings
+    group.broadcast('set_colormap', cv2.COLORMAP_BONE)
+    group.stop()
+
+`open_fn(index)` runs in the camera's process and returns (pipeline, options, info, processor):
+the source and getFrames() options, a picklable dict for the main process (group.info) and an
+optional processor with `layout(images) -> {name: (shape, dtype)}` and `processor(arrays)`, which
+fills its arrays from the captured ones ('color', 'depth', 'leftIR', 'rightIR') inside the slot.
+
+A slot belongs to the main process from the packet that carries it until the next latest() of
+that camera; copy the images to keep them longer (the recorder and the take copy anyway).
+The processes are spawned: a forked child would inherit the librealsense context and threads of
+the main process. So `open_fn` is pickled, i.e. a module-level function (or a functools.partial
+of one with picklable arguments), and a script that defines it runs its own work only under
+`if __name__ == '__main__':`, since every camera process imports it (as __mp_main__) first.
+The processors are created in the camera process and need not be picklable.
+"""
+import time
+import multiprocessing as mp
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .capture import FramePacket
+from .metrics import _Timer
+from .realsense_utils import getFrames
+
+
+IMAGE_NAMES = ('color', 'depth', 'leftIR', 'rightIR') # getFrames() order
+_ALIGN = 64 # bytes; every array of a slot starts on a cache line
+
+
+class FrameRing:
+    """`slots` framesets of fixed `layout` ({name: (shape, dtype)}) in one shared-memory block.
+
+    Without `name` a new block is created (and unlinked by close()), else the named one is
+    mapped; `create=True` creates it under that name. `header` bytes before the first slot are
+    left to the caller (see utils/shm_stream.py). `track=False` keeps an attached block out of
+    this process' resource tracker, which would otherwise unlink it when the process exits."""
+    def __init__(self, layout, slots, name=None, create=None, header=0, track=True):
+        self.layout = {key: (tuple(shape), np.dtype(dtype)) for key, (shape, dtype) in layout.items()}
+        self.slots = slots
+        self.header = header
+        self.offsets, offset = {}, 0
+        for key, (shape, dtype) in self.layout.items():
+            self.offsets[key] = offset
+            offset += -(-int(np.prod(shape)) * dtype.itemsize // _ALIGN) * _ALIGN
+        self.slot_size = offset
+
+        self.owner = name is None if create is None else create
+        self.shm = SharedMemory(name=name, create=self.owner, size=header + self.slot_size * slots if self.owner else 0)
+        if not self.owner and not track:
+            resource_tracker.unregister(self.shm._name, 'shared_memory') # Python < 3.13 tracks attached blocks too
+        self.name = self.shm.name
+        self._arrays = [{key: np.ndarray(shape, dtype, buffer=self.shm.buf,
+                                         offset=header + slot * self.slot_size + self.offsets[key])
+                         for key, (shape, dtype) in self.layout.items()} for slot in range(slots)]
+
+    def describe(self):
+        """Picklable arguments of FrameRing(*ring.describe()) to map the same block elsewhere"""
+        return {key: (shape, dtype.str) for key, (shape, dtype) in self.layout.items()}, self.slots, self.name
+
+    def arrays(self, slot):
+        """{name: array} of one slot (views into the shared block)"""
+        return self._arrays[slot]
+
+    def close(self):
+        self._arrays = []
+        try:
+            self.shm.close()
+        except BufferError: # arrays of the last packets are still referenced; unmapped at exit
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+class _FrameTimes:
+    """Stage timings, counters and frame numbers in the camera process since the last sent frame"""
+    def __init__(self):
+        self.times, self.counters, self.frames = [], {}, []
+
+    def timer(self, stage):
+        return _Timer(self, stage)
+
+    def add_time(self, stage, seconds):
+        self.times.append((stage, seconds))
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def frame(self, frame_number=None):
+        self.frames.append(frame_number)
+
+    def pop(self):
+        out = (self.times, self.counters, self.frames)
+        self.times, self.counters, self.frames = [], {}, []
+        return out
+
+
+def _cameraMain(conn, stop_event, open_fn, index, slots, read_fn):
+    """Body of a camera process: capture, process into a free slot, send its index"""
+    try:
+        pipeline, options, info, processor = open_fn(index)
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+        return
+
+    stats = _FrameTimes()
+    ring, free, seq = None, [], 0
+    try:
+        while not stop_event.is_set():
+            while conn.poll():
+                message = conn.recv()
+                if message[0] == 'free':
+                    free.append(message[1])
+                elif message[0] == 'call': # e.g. ('call', 'set_colormap', (colormap,))
+                    getattr(processor, message[1])(*message[2])
+
+            meta = {}
+            try:
+                images = read_fn(pipeline, *options, meta=meta, stats=stats)
+            except RuntimeError: # e.g. "Frame didn't arrive within 5000"
+                stats.count('errors')
+                continue
+            if images[0] is False:
+                stats.count('errors')
+                continue
+
+            if ring is None: # the layout is known with the first frameset
+                layout = {key: (image.shape, image.dtype) for key, image in zip(IMAGE_NAMES, images) if image is not None}
+                if processor is not None:
+                    layout.update(processor.layout(images))
+                ring = FrameRing(layout, slots)
+                free = list(range(slots))
+                conn.send(('ready', info, ring.describe()))
+
+            if not free: # the main process holds every slot; keep its frames, skip this one
+                stats.count('overwritten')
+                continue
+            slot = free.pop()
+            arrays = ring.arrays(slot)
+            with stats.timer('shm_copy'):
+                for key, image in zip(IMAGE_NAMES, images):
+                    if image is not None:
+                        np.copyto(arrays[key], image)
+            if processor is not None:
+                with stats.timer('process'):
+                    processor(arrays)
+
+            conn.send(('frame', slot, seq, time.monotonic(), meta, stats.pop()))
+            seq += 1
+    finally:
+        pipeline.stop()
+        if ring is not None:
+            ring.close()
+        conn.close()
+
+
+class _CameraProcess:
+    def __init__(self, ctx, open_fn, index, slots, read_fn):
+        self.index = index
+        self.conn, child_conn = ctx.Pipe()
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(target=_cameraMain, name=f"camera-{index}", daemon=True,
+                                   args=(child_conn, self.stop_event, open_fn, index, slots, read_fn))
+        self.ring = None
+        self.info = None
+        self.serial = str(index)
+        self.stats = None
+        self.slot = None # slot of the packet the main process holds
+
+
+class ProcessCaptureGroup:
+    """Run one capture process per camera and read the newest frameset of every camera;
+    a drop-in for CaptureGroup (start / latest / stop) plus `info` and broadcast().
+
+    With `metrics`, the stage timings of the camera processes (read stages, 'shm_copy',
+    'process'), the frame rate, errors and skipped frames are reported under each serial."""
+    def __init__(self, open_fn, count, slots=4, read_fn=getFrames, metrics=None):
+        if slots < 2:
+            raise ValueError("A frame ring needs at least 2 slots (one is held by the main process)")
+        self.metrics = metrics
+        ctx = mp.get_context('spawn') # no librealsense state / threads inherited from this process
+        resource_tracker.ensure_running() # shared by the children, so the rings are not reported as leaked
+        self.cameras = [_CameraProcess(ctx, open_fn, index, slots, read_fn) for index in range(count)]
+        self._last = [None] * count
+
+    def __len__(self):
+        return len(self.cameras)
+
+    @property
+    def info(self):
+        return [cam.info for cam in self.cameras]
+
+    def start(self, timeout=30.0):
+        """Start the processes and wait until every camera delivered its first frameset"""
+        for cam in self.cameras:
+            cam.process.start()
+        for cam in self.cameras:
+            if not cam.conn.poll(timeout):
+                raise RuntimeError(f"Camera process {cam.index} did not start within {timeout} sec")
+            message = cam.conn.recv()
+            if message[0] == 'error':
+                raise RuntimeError(f"Camera process {cam.index}: {message[1]}")
+            _, cam.info, ring = message
+            cam.ring = FrameRing(*ring)
+            cam.serial = cam.info.get('serial', cam.serial)
+            if self.metrics is not None:
+                cam.stats = self.metrics.camera(cam.serial)
+        return self
+
+    def _packet(self, cam, message):
+        _, slot, seq, host_ts, meta, (times, counters, frames) = message
+        if cam.stats is not None:
+            for stage, seconds in times:
+                cam.stats.add_time(stage, seconds)
+            for name, value in counters.items():
+                cam.stats.count(name, value)
+            for frame_number in frames: # also those skipped in the camera process
+                cam.stats.frame(frame_number)
+        arrays = cam.ring.arrays(slot)
+        images = tuple(arrays.get(key) for key in IMAGE_NAMES) # None: stream not enabled
+        outputs = {key: array for key, array in arrays.items() if key not in IMAGE_NAMES}
+        return slot, FramePacket(cam.serial, seq, host_ts, images, meta, outputs or None)
+
+    def _release(self, cam, slot):
+        if slot is not None:
+            cam.conn.send(('free', slot))
+
+    def latest(self, timeout=5.0):
+        """Newest frameset of every camera; older ones that arrived in between go back to
+        their ring at once. Blocks only until every camera delivered its first frameset."""
+        for i, cam in enumerate(self.cameras):
+            wait = timeout if self._last[i] is None else 0
+            newest = None
+            while cam.conn.poll(wait):
+                wait = 0
+                message = cam.conn.recv()
+                if message[0] == 'error':
+                    raise RuntimeError(f"Camera process {cam.index}: {message[1]}")
+                if newest is not None:
+                    self._release(cam, newest[0])
+                    if cam.stats is not None:
+                        cam.stats.count('overwritten')
+                newest = self._packet(cam, message)
+
+            if newest is not None:
+                self._release(cam, cam.slot)
+                cam.slot, self._last[i] = newest
+            elif self._last[i] is None:
+                raise RuntimeError(f"No frames from camera {cam.serial} within {timeout} sec")
+        return list(self._last)
+
+    def broadcast(self, method, *args):
+        """Call `processor.<method>(*args)` in every camera process, e.g. to switch the colormap"""
+        for cam in self.cameras:
+            cam.conn.send(('call', method, args))
+
+    def stop(self, join_timeout=2.0):
+        for cam in self.cameras:
+            cam.stop_event.set()
+        for cam in self.cameras:
+            if cam.process.is_alive():
+                cam.process.join(join_timeout)
+            if cam.process.is_alive():
+                cam.process.terminate()
+            if cam.ring is not None:
+                cam.ring.close()
+            cam.conn.close()
+        self._last = [None] * len(self.cameras)
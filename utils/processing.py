@@ -0,0 +1,138 @@
+""" - per-camera image processing stages with preallocated buffers
+"""
+import numpy as np
+import cv2
+
+
+class DepthClipper:
+    """Distance clipping of z16 depth without per-frame allocations.
+
+    Same result as `np.where((depth > clipping_distance) | (depth <= 0), grey_color, depth)`,
+    which allocates two masks, their OR and a new output array on every frame.
+    Here `depth - 1` wraps 0 around to 65535, so both conditions become one
+    `depth - 1 >= floor(clipping_distance)` test, and the grey value is blended in
+    with bit masks (branch-free) into output buffers owned by the clipper.
+    Not thread-safe; use one clipper per camera.
+
+    The result goes into the next of `buffers` output buffers, so it stays valid for the
+    following `buffers - 1` calls; enough of them let clipped frames wait in a capture queue
+    without a copy and without touching the frame buffers of librealsense.
+
+    >>> clipper = DepthClipper(clipping_distance, buffers=4)
+    >>> clipped = clipper(depth_img)           # into the clipper's next buffer
+    >>> clipper(depth_img, out=depth_img)      # in place, for arrays the caller owns
+    """
+    def __init__(self, clipping_distance, grey_color=153, buffers=1):
+        self.clipping_distance = clipping_distance
+        self.grey_color = np.uint16(grey_color)
+        # depth > clipping_distance  <=>  depth - 1 >= floor(clipping_distance)
+        self.threshold = np.uint16(min(max(int(np.floor(clipping_distance)), 0), 65535))
+
+        self.buffers = buffers
+        self._keep = None
+        self._out = []
+        self._next = 0
+
+    def __call__(self, depth_img, out=None):
+        """`out` defaults to the clipper's next buffer (see `buffers`); pass `out=depth_img`
+        to clip in place."""
+        if self._keep is None or self._keep.shape != depth_img.shape:
+            self._keep = np.empty(depth_img.shape, dtype=np.uint16)
+            self._out = [np.empty(depth_img.shape, dtype=np.uint16) for _ in range(self.buffers)]
+        if out is None:
+            out = self._out[self._next]
+            self._next = (self._next + 1) % self.buffers
+        keep = self._keep
+
+        np.subtract(depth_img, 1, out=keep)                           # 0 -> 65535
+        np.less(keep, self.threshold, out=keep, casting='unsafe')     # 1: keep, 0: grey
+        np.negative(keep, out=keep)                                   # 0xFFFF: keep, 0: grey
+        np.bitwise_and(depth_img, keep, out=out)
+        np.invert(keep, out=keep)
+        np.bitwise_and(keep, self.grey_color, out=keep)
+        np.bitwise_or(out, keep, out=out)
+        return out
+
+
+class DepthColorizer:
+    """z16 depth -> BGR colormap through a precomputed 65536-entry lookup table.
+
+    Replaces `cv2.applyColorMap(cv2.convertScaleAbs(depth, alpha=alpha), colormap)`, which
+    allocates two new images per frame, with one gather into a reused output buffer.
+    The table is packed as uint32 (B, G, R, 0) so the gather moves one word per pixel.
+    Not thread-safe; use one colorizer per camera (or pass `out`).
+
+    >>> colorizer = DepthColorizer(alpha=0.03, colormap=cv2.COLORMAP_JET)
+    >>> depth_colormap = colorizer(depth_img)          # reused buffer
+    >>> colorizer.set_colormap(cv2.COLORMAP_BONE)      # rebuilt in place
+    """
+    def __init__(self, alpha=0.03, colormap=cv2.COLORMAP_JET):
+        self.alpha = alpha
+        self.colormap = colormap
+
+        self.lut = np.zeros((65536, 4), dtype=np.uint8)
+        self._lut32 = self.lut.view(np.uint32).ravel()
+        self._buffers = {} # {shape: (index, bgr0, bgr)}
+        self.set_colormap(colormap, alpha)
+
+    def set_colormap(self, colormap=None, alpha=None):
+        """Swap colormap and/or alpha; the table and output buffers are reused"""
+        self.colormap = self.colormap if colormap is None else colormap
+        self.alpha = self.alpha if alpha is None else alpha
+
+        values = np.arange(65536, dtype=np.uint16).reshape(256, 256)
+        bgr = cv2.applyColorMap(cv2.convertScaleAbs(values, alpha=self.alpha), self.colormap)
+        self.lut[:, :3] = bgr.reshape(65536, 3)
+
+    def _get_buffers(self, shape):
+        if shape not in self._buffers:
+            self._buffers[shape] = (np.empty(shape, dtype=np.intp),      # gather indices
+                                    np.empty(shape, dtype=np.uint32),    # packed B, G, R, 0
+                                    np.empty((*shape, 3), dtype=np.uint8))
+        return self._buffers[shape]
+
+    def __call__(self, depth_img, out=None):
+        """BGR image of `depth_img`; `out` defaults to a buffer owned by the colorizer"""
+        index, bgr0, bgr = self._get_buffers(depth_img.shape)
+        if out is None:
+            out = bgr
+
+        np.copyto(index, depth_img, casting='unsafe') # np.take would allocate this itself
+        np.take(self._lut32, index, out=bgr0, mode='clip')
+        return cv2.cvtColor(bgr0.view(np.uint8).reshape(*depth_img.shape, 4), cv2.COLOR_BGRA2BGR, dst=out)
+
+    colorize = __call__
+
+    def preview(self, depth_img, step=2, out=None):
+        """Colorize every `step`-th pixel (nearest-neighbour downsampling) for a cheap preview"""
+        return self(depth_img[::step, ::step], out=out)
+
+
+class DisplayProcessor:
+    """The per-camera display stages of the capture loop (clipping of raw depth, colormap,
+    IR -> BGR) as a processor of utils.process_capture, i.e. run in the camera's process.
+    Writes 'colormap' and 'IR' into the shared-memory slot next to the captured images."""
+    def __init__(self, colorizer, clipper=None):
+        self.colorizer = colorizer
+        self.clipper = clipper # only for raw (unclipped) depth
+
+    def layout(self, images):
+        color_img, depth_img, leftIR_img, _ = images
+        layout = {}
+        if depth_img is not None:
+            layout['colormap'] = ((*depth_img.shape, 3), np.uint8)
+        if leftIR_img is not None:
+            layout['IR'] = ((*leftIR_img.shape, 3), np.uint8)
+        return layout
+
+    def __call__(self, arrays):
+        if 'colormap' in arrays:
+            depth_img = arrays['depth']
+            if self.clipper is not None:
+                depth_img = self.clipper(depth_img) # into the clipper's buffer; the raw depth is kept
+            self.colorizer(depth_img, out=arrays['colormap'])
+        if 'IR' in arrays:
+            cv2.cvtColor(arrays['leftIR'], cv2.COLOR_GRAY2BGR, dst=arrays['IR'])
+
+    def set_colormap(self, colormap=None, alpha=None):
+        self.colorizer.set_colormap(colormap, alpha)
@@ -1,17 +1,81 @@
+from contextlib import nullcontext
+
 import numpy as np 
 import cv2 
 import pyrealsense2 as rs
 
-
-def getCamera(device_serial:str): 
+from .processing import DepthClipper
+
+
+# name: (rs.stream, index); the names used in the STREAMS section of config.yaml
+STREAM_TYPES = {
+    'depth': (rs.stream.depth, 0),
+    'color': (rs.stream.color, 0),
+    'infrared_1': (rs.stream.infrared, 1), # Left IR
+    'infrared_2': (rs.stream.infrared, 2), # Right IR
+}
+
+# the former fixed setup: every stream at 640x480@30
+DEFAULT_STREAMS = {
+    'depth': {'width': 640, 'height': 480, 'fps': 30, 'format': 'z16'},
+    'color': {'width': 640, 'height': 480, 'fps': 30, 'format': 'bgr8'},
+    'infrared_1': {'width': 640, 'height': 480, 'fps': 30, 'format': 'y8'},
+    'infrared_2': {'width': 640, 'height': 480, 'fps': 30, 'format': 'y8'},
+}
+
+
+def streamConfig(streams_cfg, serial=None) -> dict:
+    """Streams of one camera from the STREAMS section of config.yaml: the entry of its serial,
+    else 'default', else DEFAULT_STREAMS. Missing fields of a stream come from DEFAULT_STREAMS."""
+    streams_cfg = streams_cfg or {}
+    selected = streams_cfg.get(str(serial)) or streams_cfg.get('default') or DEFAULT_STREAMS
+    streams = {}
+    for name, settings in dict(selected).items():
+        if name not in STREAM_TYPES:
+            raise ValueError(f"Unknown stream '{name}', use one of {list(STREAM_TYPES)}")
+        streams[name] = dict(DEFAULT_STREAMS[name], **dict(settings or {}))
+    return streams
+
+
+def validateStreams(device, streams):
+    """Raise ValueError naming the supported modes if a stream of `streams` (streamConfig())
+    is not offered by one of the device's sensors"""
+    supported = {name: set() for name in streams}
+    for sensor in device.query_sensors():
+        for profile in sensor.get_stream_profiles():
+            if not profile.is_video_stream_profile():
+                continue
+            video = profile.as_video_stream_profile()
+            for name, (stream, index) in STREAM_TYPES.items():
+                if name in supported and video.stream_type() == stream and video.stream_index() in (index, 0):
+                    supported[name].add((video.width(), video.height(), video.fps(), str(video.format()).split('.')[-1]))
+
+    for name, s in streams.items():
+        mode = (s['width'], s['height'], s['fps'], s['format'])
+        if mode not in supported[name]:
+            modes = ", ".join("%dx%d@%d %s" % m for m in sorted(supported[name])) or "none"
+            raise ValueError(f"{device.get_info(rs.camera_info.serial_number)}: {name} "
+                             f"{s['width']}x{s['height']}@{s['fps']} {s['format']} is not supported; supported: {modes}")
+
+
+def getCamera(device_serial:str, streams=None, validate=True): 
+    """`streams`: {name: {width, height, fps, format}} (streamConfig()); checked against the
+    device's profiles unless `validate=False` (e.g. known from utils.devices' cache).
+    Default: depth, color and both IR streams at 640x480@30."""
 
     pipeline = rs.pipeline()
     config = rs.config() 
     config.enable_device(device_serial)
-    config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 30)
-    config.enable_stream(rs.stream.color, 640, 480, rs.format.bgr8, 30)
-    config.enable_stream(rs.stream.infrared, 1, 640, 480, rs.format.y8, 30) # Left IR 
-    config.enable_stream(rs.stream.infrared, 2, 640, 480, rs.format.y8, 30) # Right IR 
+    if streams is None:
+        streams = DEFAULT_STREAMS
+    elif validate:
+        devices = [d for d in rs.context().query_devices() if d.get_info(rs.camera_info.serial_number) == device_serial]
+        if devices:
+            validateStreams(devices[0], streams)
+
+    for name, s in streams.items():
+        stream, index = STREAM_TYPES[name]
+        config.enable_stream(stream, index, s['width'], s['height'], getattr(rs.format, s['format']), s['fps'])
 
     return pipeline, config 
 
@@ -30,16 +94,60 @@ def getDeviceSerial() -> list:
 
 
 
-def getFrames(pipeline, *options):
-    clipping_distance, align = options
+_NULL_TIMER = nullcontext() # reusable, so the untimed path allocates nothing
+def _noTimer(stage):
+    return _NULL_TIMER
+
+
+
+def colorToBGR(color_img, out=None):
+    """BGR image of a color stream image; YUYV ((h, w) uint16, as delivered) is converted here,
+    so it is only paid for where BGR is needed (display, video)"""
+    if color_img is None or color_img.ndim == 3:
+        return color_img
+    yuyv = color_img.view(np.uint8).reshape(*color_img.shape, 2)
+    return cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV, dst=out)
+
+
+def getFrames(pipeline, *options, meta=None, stats=None):
+    """-> (color_img, depth_img, leftIR_img, rightIR_img); images of streams that are not
+    enabled are None, a YUYV color image is returned as it is (see colorToBGR).
+    options: clipping_distance, align[, filters]. `clipping_distance`: a value or a DepthClipper;
+    the clipped depth is the clipper's buffer, so give it `buffers` for every frameset that can be
+    alive at once (queued, held by the consumer, being clipped).
+    `align`: rs.align, a utils.align.SoftwareAligner (applied to the depth array) or None.
+    `filters`: optional utils.filters.FilterChain, run on the frameset before alignment.
+    `stats`: optional utils.metrics.CameraMetrics; times wait / align / convert / clip and each filter"""
+    clipping_distance, align = options[:2]
+    filters = options[2] if len(options) > 2 else None
+    software_align = align is not None and not hasattr(align, 'process')
+    timer = stats.timer if stats is not None else _noTimer
 
     # Wait for a coherent pair of frames: depth and color
     # ---------------------------------------------------
-    frames = pipeline.wait_for_frames() # Get frameset of color and depth
-
-    if align: 
+    with timer('wait'):
+        frames = pipeline.wait_for_frames() # Get frameset of color and depth
+
+    if filters:
+        # Depth post-processing; with a worker pool the result is a few framesets older
+        frames = filters.process(frames, stats=stats)
+        while frames is None: # the pool is filling up (first framesets only)
+            with timer('wait'):
+                frames = filters.process(pipeline.wait_for_frames(), stats=stats)
+
+    if stats is not None:
+        stats.frame(frames.get_frame_number()) # achieved FPS, drops from frame-number gaps
+
+    if meta is not None:
+        # Frameset timestamp (ms) for multi-camera matching, see utils/sync.py
+        meta['timestamp'] = frames.get_timestamp()
+        meta['domain'] = str(frames.get_frame_timestamp_domain())
+        meta['frame_number'] = frames.get_frame_number()
+
+    if align and not software_align: 
         # Align the depth frame to color frame
-        frames = align.process(frames) # if aligned, depth_frame is aligned to 640x480
+        with timer('align'):
+            frames = align.process(frames) # if aligned, depth_frame is aligned to 640x480
         
     # Get frames 
     # ----------
@@ -48,30 +156,60 @@ def getFrames(pipeline, *options):
     leftIR_frame = frames.get_infrared_frame(1) # (ref) https://community.intel.com/t5/Items-with-no-label/How-to-show-d435-IR-image-using-python-wrapper-pyrealsense2/td-p/545526
     rightIR_frame = frames.get_infrared_frame(2)
 
-    if not depth_frame or not color_frame:
-        print(f"depth_frame:{depth_frame}, color_frame:{color_frame}")
+    # a frameset is incomplete if a stream the source enables is missing (depth and color
+    # for sources that do not tell, e.g. bag files)
+    enabled = getattr(pipeline, 'streams', ('depth', 'color'))
+    got = {'depth': depth_frame, 'color': color_frame, 'infrared_1': leftIR_frame, 'infrared_2': rightIR_frame}
+    if not all(got[name] for name in enabled):
+        print(", ".join(f"{name}_frame:{got[name]}" for name in enabled))
         return False, False 
 
-    # Convert images to numpy arrays
+    # Convert images to numpy arrays (enabled streams only)
     # ------------------------------
-    depth_img = np.asanyarray(depth_frame.get_data())
-    color_img = np.asanyarray(color_frame.get_data())
-    leftIR_img = np.asanyarray(leftIR_frame.get_data())
-    rightIR_img = np.asanyarray(rightIR_frame.get_data())
+    with timer('convert'):
+        depth_img = np.asanyarray(depth_frame.get_data()) if depth_frame else None
+        color_img = np.asanyarray(color_frame.get_data()) if color_frame else None
+        leftIR_img = np.asanyarray(leftIR_frame.get_data()) if leftIR_frame else None
+        rightIR_img = np.asanyarray(rightIR_frame.get_data()) if rightIR_frame else None
+
+    if depth_img is None:
+        return color_img, depth_img, leftIR_img, rightIR_img
 
+    if software_align:
+        with timer('align'):
+            depth_img = align(depth_img)
 
     if clipping_distance:
-        # Remove background - Set pixels further than clipping_distance to grey
-        grey_color = 153
-        depth_img = np.where((depth_img> clipping_distance) | (depth_img <= 0), grey_color, depth_img)
+        # into the buffers of a DepthClipper (no new array per frame); the frame buffer belongs
+        # to librealsense and may be read by others (filters, viewer), so it is never clipped in place
+        with timer('clip'):
+            if isinstance(clipping_distance, DepthClipper):
+                depth_img = clipping_distance(depth_img)
+            else:
+                depth_img = clipDepth(depth_img, clipping_distance) # new array
 
     return color_img, depth_img, leftIR_img, rightIR_img
 
-    
-def depth_options(profile, clipping_dist=1.5): 
+
+def clipDepth(depth_img, clipping_distance, grey_color=153, out=None):
+    # Remove background - Set pixels further than clipping_distance to grey
+    # `clipping_distance` is a value or a DepthClipper; see utils/processing.py
+    # (a new array is returned unless `out` is given)
+    clipper = clipping_distance if isinstance(clipping_distance, DepthClipper) else DepthClipper(clipping_distance, grey_color)
+    if out is None:
+        out = np.empty(depth_img.shape, dtype=np.uint16)
+    return clipper(depth_img, out=out)
+
+
+def getDepthScale(profile) -> float:
     # Getting the depth sensor's depth scale (see rs-align example for explanation)
+    # depth in meter = z16 value * depth_scale
     depth_sensor = profile.get_device().first_depth_sensor()
-    depth_scale = depth_sensor.get_depth_scale()
+    return depth_sensor.get_depth_scale()
+
+    
+def depth_options(profile, clipping_dist=1.5): 
+    depth_scale = getDepthScale(profile)
     print(f"Depth Scale is: {depth_scale}")
     
     # We will be removing the background of objects more than
@@ -90,6 +228,14 @@ def depth_options(profile, clipping_dist=1.5):
     return clipping_distance, align
 
 
+def timestamp_options(profile, global_time=True):
+    # Timestamps of several devices are only comparable in the 'global_time' domain
+    # (ref) https://github.com/IntelRealSense/librealsense/pull/3909
+    for sensor in profile.get_device().query_sensors():
+        if sensor.supports(rs.option.global_time_enabled):
+            sensor.set_option(rs.option.global_time_enabled, 1 if global_time else 0)
+
+
 def emitter_options(profile, set_emitter = 1):
     # remove 'dot patterns'; (ref) https://community.intel.com/t5/Items-with-no-label/How-to-enable-disable-emitter-through-python-wrapper/td-p/547900
     device = profile.get_device() 
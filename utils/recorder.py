@@ -0,0 +1,143 @@
+""" - background recording; one writer thread per output stream
+
+The capture loop only enqueues frames; encoding (e.g. cv2.VideoWriter.write) happens
+in the writer threads. Every stream has a bounded queue with a backpressure policy:
+
+    'block'       : wait until the writer catches up (no frame is lost)
+    'drop_oldest' : discard the oldest queued frame to make room
+    'drop_newest' : discard the incoming frame
+"""
+import threading
+from collections import deque
+
+import cv2
+
+
+POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+
+class StreamWriter(threading.Thread):
+    """Write the frames of one stream to `sink` (anything with `write(frame)` and `release()`)"""
+    def __init__(self, key, sink, maxsize=32, policy='block'):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', choose from {POLICIES}")
+
+        super().__init__(name=f"writer-{key}", daemon=True)
+        self.key = key
+        self.sink = sink
+        self.maxsize = maxsize
+        self.policy = policy
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+
+    def put(self, frame, policy=None):
+        """Enqueue a frame; returns False if the frame was dropped. `policy` overrides the
+        writer's own for this frame (e.g. 'block' from a background thread); 'block' drops
+        too once the sink failed or the writer is closed while waiting"""
+        policy = self.policy if policy is None else policy
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', choose from {POLICIES}")
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"Writer '{self.key}' is closed")
+
+            if len(self._queue) >= self.maxsize:
+                if policy == 'drop_newest':
+                    self.dropped += 1
+                    return False
+                elif policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                else: # block
+                    self._cond.wait_for(lambda: len(self._queue) < self.maxsize or self.error is not None or self._closed)
+                    if len(self._queue) >= self.maxsize or self._closed: # the sink failed, or close() came first
+                        self.dropped += 1
+                        return False
+
+            self._queue.append(frame)
+            self._cond.notify_all()
+            return True
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue: # closed and flushed
+                    break
+                frame = self._queue.popleft()
+                self._cond.notify_all()
+
+            try:
+                self.sink.write(frame)
+                self.written += 1
+            except Exception as e:
+                with self._cond:
+                    self.error = e
+                    self.dropped += 1
+                    self._cond.notify_all() # producers blocked on a full queue drop
+
+        self.sink.release()
+
+    def qsize(self):
+        return len(self._queue)
+
+    def close(self):
+        """Flush the queued frames and release the sink"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.join()
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'queued': len(self._queue)}
+
+
+class WriterPool:
+    """A set of StreamWriters keyed by stream name.
+
+    >>> pool = WriterPool(maxsize=32, policy='drop_oldest')
+    >>> pool.open_video('c1_rgb', 'c1_rgb.mp4', fourcc, 30.0, (640, 480))
+    >>> pool.write('c1_rgb', color_image)
+    >>> stats = pool.close()  # {'c1_rgb': {'written': .., 'dropped': .., 'queued': 0}}
+    """
+    def __init__(self, maxsize=32, policy='block'):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.writers = {}
+
+    def open(self, key, sink, maxsize=None, policy=None):
+        if key in self.writers:
+            raise KeyError(f"Stream '{key}' is already open")
+
+        writer = StreamWriter(key, sink,
+                              maxsize=self.maxsize if maxsize is None else maxsize,
+                              policy=self.policy if policy is None else policy)
+        writer.start()
+        self.writers[key] = writer
+        return writer
+
+    def open_video(self, key, filename, fourcc, fps, size, is_color=True, **kwargs):
+        video = cv2.VideoWriter(filename, fourcc, fps, size, is_color)
+        if not video.isOpened():
+            raise IOError(f"Cannot open video writer: {filename}")
+        return self.open(key, video, **kwargs)
+
+    def write(self, key, frame, policy=None):
+        return self.writers[key].put(frame, policy)
+
+    def stats(self):
+        return {key: writer.stats() for key, writer in self.writers.items()}
+
+    def close(self):
+        """Flush and release every stream; returns the final counters"""
+        for writer in self.writers.values():
+            writer.close()
+        stats = self.stats()
+        self.writers = {}
+        return stats
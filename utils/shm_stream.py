@@ -0,0 +1,251 @@
+""" - zero-copy fan-out of camera frames to local processes through named shared memory
+
+One publisher per camera writes every frameset once; any number of subscribers in other
+processes (recorder, point-cloud tools, inference) map the same block and read the frames as
+read-only NumPy views. Slow readers never block the publisher: it only ever writes.
+
+    pub = FramePublisher(serial, info={'depth_scale': depth_scale})   # e.g. multi-realsense.py --publish
+    pub.publish(images, meta)                  # (color, depth, leftIR, rightIR) as from getFrames()
+
+    sub = FrameSubscriber(serial)              # another process; waits for the publisher
+    frame = sub.next(timeout=1.0)              # or sub.latest(); None if nothing new
+    depth = frame.images['depth']              # view into the publisher's slot
+    ...
+    if not frame.valid():                      # the slot was reused while it was read
+        ...                                    # drop the results (or use sub.next(copy=True))
+
+Block /dev/shm/<prefix>_<serial>: an 8 KiB header (control words, a JSON description with the
+layout and `info`, one header per slot) and `slots` frame slots (utils.process_capture.FrameRing).
+Every slot header is a seqlock: its sequence word is odd while the slot is written and 2 * k once
+it holds frame k, so a reader can tell whether the views it holds are still frame k. A reader
+has `slots - 1` frame periods to use a frame before the publisher can come back to its slot;
+whatever keeps frames longer (a capture queue, a synchronizer window, e.g. ShmSource) copies them.
+
+The sequence words are 8-byte aligned int64 written with a single store (an element of an int64
+view, not a field of the structured header). That the pixel stores are seen between the odd and
+the even sequence store relies on the store order of x86-64 (TSO): NumPy issues no memory
+barriers, so on weakly ordered CPUs (ARM) a reader could see the new sequence word first.
+"""
+import os
+import json
+import time
+
+import numpy as np
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from .process_capture import FrameRing, IMAGE_NAMES
+
+
+_MAGIC = 0x52534652414d4531 # 'RSFRAME1'
+_HEADER = 8192
+_WORDS = 8                   # int64 control words at offset 0
+_JSON = (64, 6144)           # JSON description
+_SLOTS = 6144                # slot headers, up to 64 slots
+_MAGIC_W, _SLOTS_W, _LATEST_W, _CLOSED_W, _JSON_W, _PID_W = range(6)
+
+SLOT_HEADER = np.dtype([('seq', '<i8'), ('frame_number', '<i8'), ('timestamp', '<f8'), ('host_ts', '<f8')])
+
+
+def shmName(serial, prefix='realsense'):
+    return f"{prefix}_{serial}".replace('/', '_').replace(':', '_')
+
+
+def _attach(name):
+    """Map an existing block without handing it to this process' resource tracker"""
+    shm = SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _views(ring):
+    """Control words, slot headers and their sequence words as an aligned int64 view"""
+    buf = ring.shm.buf
+    words = np.ndarray(_WORDS, np.int64, buffer=buf)
+    slots = np.ndarray(ring.slots, SLOT_HEADER, buffer=buf, offset=_SLOTS)
+    seqs = np.ndarray(ring.slots, np.int64, buffer=buf, offset=_SLOTS, strides=(SLOT_HEADER.itemsize,))
+    return words, slots, seqs
+
+
+class FramePublisher:
+    """Writer side; the block is created with the first publish() (when the layout is known).
+    A block left behind by a crashed publisher of the same camera is replaced."""
+    def __init__(self, serial, prefix='realsense', slots=4, info=None):
+        if not 2 <= slots <= (_HEADER - _SLOTS) // SLOT_HEADER.itemsize:
+            raise ValueError(f"slots must be in [2, {(_HEADER - _SLOTS) // SLOT_HEADER.itemsize}]")
+        self.name = shmName(serial, prefix)
+        self.slots = slots
+        self.info = dict(info or {}, serial=str(serial))
+        self.ring = None
+        self.count = 0 # published frames
+
+    def _create(self, layout):
+        description = json.dumps({'layout': {key: [list(shape), np.dtype(dtype).str] for key, (shape, dtype) in layout.items()},
+                                  'info': self.info}).encode()
+        if len(description) > _JSON[1] - _JSON[0]:
+            raise ValueError(f"Description of {self.name} is too long ({len(description)} bytes)")
+        try:
+            self.ring = FrameRing(layout, self.slots, name=self.name, create=True, header=_HEADER)
+        except FileExistsError:
+            stale = SharedMemory(name=self.name)
+            pid = int(np.frombuffer(stale.buf, np.int64, _WORDS)[_PID_W])
+            if pid != os.getpid() and _alive(pid):
+                stale.close()
+                raise RuntimeError(f"{self.name} is published by process {pid}")
+            stale.close()
+            stale.unlink()
+            self.ring = FrameRing(layout, self.slots, name=self.name, create=True, header=_HEADER)
+
+        self.words, self.slot_headers, self.seqs = _views(self.ring)
+        self.slot_headers[:] = 0
+        self.ring.shm.buf[_JSON[0]:_JSON[0] + len(description)] = description
+        self.words[_SLOTS_W] = self.slots
+        self.words[_JSON_W] = len(description)
+        self.words[_PID_W] = os.getpid()
+        self.words[_LATEST_W] = 0
+        self.words[_CLOSED_W] = 0
+        self.words[_MAGIC_W] = _MAGIC # last: subscribers wait for it
+
+    def publish(self, images, meta=None):
+        """Copy one frameset into the next slot; `images` as from getFrames() (None entries are
+        skipped), `meta` with 'frame_number' / 'timestamp' / 'host_ts'. Returns its sequence number."""
+        if self.ring is None:
+            self._create({key: (image.shape, image.dtype) for key, image in zip(IMAGE_NAMES, images) if image is not None})
+        meta = meta or {}
+        k = self.count + 1
+        slot = k % self.slots
+        header = self.slot_headers[slot]
+        self.seqs[slot] = 2 * k - 1 # odd: being written
+        arrays = self.ring.arrays(slot)
+        for key, image in zip(IMAGE_NAMES, images):
+            if image is not None:
+                np.copyto(arrays[key], image)
+        header['frame_number'] = meta.get('frame_number', k)
+        header['timestamp'] = meta.get('timestamp', np.nan)
+        header['host_ts'] = meta.get('host_ts', time.monotonic())
+        self.seqs[slot] = 2 * k
+        self.words[_LATEST_W] = k
+        self.count = k
+        return k
+
+    def close(self):
+        """Remove the block; mapped subscribers see `closed` and keep their last views"""
+        if self.ring is not None:
+            self.words[_CLOSED_W] = 1
+            self.words, self.slot_headers, self.seqs = None, None, None
+            self.ring.close()
+            self.ring = None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedFrame:
+    """One published frameset as read-only views into the publisher's slot"""
+    __slots__ = ('seq', 'images', 'meta', '_seqs', '_slot')
+
+    def __init__(self, seq, images, meta, seqs, slot):
+        self.seq = seq
+        self.images = images
+        self.meta = meta
+        self._seqs = seqs
+        self._slot = slot
+
+    def valid(self):
+        """True while the slot still holds this frame (the views were not overwritten)"""
+        return int(self._seqs[self._slot]) == 2 * self.seq
+
+
+class FrameSubscriber:
+    """Reader side; waits up to `timeout` sec for the publisher's block to appear"""
+    def __init__(self, serial, prefix='realsense', timeout=10.0, poll=0.001):
+        self.name = shmName(serial, prefix)
+        self.poll = poll
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                probe = _attach(self.name)
+                words = np.frombuffer(probe.buf, np.int64, _WORDS).copy()
+                if words[_MAGIC_W] == _MAGIC:
+                    break
+                probe.close()
+            except FileNotFoundError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No frames published as {self.name} within {timeout} sec")
+            time.sleep(0.05)
+
+        description = json.loads(bytes(probe.buf[_JSON[0]:_JSON[0] + int(words[_JSON_W])]))
+        slots = int(words[_SLOTS_W])
+        probe.close()
+
+        layout = {key: (shape, dtype) for key, (shape, dtype) in description['layout'].items()}
+        self.info = description['info']
+        self.ring = FrameRing(layout, slots, name=self.name, header=_HEADER, track=False)
+        self.words, self.slot_headers, self.seqs = _views(self.ring)
+        for slot in range(slots):
+            for array in self.ring.arrays(slot).values():
+                array.flags.writeable = False
+        self.last = max(int(self.words[_LATEST_W]) - 1, 0) # sequence number of the last frame returned;
+                                                           # the first next() returns the newest frame
+        self.skipped = 0 # frames published (after attaching) but never returned
+
+    @property
+    def closed(self):
+        return bool(self.words[_CLOSED_W])
+
+    def _read(self, k, copy=False):
+        """Frame k if its slot still holds it, else None"""
+        slot = k % self.ring.slots
+        header = self.slot_headers[slot]
+        if int(self.seqs[slot]) != 2 * k:
+            return None
+        images = self.ring.arrays(slot)
+        if copy:
+            images = {key: array.copy() for key, array in images.items()}
+        meta = {'frame_number': int(header['frame_number']), 'timestamp': float(header['timestamp']),
+                'host_ts': float(header['host_ts'])}
+        if int(self.seqs[slot]) != 2 * k: # overwritten while the header / copy was read
+            return None
+        return SharedFrame(k, images, meta, self.seqs, slot)
+
+    def latest(self, copy=False):
+        """Newest frame if it was not returned yet, else None; never blocks"""
+        while True:
+            k = int(self.words[_LATEST_W])
+            if k <= self.last:
+                return None
+            frame = self._read(k, copy)
+            if frame is not None:
+                self.skipped += k - self.last - 1
+                self.last = k
+                return frame
+
+    def next(self, timeout=None, copy=False):
+        """The frame after the last one returned, or the oldest one still safe to read if
+        the reader fell behind; waits up to `timeout` sec (None: forever), else None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            latest = int(self.words[_LATEST_W])
+            if latest > self.last:
+                k = max(self.last + 1, latest - self.ring.slots + 2) # the oldest slot is the next one written
+                frame = self._read(k, copy)
+                if frame is not None:
+                    self.skipped += k - self.last - 1
+                    self.last = k
+                    return frame
+                continue
+            if self.closed or (deadline is not None and time.monotonic() > deadline):
+                return None
+            time.sleep(self.poll)
+
+    def close(self):
+        self.words, self.slot_headers, self.seqs = None, None, None
+        self.ring.close()
@@ -0,0 +1,360 @@
+""" - frame sources; drop-in replacements for rs.pipeline
+
+Every source has the part of the rs.pipeline interface that the capture code uses
+(`start() -> profile`, `wait_for_frames()`, `try_wait_for_frames()`, `stop()`), so it can be
+passed to getFrames(), CaptureGroup and the capture scripts:
+
+    live:<serial>          realsense device (getCamera)
+    bag:<file.bag>         librealsense recording (config.enable_device_from_file)
+    take:<dir>[:<cam_id>]  our own memory-mapped take (utils/take.py)
+    synthetic[:WxH[@fps]]  generated frames; no hardware needed
+    shm:<serial>           frames published by another process (utils/shm_stream.py)
+
+Playback and synthetic sources run as fast as they are read unless `real_time=True`,
+which makes them usable for throughput benchmarks and regression tests on CI machines.
+"""
+import time
+
+import numpy as np
+import pyrealsense2 as rs
+
+from .realsense_utils import getCamera, streamConfig, STREAM_TYPES
+from .take import TakeReader
+from .shm_stream import FrameSubscriber
+
+
+# === Live / bag (real librealsense frames) === #
+
+class LiveSource:
+    """A realsense device; `aligned=False` since depth still has to go through rs.align.
+    `streams`: the STREAMS section of config.yaml (see streamConfig), default: all four at 640x480@30;
+    `validate=False` skips checking them against the device (see utils/devices.py)"""
+    aligned = False
+    live = True
+    rs_frames = True # librealsense frames: rs.align and the FILTERS chain apply
+
+    def __init__(self, serial, streams=None, validate=True):
+        self.serial = serial
+        self.stream_settings = streamConfig(streams, serial)
+        self.streams = tuple(self.stream_settings) # enabled stream names, see getFrames()
+        self.pipeline, self.config = getCamera(serial, self.stream_settings, validate=validate)
+
+    def start(self, config=None):
+        return self.pipeline.start(config or self.config)
+
+    def wait_for_frames(self, timeout_ms=5000):
+        return self.pipeline.wait_for_frames(timeout_ms)
+
+    def try_wait_for_frames(self, timeout_ms=5000):
+        return self.pipeline.try_wait_for_frames(timeout_ms)
+
+    def stop(self):
+        self.pipeline.stop()
+
+
+class BagSource(LiveSource):
+    """Playback of a .bag file recorded by librealsense (e.g. realsense-viewer); `streams` and
+    `stream_settings` are those of the recording, known after start()"""
+    live = False
+
+    def __init__(self, filename, real_time=False, repeat=True):
+        self.filename = filename
+        self.real_time = real_time
+        self.pipeline = rs.pipeline()
+        self.config = rs.config()
+        self.config.enable_device_from_file(filename, repeat_playback=repeat)
+        self.serial = filename
+        self.stream_settings, self.streams = {}, ()
+
+    def start(self, config=None):
+        profile = self.pipeline.start(config or self.config)
+        playback = profile.get_device().as_playback()
+        playback.set_real_time(self.real_time) # False: deliver frames as fast as they are read
+        self.serial = playback.get_info(rs.camera_info.serial_number)
+        self.stream_settings = {}
+        for p in profile.get_streams():
+            for name, (stream, index) in STREAM_TYPES.items():
+                if p.stream_type() == stream and (stream != rs.stream.infrared or p.stream_index() == index):
+                    video = p.as_video_stream_profile()
+                    self.stream_settings[name] = {'width': video.width(), 'height': video.height(), 'fps': p.fps(),
+                                                  'format': str(p.format()).split('.')[-1]}
+        self.streams = tuple(self.stream_settings)
+        return profile
+
+
+# === Array based frames (take / synthetic) === #
+
+class ArrayFrame:
+    """Minimal rs.frame stand-in around a numpy array (`np.asanyarray(frame.get_data())` works)"""
+    def __init__(self, data, timestamp=0.0, frame_number=0):
+        self.data = data
+        self.timestamp = timestamp
+        self.frame_number = frame_number
+
+    def get_data(self):
+        return self.data
+
+    def get_timestamp(self):
+        return self.timestamp
+
+    def get_frame_number(self):
+        return self.frame_number
+
+    def __bool__(self):
+        return self.data is not None
+
+
+class ArrayFrameset:
+    """rs.composite_frame stand-in as used by getFrames()"""
+    def __init__(self, images, timestamp, frame_number, domain='synthetic'):
+        color, depth, leftIR, rightIR = images
+        self._frames = {name: ArrayFrame(img, timestamp, frame_number)
+                        for name, img in (('color', color), ('depth', depth), ('ir1', leftIR), ('ir2', rightIR))}
+        self.timestamp = timestamp
+        self.frame_number = frame_number
+        self.domain = domain
+
+    def get_depth_frame(self):
+        return self._frames['depth']
+
+    def get_color_frame(self):
+        return self._frames['color']
+
+    def get_infrared_frame(self, index=1):
+        return self._frames[f'ir{index}']
+
+    def get_timestamp(self):
+        return self.timestamp
+
+    def get_frame_timestamp_domain(self):
+        return self.domain
+
+    def get_frame_number(self):
+        return self.frame_number
+
+
+class _Sensor:
+    def __init__(self, depth_scale):
+        self.depth_scale = depth_scale
+        self.options = {}
+
+    def get_depth_scale(self):
+        return self.depth_scale
+
+    def supports(self, option):
+        return False
+
+    def get_option(self, option):
+        return self.options.get(option, 0.0)
+
+    def set_option(self, option, value):
+        self.options[option] = value
+
+
+class _Device:
+    def __init__(self, serial, depth_scale):
+        self.serial = serial
+        self.sensor = _Sensor(depth_scale)
+
+    def first_depth_sensor(self):
+        return self.sensor
+
+    def query_sensors(self):
+        return [self.sensor]
+
+    def get_info(self, info):
+        return self.serial
+
+
+class _Profile:
+    """rs.pipeline_profile stand-in; enough for depth_options / emitter_options"""
+    def __init__(self, serial, depth_scale):
+        self.device = _Device(serial, depth_scale)
+
+    def get_device(self):
+        return self.device
+
+
+class ArraySource:
+    """Base of the non-hardware sources; subclasses implement `_images(k)`.
+    Frames are already aligned (no rs.align), `depth_scale` is known upfront."""
+    aligned = True
+    live = False
+    rs_frames = False
+    domain = 'synthetic'
+
+    def __init__(self, serial, fps=30.0, depth_scale=0.001, real_time=False, num_frames=None, loop=True):
+        self.serial = serial
+        self.fps = fps
+        self.depth_scale = depth_scale
+        self.real_time = real_time
+        self.num_frames = num_frames
+        self.loop = loop
+        self._k = 0
+        self._t0 = None
+
+    def start(self, config=None):
+        self._k = 0
+        self._t0 = time.monotonic()
+        return _Profile(self.serial, self.depth_scale)
+
+    def _images(self, k):
+        raise NotImplementedError
+
+    def _timestamp(self, k):
+        return k * 1000.0 / self.fps
+
+    def wait_for_frames(self, timeout_ms=5000):
+        k = self._k
+        if self.num_frames is not None and k >= self.num_frames:
+            if not self.loop:
+                raise RuntimeError("End of source")
+        if self.real_time:
+            delay = self._t0 + k / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self._k += 1
+
+        i = k % self.num_frames if self.num_frames else k
+        return ArrayFrameset(self._images(i), self._timestamp(k), k, self.domain)
+
+    def try_wait_for_frames(self, timeout_ms=5000):
+        try:
+            return True, self.wait_for_frames(timeout_ms)
+        except RuntimeError:
+            return False, None
+
+    def stop(self):
+        pass
+
+
+class TakeSource(ArraySource):
+    """Replay of one camera of a recorded take; frames are views into the memory-mapped files"""
+    domain = 'take'
+
+    def __init__(self, directory, cam_id=None, real_time=False, loop=True):
+        self.take = TakeReader(directory)
+        self.cam_id = cam_id or self.take.cameras[0]
+        cam_meta = self.take.meta['cameras'][self.cam_id]
+
+        super().__init__(serial=cam_meta.get('serial', self.cam_id), fps=self.take.fps(self.cam_id),
+                         depth_scale=cam_meta.get('depth_scale', 0.001), real_time=real_time,
+                         num_frames=cam_meta['count'], loop=loop)
+        self.aligned = cam_meta.get('aligned', True)        # recorded with --align none: align in software
+        self.calibration = cam_meta.get('calibration')      # utils.align.getCalibration() of the device
+        self._streams = {name: self.take.stream(self.cam_id, name) for name in self.take.streams(self.cam_id)}
+        self._index = self.take.index(self.cam_id)
+
+    def _images(self, k):
+        get = lambda name: self._streams[name][k] if name in self._streams else None
+        return get('rgb'), get('depth'), get('IR'), get('IR_right')
+
+    def _timestamp(self, k):
+        if self.num_frames:
+            n, i = divmod(k, self.num_frames)
+            ts = self._index['timestamp']
+            if not np.isnan(ts[i]):
+                return ts[i] + n * (ts[-1] - ts[0] + 1000.0 / self.fps) # keep increasing when looping
+        return super()._timestamp(k)
+
+
+class ShmSource(ArraySource):
+    """Subscriber of the frames another process publishes (e.g. multi-realsense.py --publish).
+    Every frame is copied out of the publisher's shared memory: its slot is reused after
+    `slots - 1` frames, sooner than a capture queue or a synchronizer window lets go of it."""
+    domain = 'shm'
+
+    def __init__(self, serial, timeout=10.0):
+        self.subscriber = FrameSubscriber(serial, timeout=timeout)
+        info = self.subscriber.info
+        super().__init__(serial=info.get('serial', serial), depth_scale=info.get('depth_scale', 0.001))
+        self.aligned = info.get('aligned', True)
+        self.calibration = info.get('calibration')
+
+    def wait_for_frames(self, timeout_ms=5000):
+        if self.subscriber.closed: # the publisher stopped; wait for it to come back
+            self.subscriber.close()
+            self.subscriber = FrameSubscriber(self.serial, timeout=timeout_ms / 1000)
+        frame = self.subscriber.next(timeout=timeout_ms / 1000, copy=True) # checked against the slot's sequence after the copy
+        if frame is None:
+            raise RuntimeError(f"Frame didn't arrive within {timeout_ms}")
+        images = tuple(frame.images.get(name) for name in ('color', 'depth', 'leftIR', 'rightIR'))
+        return ArrayFrameset(images, frame.meta['timestamp'], frame.meta['frame_number'], self.domain)
+
+    def stop(self):
+        self.subscriber.close()
+
+
+class SyntheticSource(ArraySource):
+    """Moving gradient / sphere pattern; a few distinct frames are generated upfront
+    and cycled, so reading a frame costs (almost) nothing."""
+
+    def __init__(self, width=640, height=480, fps=30.0, serial='synthetic', real_time=False, num_distinct=8, seed=0):
+        super().__init__(serial=serial, fps=fps, real_time=real_time, num_frames=num_distinct, loop=True)
+        rng = np.random.default_rng(seed)
+        y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+        self._frames = []
+
+        for i in range(num_distinct):
+            cx = width * (0.3 + 0.4 * i / max(num_distinct - 1, 1))
+            r2 = ((x - cx) ** 2 + (y - height / 2) ** 2) / (0.25 * height) ** 2
+            depth = np.where(r2 < 1, 800 + 300 * r2, 2500 + 2 * y)                          # mm; sphere in front of a slanted wall
+            depth = (depth + rng.normal(0, 4, depth.shape)).clip(0, 65535).astype(np.uint16)
+            depth[rng.random(depth.shape) < 0.01] = 0                                     # holes
+
+            color = np.empty((height, width, 3), dtype=np.uint8)
+            color[..., 0] = (x * 255 / width).astype(np.uint8)
+            color[..., 1] = (y * 255 / height).astype(np.uint8)
+            color[..., 2] = np.where(r2 < 1, 255, 40).astype(np.uint8)
+
+            ir = (255 - depth // 12).clip(0, 255).astype(np.uint8)
+            frames = (color, depth, ir, ir.copy())
+            for img in frames:
+                img.flags.writeable = False # shared by every cycle; getFrames() must not clip in place
+            self._frames.append(frames)
+
+    def _images(self, k):
+        return self._frames[k]
+
+
+# === Factory === #
+
+def openSource(spec: str, real_time=False, serial=None, streams=None, validate=True):
+    """'live:<serial>' | 'bag:<file>' | 'take:<dir>[:<cam_id>]' | 'synthetic[:WxH[@fps]]' | 'shm:<serial>'
+    `serial` names a synthetic source (default: the spec itself), `streams` (the STREAMS section
+    of config.yaml) selects the streams of a live one and `validate` checks them against the device"""
+    kind, _, arg = spec.partition(':')
+
+    if kind == 'live':
+        return LiveSource(arg, streams, validate=validate)
+    elif kind == 'bag':
+        return BagSource(arg, real_time=real_time)
+    elif kind == 'take':
+        directory, _, cam_id = arg.partition(':')
+        return TakeSource(directory, cam_id or None, real_time=real_time)
+    elif kind == 'synthetic':
+        width, height, fps = 640, 480, 30.0
+        if arg:
+            size, _, rate = arg.partition('@')
+            width, height = map(int, size.split('x'))
+            fps = float(rate) if rate else fps
+        return SyntheticSource(width, height, fps, serial=serial or spec, real_time=real_time)
+    elif kind == 'shm':
+        return ShmSource(arg)
+
+    raise ValueError(f"Unknown source '{spec}'; use live:<serial>, bag:<file>, take:<dir>[:<cam_id>], synthetic[:WxH[@fps]] or shm:<serial>")
+
+
+def enableSource(config, spec: str):
+    """Point an rs.config at 'live[:<serial>]' or 'bag:<file>'; for code that needs real
+    librealsense frames (processing blocks, rs.pointcloud), e.g. the point-cloud viewer"""
+    kind, _, arg = spec.partition(':')
+
+    if kind == 'live':
+        if arg:
+            config.enable_device(arg)
+    elif kind == 'bag':
+        config.enable_device_from_file(arg, repeat_playback=True)
+    else:
+        raise ValueError(f"Source '{spec}' does not produce librealsense frames; use live[:<serial>] or bag:<file>")
+    return config
@@ -0,0 +1,144 @@
+""" - multi-camera frame matching by timestamp
+
+Framesets of every camera are buffered in a short window; a matched set is emitted
+when the oldest frameset of each camera lies within `tolerance_ms` of each other.
+Framesets that can no longer be matched are dropped and counted.
+
+(ref) https://dev.intelrealsense.com/docs/multiple-depth-cameras-configuration
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+
+def packet_timestamp(packet):
+    """Device/global timestamp (ms) of a FramePacket, see getFrames(..., meta=)"""
+    return packet.meta['timestamp']
+
+
+def host_timestamp(packet):
+    """Host arrival time (ms) of a FramePacket; for sources without usable timestamps"""
+    return packet.host_ts * 1000.0
+
+
+class FrameSynchronizer:
+    """Pair framesets across cameras by timestamp.
+
+    >>> sync = FrameSynchronizer(['c1', 'c2'], tolerance_ms=5)
+    >>> sync.push('c1', packet_1); sync.push('c2', packet_2)
+    >>> matched = sync.pop()  # {'c1': packet, 'c2': packet} or None
+
+    `timestamp(item)` returns the time (ms) of a pushed item, so synthetic streams
+    can be tested with e.g. `timestamp=lambda t: t`.
+    """
+    def __init__(self, keys, tolerance_ms=10.0, window=8, timestamp=packet_timestamp, history=1000):
+        self.keys = list(keys)
+        self.tolerance_ms = tolerance_ms
+        self.window = window
+        self.timestamp = timestamp
+
+        self._buffers = {key: deque() for key in self.keys}
+        self._newest = {key: None for key in self.keys} # timestamp of the last accepted item, buffered or not
+        self._matched = deque()
+
+        self.num_matched = 0
+        self.dropped = {key: 0 for key in self.keys}
+        self._skews = deque(maxlen=history) # max-min timestamp of recent matched sets (ms)
+
+    def push(self, key, item):
+        """Buffer an item; one that is not newer than the last accepted item of its camera
+        (repeated or out of order, also after that one was matched or dropped) is dropped"""
+        buffer = self._buffers[key]
+        timestamp = self.timestamp(item)
+        if self._newest[key] is not None and timestamp <= self._newest[key]:
+            self.dropped[key] += 1
+            return
+        self._newest[key] = timestamp
+        if len(buffer) == self.window:
+            buffer.popleft()
+            self.dropped[key] += 1
+        buffer.append(item)
+        self._match()
+
+    def _match(self):
+        buffers = list(self._buffers.values())
+        while all(buffers):
+            heads = [self.timestamp(buffer[0]) for buffer in buffers]
+            newest = max(heads)
+
+            if newest - min(heads) <= self.tolerance_ms:
+                self._matched.append({key: buffer.popleft() for key, buffer in self._buffers.items()})
+                self._skews.append(newest - min(heads))
+                self.num_matched += 1
+                continue
+
+            # heads too old to ever match the newest one
+            for key, buffer in self._buffers.items():
+                if self.timestamp(buffer[0]) < newest - self.tolerance_ms:
+                    buffer.popleft()
+                    self.dropped[key] += 1
+
+    def pop(self):
+        """Oldest matched set not yet read, or None"""
+        return self._matched.popleft() if self._matched else None
+
+    def pop_latest(self):
+        """Newest matched set (older unread ones are discarded), or None"""
+        if not self._matched:
+            return None
+        matched = self._matched.pop()
+        self._matched.clear()
+        return matched
+
+    def stats(self):
+        skews = np.asarray(self._skews, dtype=np.float64)
+        return {
+            'matched': self.num_matched,
+            'dropped': dict(self.dropped),
+            'buffered': {key: len(buffer) for key, buffer in self._buffers.items()},
+            'skew_ms_mean': float(skews.mean()) if skews.size else None,
+            'skew_ms_p99': float(np.percentile(skews, 99)) if skews.size else None,
+            'skew_ms_max': float(skews.max()) if skews.size else None,
+        }
+
+
+class SyncedCapture:
+    """Timestamp-matched framesets on top of a CaptureGroup (same `latest()` interface).
+
+    The CaptureGroup should be created with `maxsize >= window` so no frameset is
+    thrown away before the synchronizer sees it.
+    """
+    def __init__(self, group, tolerance_ms=10.0, window=8, timestamp=packet_timestamp):
+        self.group = group
+        self.workers = group.workers
+        self.sync = FrameSynchronizer([worker.serial for worker in group.workers],
+                                      tolerance_ms=tolerance_ms, window=window, timestamp=timestamp)
+
+    def __len__(self):
+        return len(self.group)
+
+    def start(self):
+        self.group.start()
+        return self
+
+    def latest(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            for worker in self.workers:
+                for packet in worker.drain():
+                    self.sync.push(worker.serial, packet)
+
+            matched = self.sync.pop_latest()
+            if matched is not None:
+                return [matched[worker.serial] for worker in self.workers]
+
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No matched framesets within {timeout} sec: {self.sync.stats()}")
+            time.sleep(0.001)
+
+    def stats(self):
+        return self.sync.stats()
+
+    def stop(self, join_timeout=1.0):
+        self.group.stop(join_timeout)
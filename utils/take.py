@@ -0,0 +1,197 @@
+""" - memory-mapped take format with O(1) random frame access
+
+A take is one recording (scene) of all cameras, keyed like the video files by
+config.yaml SPEC (cls_name, ID) and the scene counter s_num:
+
+    data/<cls_name>/<ID>/take_<cls_name>_<ID>_s0001/
+        meta.json          spec, fps, capacity, per camera: streams, frame count, ...
+        c1_index.npy       (capacity,) timestamp / host_ts / frame_number per frame
+        c1_rgb.npy         (capacity, H, W, 3) uint8
+        c1_depth.npy       (capacity, H, W)    uint16
+        c1_IR.npy          (capacity, H, W)    uint8
+        c2_...
+
+Every camera has its own capacity and fps (meta.json 'cameras'; the take's 'capacity' / 'fps' are
+the defaults). The depth is the metric z16 as measured ('depth_clip': null, also when there is no
+entry); a camera recorded with clipped depth has 'depth_clip': {'grey_color': ..} (its background and holes).
+
+Every stream is a preallocated .npy file (np.lib.format.open_memmap), so frame k starts at
+`data_offset + k * frame_nbytes` (both stored in meta.json) and a reader gets it as a
+zero-copy view with `np.load(.., mmap_mode='r')[k]`.
+"""
+import os
+import os.path as osp
+import json
+
+import numpy as np
+
+
+META_FILE = 'meta.json'
+
+INDEX_DTYPE = np.dtype([('timestamp', np.float64),    # device/global timestamp (ms), see getFrames(meta=)
+                        ('host_ts', np.float64),      # time.monotonic() at arrival (sec)
+                        ('frame_number', np.int64)])
+
+
+def takePath(spec, s_num, root='data') -> str:
+    take_name = f"take_{spec.cls_name}_{spec.ID}_s{s_num:04}"
+    return osp.join(root, spec.cls_name, spec.ID, take_name)
+
+
+def _data_offset(array) -> int:
+    return array.offset if isinstance(array, np.memmap) else 0
+
+
+class TakeWriter:
+    """Preallocated, memory-mapped writer for one take.
+
+    >>> take = TakeWriter(takePath(spec, s_num), spec, s_num, capacity=30 * 60)
+    >>> take.add_camera('c1', {'rgb': ((480, 640, 3), 'uint8'), 'depth': ((480, 640), 'uint16')}, serial=serial)
+    >>> take.append('c1', {'rgb': color_img, 'depth': depth_img}, meta)
+    >>> take.close()
+    """
+    def __init__(self, directory, spec, s_num, capacity, fps=30.0):
+        if osp.exists(osp.join(directory, META_FILE)):
+            raise FileExistsError(f"Take already exists: {directory}")
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.capacity = capacity
+        self.meta = {'spec': {'cls_name': spec.cls_name, 'ID': spec.ID, 's_num': s_num},
+                     'fps': fps, 'capacity': capacity, 'cameras': {}}
+        self.streams = {} # {cam_id: {stream: memmap}}
+        self.index = {}   # {cam_id: memmap}
+        self.count = {}   # {cam_id: frames written}
+        self.dropped = {} # {cam_id: frames that did not fit}
+
+    def add_camera(self, cam_id, streams, capacity=None, fps=None, depth_clip=None, **info):
+        """streams: {name: (shape, dtype)} of a single frame; `capacity` (frames) and `fps` of this
+        camera, default: the take's; `depth_clip`: {'grey_color': z16 value, ...} if the depth is
+        clipped, default None: metric; info: extra json data (serial, intrinsics, ...)"""
+        if depth_clip is not None and 'grey_color' not in depth_clip:
+            raise ValueError(f"depth_clip of {cam_id} needs the 'grey_color' of the clipped background")
+        capacity = self.capacity if capacity is None else capacity
+        cam_meta = dict(info, streams={}, count=0, capacity=capacity, fps=self.meta['fps'] if fps is None else fps,
+                        depth_clip=depth_clip)
+        self.streams[cam_id] = {}
+
+        for name, (shape, dtype) in streams.items():
+            filename = osp.join(self.directory, f"{cam_id}_{name}.npy")
+            array = np.lib.format.open_memmap(filename, mode='w+', dtype=np.dtype(dtype),
+                                              shape=(capacity, *shape))
+            self.streams[cam_id][name] = array
+            cam_meta['streams'][name] = {'shape': list(shape), 'dtype': np.dtype(dtype).str,
+                                         'data_offset': _data_offset(array),
+                                         'frame_nbytes': int(np.prod(shape)) * np.dtype(dtype).itemsize}
+
+        self.index[cam_id] = np.lib.format.open_memmap(osp.join(self.directory, f"{cam_id}_index.npy"),
+                                                       mode='w+', dtype=INDEX_DTYPE, shape=(capacity,))
+        self.count[cam_id] = 0
+        self.dropped[cam_id] = 0
+        self.meta['cameras'][cam_id] = cam_meta
+        self._write_meta()
+
+    def append(self, cam_id, images, meta=None):
+        """Copy one frame of every stream into the take; False if the take is full"""
+        k = self.count[cam_id]
+        if k >= len(self.index[cam_id]):
+            self.dropped[cam_id] += 1
+            return False
+
+        for name, array in self.streams[cam_id].items():
+            array[k] = images[name]
+
+        meta = meta or {}
+        self.index[cam_id][k] = (meta.get('timestamp', np.nan), meta.get('host_ts', np.nan), meta.get('frame_number', -1))
+        self.count[cam_id] = k + 1
+        return True
+
+    def sink(self, cam_id):
+        """write((images, meta)) adapter, e.g. for WriterPool"""
+        return _TakeSink(self, cam_id)
+
+    def close(self):
+        for cam_id in self.streams:
+            for array in self.streams[cam_id].values():
+                array.flush()
+            self.index[cam_id].flush()
+            self.meta['cameras'][cam_id]['count'] = self.count[cam_id]
+            self.meta['cameras'][cam_id]['dropped'] = self.dropped[cam_id]
+        self._write_meta()
+        self.streams, self.index = {}, {}
+        return dict(self.count)
+
+    def _write_meta(self):
+        with open(osp.join(self.directory, META_FILE), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+
+class _TakeSink:
+    def __init__(self, take, cam_id):
+        self.take = take
+        self.cam_id = cam_id
+
+    def write(self, item):
+        images, meta = item
+        self.take.append(self.cam_id, images, meta)
+
+    def release(self):
+        pass
+
+
+class TakeReader:
+    """Random access to a recorded take; frames are zero-copy views into the memory-mapped files.
+
+    >>> take = TakeReader(takePath(spec, 1))
+    >>> depth = take.frame('c1', 'depth', 42)
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(osp.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+
+        self.cameras = list(self.meta['cameras'])
+        self._streams = {}
+        self._index = {}
+        for cam_id, cam_meta in self.meta['cameras'].items():
+            count = cam_meta['count']
+            self._streams[cam_id] = {name: np.load(osp.join(directory, f"{cam_id}_{name}.npy"), mmap_mode='r')[:count]
+                                     for name in cam_meta['streams']}
+            self._index[cam_id] = np.load(osp.join(directory, f"{cam_id}_index.npy"), mmap_mode='r')[:count]
+
+    @property
+    def spec(self):
+        return self.meta['spec']
+
+    def __len__(self):
+        return min(cam_meta['count'] for cam_meta in self.meta['cameras'].values())
+
+    def streams(self, cam_id):
+        return list(self._streams[cam_id])
+
+    def frame(self, cam_id, stream, k):
+        return self._streams[cam_id][stream][k]
+
+    def stream(self, cam_id, stream):
+        """(count, ...) view of a whole stream"""
+        return self._streams[cam_id][stream]
+
+    def index(self, cam_id):
+        return self._index[cam_id]
+
+    def fps(self, cam_id):
+        return self.meta['cameras'][cam_id].get('fps', self.meta['fps'])
+
+    def clipValue(self, cam_id):
+        """z16 value of the clipped background (and holes) in the depth of `cam_id`, None if the
+        take holds metric depth"""
+        clip = self.meta['cameras'][cam_id].get('depth_clip')
+        return None if clip is None else clip['grey_color']
+
+    def nearest(self, cam_id, timestamp):
+        """Frame index of camera `cam_id` closest to `timestamp` (ms)"""
+        ts = self._index[cam_id]['timestamp']
+        k = int(np.searchsorted(ts, timestamp))
+        if k == len(ts) or (k > 0 and timestamp - ts[k - 1] < ts[k] - timestamp):
+            k -= 1
+        return k